@@ -1,14 +1,19 @@
 #!/usr/bin/env python2
+import atexit
 import getpass
 import pkg_resources
 import click
 import os
-import requests
+import sys
+import time
 import colorama
-import packaging.version
 
 from masonlib.platform import Platform
 from masonlib.imason import IMason
+from masonlib.internal.builds import DEFAULT_WAIT_TIMEOUT
+from masonlib.internal.session import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, DEFAULT_READ_TIMEOUT, \
+    DEFAULT_RETRIES
+from masonlib.internal.update import UpdateCheck
 
 
 class Config(object):
@@ -20,6 +25,13 @@ class Config(object):
     def __init__(self):
         self.verbose = False
         self.no_colorize = False
+        self.pool_connections = DEFAULT_POOL_CONNECTIONS
+        self.pool_maxsize = DEFAULT_POOL_MAXSIZE
+        self.timeout = DEFAULT_READ_TIMEOUT
+        self.retries = DEFAULT_RETRIES
+        self.deadline = None
+        self.max_bandwidth = None
+        self.metrics_out = None
 
 pass_config = click.make_pass_decorator(Config, ensure=True)
 
@@ -30,28 +42,56 @@ pass_config = click.make_pass_decorator(Config, ensure=True)
 @click.option('--access-token', help='optional access token if already available')
 @click.option('--id-token', help='optional id token if already available')
 @click.option('--no-color', is_flag=True, help='turn off colorized output')
+@click.option('--pool-connections', type=int, default=DEFAULT_POOL_CONNECTIONS,
+              help='number of per-host connection pools kept alive')
+@click.option('--pool-maxsize', type=int, default=DEFAULT_POOL_MAXSIZE,
+              help='maximum number of connections kept alive per host')
+@click.option('--timeout', type=float, default=DEFAULT_READ_TIMEOUT,
+              help='seconds to wait on the server before a request times out')
+@click.option('--retries', type=int, default=DEFAULT_RETRIES, help='number of times a failed request is retried')
+@click.option('--deadline', type=float, default=None, help='overall number of seconds the command may take')
+@click.option('--max-bandwidth', type=float, default=None,
+              help='maximum upload bandwidth in MB/s, shared by all concurrent uploads')
+@click.option('--metrics-out', type=click.Path(dir_okay=False), default=None,
+              help='write per-phase timings to this file, as JSON lines or in the Prometheus textfile format (.prom)')
 @pass_config
-def cli(config, debug, verbose, id_token, access_token, no_color):
+def cli(config, debug, verbose, id_token, access_token, no_color, pool_connections, pool_maxsize, timeout, retries,
+        deadline, max_bandwidth, metrics_out):
     """mason-cli provides command line interfaces that allow you to register, query, build, and deploy
 your configurations and packages to your devices in the field."""
     _check_version()
     config.debug = debug
     config.verbose = verbose
     config.no_colorize = no_color
+    config.pool_connections = pool_connections
+    config.pool_maxsize = pool_maxsize
+    config.timeout = timeout
+    config.retries = retries
+    config.deadline = deadline
+    config.max_bandwidth = max_bandwidth
+    config.metrics_out = metrics_out
     if not no_color:
         colorama.init(autoreset=True)
     platform = Platform(config)
     config.mason = platform.get(IMason)
     config.mason.set_id_token(id_token)
     config.mason.set_access_token(access_token)
+    if metrics_out:
+        # Written on exit so the metrics cover every command, including the ones exiting with an error code
+        atexit.register(config.mason.metrics.write, metrics_out)
 
 
 @cli.group()
 @click.option('--skip-verify', '-s', is_flag=True, help='skip verification of artifact details')
+@click.option('--jobs', '-j', type=int, default=1, help='number of artifacts to process concurrently')
+@click.option('--resume', is_flag=True, default=False,
+              help='continue an interrupted register, skipping the artifacts it already registered')
 @pass_config
-def register(config, skip_verify):
+def register(config, skip_verify, jobs, resume):
     """Register artifacts to the mason platform."""
     config.skip_verify = skip_verify
+    config.jobs = jobs
+    config.resume = resume
 
 
 @register.command()
@@ -67,7 +107,17 @@ def apk(config, apks):
 
        multiple in a directory:\n
          mason register apk apks/*.apk
+
+       multiple in a directory, four at a time:\n
+         mason register --jobs 4 apk apks/*.apk
+
+       continue where an interrupted register stopped:\n
+         mason register --resume apk apks/*.apk
     """
+    if config.jobs > 1 or config.resume:
+        if not config.mason.register_batch('apk', apks, config.jobs, config.resume):
+            exit('Unable to register all artifacts')
+        return
     for app in apks:
         if config.verbose:
             click.echo('Registering {}...'.format(app))
@@ -88,7 +138,14 @@ def config(config, yamls):
 
        multiple in a directory:\n
          mason register config configs/*.yml
+
+       multiple in a directory, four at a time:\n
+         mason register --jobs 4 config configs/*.yml
     """
+    if config.jobs > 1 or config.resume:
+        if not config.mason.register_batch('config', yamls, config.jobs, config.resume):
+            exit('Unable to register all artifacts')
+        return
     for yaml in yamls:
         if config.verbose:
             click.echo('Registering {}...'.format(yaml))
@@ -121,10 +178,13 @@ def media(config, binary, name, type, version):
 
 
 @cli.command()
+@click.option('--wait', '-w', is_flag=True, default=False, help='wait for the build to complete')
+@click.option('--wait-timeout', type=int, default=DEFAULT_WAIT_TIMEOUT,
+              help='maximum number of seconds to wait for the build')
 @click.argument('project')
 @click.argument('version')
 @pass_config
-def build(config, project, version):
+def build(config, wait, wait_timeout, project, version):
     """Build a registered project.
 
          PROJECT - The name of the configuration project\n
@@ -141,9 +201,14 @@ def build(config, project, version):
 
        becomes a build command:\n
          mason build mason-test 5
+
+       to wait for the build to complete, exiting with 0 on success, 2 on build failure and 3 on timeout:\n
+         mason build --wait mason-test 5
     """
     if config.verbose:
         click.echo('Starting build for {}:{}...'.format(project, version))
+    if wait:
+        exit(config.mason.build_and_wait([(project, version)], wait_timeout))
     if not config.mason.build(project, version):
         exit('Unable to start build')
 
@@ -151,11 +216,16 @@ def build(config, project, version):
 @cli.group()
 @click.option('--skip-verify', '-s', is_flag=True, help='skip verification of deployment')
 @click.option('--push', '-p', is_flag=True, default=False, help='push the deployment to devices in the field')
+@click.option('--jobs', '-j', type=int, default=1, help='number of groups to deploy to concurrently')
+@click.option('--resume', is_flag=True, default=False,
+              help='continue an interrupted deploy, skipping the groups it already deployed to')
 @pass_config
-def deploy(config, skip_verify, push):
+def deploy(config, skip_verify, push, jobs, resume):
     """Deploy artifacts to groups."""
     config.skip_verify = skip_verify
     config.push = push
+    config.jobs = jobs
+    config.resume = resume
 
 
 @deploy.command()
@@ -180,13 +250,12 @@ def apk(config, name, version, groups):
        or to deploy to multiple groups:\n
          mason deploy apk com.test.app 3 development staging production
 
+       or to deploy to multiple groups, four at a time:\n
+         mason deploy --jobs 4 apk com.test.app 3 development staging production
+
        this can be used in conjunction with the --push argument
     """
-    for group in groups:
-        if config.verbose:
-            click.echo('Deploying {}:{}...'.format(name, version))
-        if not config.mason.deploy("apk", name, version, group, config.push):
-            exit('Unable to deploy item')
+    _deploy_groups(config, 'apk', name, version, groups)
 
 
 @deploy.command()
@@ -213,11 +282,7 @@ def ota(config, name, version, groups):
 
        this can be used in conjunction with the --push argument
     """
-    for group in groups:
-        if config.verbose:
-            click.echo('Deploying {}:{}...'.format(name, version))
-        if not config.mason.deploy("ota", name, version, group, config.push):
-            exit('Unable to deploy item')
+    _deploy_groups(config, 'ota', name, version, groups)
 
 
 @deploy.command()
@@ -245,10 +310,20 @@ def config(config, name, version, groups):
 
        this can be used in conjunction with the --push argument
     """
+    _deploy_groups(config, 'config', name, version, groups)
+
+
+def _deploy_groups(config, item_type, name, version, groups):
+    if len(groups) > 1 or config.resume:
+        if config.verbose:
+            click.echo('Deploying {}:{} to {} groups...'.format(name, version, len(groups)))
+        if not config.mason.deploy_batch(item_type, name, version, groups, config.push, config.jobs, config.resume):
+            exit('Unable to deploy item to all groups')
+        return
     for group in groups:
         if config.verbose:
             click.echo('Deploying {}:{}...'.format(name, version))
-        if not config.mason.deploy("config", name, version, group, config.push):
+        if not config.mason.deploy(item_type, name, version, group, config.push):
             exit('Unable to deploy item')
 
 
@@ -270,6 +345,41 @@ def stage(config, skip_verify, yaml):
         config.mason.stage(yaml)
 
 
+@cli.command()
+@click.option('--skip-verify', '-s', is_flag=True, help='skip verification of the plan')
+@click.option('--jobs', '-j', type=int, default=4, help='number of plan steps to run concurrently')
+@click.argument('plan')
+@pass_config
+def apply(config, skip_verify, jobs, plan):
+    """Apply a release plan.
+
+         PLAN - The yaml file describing the artifacts to register, the projects to build and the items to deploy.
+
+       As an example, a plan:\n
+         artifacts:\n
+           - type: apk\n
+             path: apks/app.apk\n
+           - type: config\n
+             path: mason-test.yml\n
+         builds:\n
+           - project: mason-test\n
+             version: 5\n
+         deploys:\n
+           - type: config\n
+             name: mason-test\n
+             version: 5\n
+             groups: [development, staging]
+
+       registers the apk and the configuration, builds the configuration once it is registered and deploys it
+       to both groups once it is built. Independent steps run concurrently.
+    """
+    config.skip_verify = skip_verify
+    if config.verbose:
+        click.echo('Applying {}...'.format(plan))
+    if not config.mason.apply(plan, jobs):
+        exit('Unable to apply plan')
+
+
 @cli.command()
 @click.option('--user', default=None, help='pass in user')
 @click.option('--password', default=None, help='pass in password')
@@ -323,25 +433,34 @@ def version():
 
 
 def _check_version():
-    r = requests.get('https://raw.githubusercontent.com/MasonAmerica/mason-cli/master/VERSION')
-    current_version = packaging.version.parse(pkg_resources.require("mason-cli")[0].version)
-    if r.status_code == 200:
-        if r.text:
-            remote_version = packaging.version.parse(r.text)
-            if remote_version > current_version:
-                if isMasonDocker():
-                    upgrade_command = 'docker pull masonamerica/mason-cli:latest'
-                else:
-                    upgrade_command = 'pip install --upgrade git+https://git@github.com/MasonAmerica/mason-cli.git'
-                print '\n==================== NOTICE ====================\n' \
-                      'A newer version \'{}\' of the mason-cli is available.\n' \
-                      'Run:\n' \
-                      '    `{}`\n' \
-                      'to upgrade to the latest version.\n' \
-                      '\n' \
-                      'Release notes: https://github.com/MasonAmerica/mason-cli/releases' \
-                      '\n' \
-                      '==================== NOTICE ====================\n'.format(remote_version, upgrade_command)
+    if UpdateCheck.is_disabled(sys.stdout):
+        return
+    try:
+        current_version = pkg_resources.require("mason-cli")[0].version
+    except pkg_resources.DistributionNotFound:
+        return
+    update_check = UpdateCheck(current_version, os.path.join(os.path.expanduser('~'), '.mason_version_check'))
+    update_check.start()
+    # Only report the outcome once the command is done, so the check never delays any actual work
+    atexit.register(_print_update_notice, update_check, time.time() + update_check.timeout)
+
+
+def _print_update_notice(update_check, deadline):
+    remote_version = update_check.newer_version(max(0, deadline - time.time()))
+    if remote_version:
+        if isMasonDocker():
+            upgrade_command = 'docker pull masonamerica/mason-cli:latest'
+        else:
+            upgrade_command = 'pip install --upgrade git+https://git@github.com/MasonAmerica/mason-cli.git'
+        print '\n==================== NOTICE ====================\n' \
+              'A newer version \'{}\' of the mason-cli is available.\n' \
+              'Run:\n' \
+              '    `{}`\n' \
+              'to upgrade to the latest version.\n' \
+              '\n' \
+              'Release notes: https://github.com/MasonAmerica/mason-cli/releases' \
+              '\n' \
+              '==================== NOTICE ====================\n'.format(remote_version, upgrade_command)
 
 def isMasonDocker():
     return bool(os.environ.get('MASON_CLI_DOCKER', False))
@@ -18,9 +18,9 @@
 
 import StringIO
 import os
+from collections import OrderedDict
 import re
-from struct import pack, unpack
-from subprocess import Popen, PIPE
+from struct import pack, unpack, unpack_from
 from xml.dom import minidom
 from xml.sax.saxutils import escape
 from zlib import crc32
@@ -28,9 +28,11 @@ from zlib import crc32
 import androconf
 import bytecode
 from dvm_permissions import DVM_PERMISSIONS
-from util import read, get_md5
+from pkcs7 import load_pkcs7, PKCS7Error
+from util import read, get_md5, get_file_md5
 
 NS_ANDROID_URI = 'http://schemas.android.com/apk/res/android'
+APK_SIG_BLOCK_MAGIC = 'APK Sig Block 42'
 
 # 0: chilkat
 # 1: default python zipfile module
@@ -161,6 +163,7 @@ class APK(object):
         self.xml = {}
         self.axml = {}
         self.arsc = {}
+        self.manifest = None
 
         self.package = ""
         self.androidversion = {}
@@ -168,8 +171,9 @@ class APK(object):
         self.valid_apk = False
 
         self.cert_text = ""
+        self.cert_error = None
         self.cert_md5 = ""
-        self.file_md5 = ""
+        self.__file_md5 = None
         self.file_size = ""
 
         self.files = {}
@@ -177,73 +181,127 @@ class APK(object):
 
         self.magic_file = magic_file
 
+        # A path opened for reading is read through the zip file, which only loads the central directory and the
+        # entries asked for. Other modes work on an in memory copy, the file itself is never written to.
+        self.mode = mode
         if raw:
             self.__raw = filename
-        else:
+        elif mode != "r":
             self.__raw = read(filename)
+        else:
+            self.__raw = None
+        self.file_size = len(self.__raw) if self.__raw is not None else os.path.getsize(filename)
 
         self.zipmodule = zipmodule
-        self.file_size = len(self.__raw)
-        self.file_md5 = get_md5(self.__raw)
-
-        if zipmodule == 0:
-            self.zip = ChilkatZip(self.__raw)
-        else:
-            self.zip = zipfile.ZipFile(StringIO.StringIO(self.__raw), mode=mode)
+        self.__zip = None
 
         for i in self.zip.namelist():
             if i == "AndroidManifest.xml":
-                self.axml[i] = AXMLPrinter(self.zip.read(i))
                 try:
-                    self.xml[i] = minidom.parseString(self.axml[i].get_buff())
-                except:
-                    self.xml[i] = None
+                    self.manifest = AndroidManifest(self.zip.read(i))
+                except Exception:
+                    self.manifest = None
 
-                if self.xml[i] != None:
-                    self.package = self.xml[i].documentElement.getAttribute("package")
-                    self.androidversion["Code"] = self.xml[i].documentElement.getAttributeNS(NS_ANDROID_URI,
-                                                                                             "versionCode")
-                    self.androidversion["Name"] = self.xml[i].documentElement.getAttributeNS(NS_ANDROID_URI,
-                                                                                             "versionName")
-
-                    for item in self.xml[i].getElementsByTagName('uses-permission'):
-                        self.permissions.append(str(item.getAttributeNS(NS_ANDROID_URI, "name")))
+                if self.manifest != None and self.manifest.is_valid():
+                    self.package = self.manifest.get_package()
+                    self.androidversion["Code"] = self.manifest.get_version_code()
+                    self.androidversion["Name"] = self.manifest.get_version_name()
+                    self.permissions = [str(permission) for permission in self.manifest.get_permissions()]
 
                     self.valid_apk = True
+                else:
+                    self.manifest = None
 
         self.parse_cert()
-        self.get_files_types()
+        self.close()
+
+    @property
+    def zip(self):
+        """
+            Return the zip file of the APK, opened again if it was closed
+
+            :rtype: zipfile.ZipFile
+        """
+        if self.__zip is None:
+            if self.zipmodule == 0:
+                self.__zip = ChilkatZip(self.get_raw())
+            elif self.__raw is not None:
+                self.__zip = zipfile.ZipFile(StringIO.StringIO(self.__raw), mode=self.mode)
+            else:
+                self.__zip = zipfile.ZipFile(self.filename, mode=self.mode)
+        return self.__zip
+
+    def close(self):
+        """
+            Release the file handle of an APK opened from a path, the zip is opened again when needed
+        """
+        if self.__zip is not None and self.__raw is None and self.zipmodule != 0:
+            self.__zip.close()
+            self.__zip = None
+
+    @property
+    def file_md5(self):
+        """
+            Return the md5 of the APK, computed on first use
+
+            :rtype: string
+        """
+        if self.__file_md5 is None:
+            if self.__raw is not None:
+                self.__file_md5 = get_md5(self.__raw)
+            else:
+                self.__file_md5 = get_file_md5(self.filename)
+        return self.__file_md5
 
     def parse_cert(self):
         """
-            parse the cert text
-        :param cert_fname:
+            parse the certificates of the v1 (jar) signature, cert_text describes them
         """
-        p = Popen(['openssl', 'pkcs7', '-inform', 'DER', '-noout', '-print_certs', '-text'], stdout=PIPE, stdin=PIPE,
-                  stderr=PIPE)
+        self.certificates = []
+        self.cert_text = []
+        self.cert_error = None
 
-        cert_like = filter(lambda f: re.match("META-INF/.*\.RSA", f), self.zip.namelist())
+        cert_like = filter(lambda f: re.match("META-INF/.*\.(RSA|DSA|EC)$", f), self.zip.namelist())
         if len(cert_like) > 0:
-            cert_name = cert_like[0]
-            data = p.communicate(input=self.get_file(cert_name))
-            out = data[0].split('\n')
-            err = data[1].split('\n')
-            if not 'unable to load PKCS7 object' in err and out:
-                self.cert_text = out
-
-        if not self.cert_text:
-            # try fallback to keytool if it exists
             try:
-                p = Popen(['keytool', '-list', '-printcert', '-jarfile', self.get_filename()], stdout=PIPE, stdin=PIPE, stderr=PIPE)
-                data = p.communicate()
-                out = data[0].split('\n')
-                err = data[1].split('\n')
-                if not 'unable to load PKCS7 object' in err and out:
-                    self.cert_text = out
-            except OSError:
-                self.cert_text = None
-                return
+                self.certificates = load_pkcs7(self.get_file(cert_like[0])).signers
+            except PKCS7Error as err:
+                self.cert_error = "{}: {}".format(cert_like[0], err)
 
+        for certificate in self.certificates:
+            self.cert_text.extend(certificate.to_text())
+
+    def get_certificates(self):
+        """
+            Return the certificates that signed the APK (v1 signature)
+
+            :rtype: a list of pkcs7.Certificate
+        """
+        return self.certificates
+
+    def get_certificate_error(self):
+        """
+            Return why the v1 signature could not be read, None if it was read or there is none
+
+            :rtype: string
+        """
+        return self.cert_error
+
+    def is_signed_v2(self):
+        """
+            Return true if the APK has an APK Signing Block (v2 signature or later)
+
+            :rtype: boolean
+        """
+        start_dir = getattr(self.zip, "start_dir", None)
+        if not start_dir or start_dir < len(APK_SIG_BLOCK_MAGIC):
+            return False
+
+        if self.__raw is not None:
+            return self.__raw[start_dir - len(APK_SIG_BLOCK_MAGIC):start_dir] == APK_SIG_BLOCK_MAGIC
+        with open(self.filename, "rb") as apk_file:
+            apk_file.seek(start_dir - len(APK_SIG_BLOCK_MAGIC))
+            return apk_file.read(len(APK_SIG_BLOCK_MAGIC)) == APK_SIG_BLOCK_MAGIC
 
     def is_valid_APK(self):
         """
@@ -295,23 +353,22 @@ class APK(object):
 
     def get_files_types(self):
         """
-            Return the files inside the APK with their associated types (by using python-magic)
+            Return the files inside the APK with their associated types (by using python-magic). The types are only
+            computed on the first call, as every entry has to be decompressed for them.
 
             :rtype: a dictionnary
         """
+        if self.files != {}:
+            return self.files
+
         try:
             import magic
         except ImportError:
             # no lib magic !
             for i in self.get_files():
-                buffer = self.zip.read(i)
-                self.files_crc32[i] = crc32(buffer)
                 self.files[i] = "Unknown"
             return self.files
 
-        if self.files != {}:
-            return self.files
-
         builtin_magic = 0
         try:
             getattr(magic, "MagicException")
@@ -321,19 +378,13 @@ class APK(object):
         if builtin_magic:
             ms = magic.open(magic.MAGIC_NONE)
             ms.load()
-
-            for i in self.get_files():
-                buffer = self.zip.read(i)
-                self.files[i] = ms.buffer(buffer)
-                self.files[i] = self._patch_magic(buffer, self.files[i])
-                self.files_crc32[i] = crc32(buffer)
+            from_buffer = ms.buffer
         else:
-            m = magic.Magic(magic_file=self.magic_file)
-            for i in self.get_files():
-                buffer = self.zip.read(i)
-                self.files[i] = m.from_buffer(buffer)
-                self.files[i] = self._patch_magic(buffer, self.files[i])
-                self.files_crc32[i] = crc32(buffer)
+            from_buffer = magic.Magic(magic_file=self.magic_file).from_buffer
+
+        for i in self.get_files():
+            buffer = self.zip.read(i)
+            self.files[i] = self._patch_magic(buffer, from_buffer(buffer))
 
         return self.files
 
@@ -349,8 +400,21 @@ class APK(object):
         return orig
 
     def get_files_crc32(self):
-        if self.files_crc32 == {}:
-            self.get_files_types()
+        """
+            Return the crc32 of the files inside the APK, as stored in the central directory of the zip
+
+            :rtype: a dictionnary
+        """
+        if self.files_crc32 != {}:
+            return self.files_crc32
+
+        if self.zipmodule == 0:
+            for i in self.get_files():
+                self.files_crc32[i] = crc32(self.zip.read(i))
+        else:
+            for info in self.zip.infolist():
+                # Same signed value zlib.crc32 returns for the data
+                self.files_crc32[info.filename] = info.CRC - (1 << 32) if info.CRC & 0x80000000 else info.CRC
 
         return self.files_crc32
 
@@ -360,8 +424,8 @@ class APK(object):
 
             :rtype: string, string, int
         """
-        if self.files == {}:
-            self.get_files_types()
+        self.get_files_types()
+        self.get_files_crc32()
 
         for i in self.get_files():
             try:
@@ -371,11 +435,13 @@ class APK(object):
 
     def get_raw(self):
         """
-            Return raw bytes of the APK
+            Return raw bytes of the APK, read from the file if the APK was opened from a path
 
             :rtype: string
         """
-        return self.__raw
+        if self.__raw is not None:
+            return self.__raw
+        return read(self.filename)
 
     def get_file(self, filename):
         """
@@ -404,14 +470,18 @@ class APK(object):
             :param attribute: a string which specify the attribute
         """
         l = []
-        for i in self.xml:
-            for item in self.xml[i].getElementsByTagName(tag_name):
-                value = item.getAttributeNS(NS_ANDROID_URI, attribute)
-                value = self.format_value(value)
+        for item in self._get_manifest_elements(tag_name):
+            value = item.get(attribute)
+            value = self.format_value(value)
 
-                l.append(str(value))
+            l.append(str(value))
         return l
 
+    def _get_manifest_elements(self, tag_name):
+        if self.manifest is None:
+            return []
+        return self.manifest.get_elements(tag_name)
+
     def format_value(self, value):
         if len(value) > 0:
             if value[0] == ".":
@@ -435,12 +505,11 @@ class APK(object):
 
             :rtype: string
         """
-        for i in self.xml:
-            for item in self.xml[i].getElementsByTagName(tag_name):
-                value = item.getAttributeNS(NS_ANDROID_URI, attribute)
+        for item in self._get_manifest_elements(tag_name):
+            value = item.get(attribute)
 
-                if len(value) > 0:
-                    return value
+            if len(value) > 0:
+                return value
         return None
 
     def get_main_activity(self):
@@ -452,17 +521,16 @@ class APK(object):
         x = set()
         y = set()
 
-        for i in self.xml:
-            for item in self.xml[i].getElementsByTagName("activity"):
-                for sitem in item.getElementsByTagName("action"):
-                    val = sitem.getAttributeNS(NS_ANDROID_URI, "name")
-                    if val == "android.intent.action.MAIN":
-                        x.add(item.getAttributeNS(NS_ANDROID_URI, "name"))
+        for item in self._get_manifest_elements("activity"):
+            for sitem in item.iter("action"):
+                val = sitem.get("name")
+                if val == "android.intent.action.MAIN":
+                    x.add(item.get("name"))
 
-                for sitem in item.getElementsByTagName("category"):
-                    val = sitem.getAttributeNS(NS_ANDROID_URI, "name")
-                    if val == "android.intent.category.LAUNCHER":
-                        y.add(item.getAttributeNS(NS_ANDROID_URI, "name"))
+            for sitem in item.iter("category"):
+                val = sitem.get("name")
+                if val == "android.intent.category.LAUNCHER":
+                    y.add(item.get("name"))
 
         z = x.intersection(y)
         if len(z) > 0:
@@ -507,16 +575,15 @@ class APK(object):
         d["action"] = []
         d["category"] = []
 
-        for i in self.xml:
-            for item in self.xml[i].getElementsByTagName(category):
-                if self.format_value(item.getAttributeNS(NS_ANDROID_URI, "name")) == name:
-                    for sitem in item.getElementsByTagName("intent-filter"):
-                        for ssitem in sitem.getElementsByTagName("action"):
-                            if ssitem.getAttributeNS(NS_ANDROID_URI, "name") not in d["action"]:
-                                d["action"].append(ssitem.getAttributeNS(NS_ANDROID_URI, "name"))
-                        for ssitem in sitem.getElementsByTagName("category"):
-                            if ssitem.getAttributeNS(NS_ANDROID_URI, "name") not in d["category"]:
-                                d["category"].append(ssitem.getAttributeNS(NS_ANDROID_URI, "name"))
+        for item in self._get_manifest_elements(category):
+            if self.format_value(item.get("name")) == name:
+                for sitem in item.iter("intent-filter"):
+                    for ssitem in sitem.iter("action"):
+                        if ssitem.get("name") not in d["action"]:
+                            d["action"].append(ssitem.get("name"))
+                    for ssitem in sitem.iter("category"):
+                        if ssitem.get("name") not in d["category"]:
+                            d["category"].append(ssitem.get("name"))
 
         if not d["action"]:
             del d["action"]
@@ -632,16 +699,28 @@ class APK(object):
                         zout.writestr(item, buffer)
         zout.close()
 
+    def get_android_manifest(self):
+        """
+            Return the :class:`AndroidManifest` object which corresponds to the AndroidManifest.xml file
+
+            :rtype: :class:`AndroidManifest`
+        """
+        return self.manifest
+
     def get_android_manifest_axml(self):
         """
-            Return the :class:`AXMLPrinter` object which corresponds to the AndroidManifest.xml file
+            Return the :class:`AXMLPrinter` object which corresponds to the AndroidManifest.xml file, the XML text is
+            only generated when asked for
 
             :rtype: :class:`AXMLPrinter`
         """
         try:
             return self.axml["AndroidManifest.xml"]
         except KeyError:
-            return None
+            if "AndroidManifest.xml" not in self.get_files():
+                return None
+            self.axml["AndroidManifest.xml"] = AXMLPrinter(self.get_file("AndroidManifest.xml"))
+            return self.axml["AndroidManifest.xml"]
 
     def get_android_manifest_xml(self):
         """
@@ -652,7 +731,14 @@ class APK(object):
         try:
             return self.xml["AndroidManifest.xml"]
         except KeyError:
-            return None
+            axml = self.get_android_manifest_axml()
+            if axml is None:
+                return None
+            try:
+                self.xml["AndroidManifest.xml"] = minidom.parseString(axml.get_buff())
+            except:
+                self.xml["AndroidManifest.xml"] = None
+            return self.xml["AndroidManifest.xml"]
 
     def get_android_resources(self):
         """
@@ -669,6 +755,28 @@ class APK(object):
             except KeyError:
                 return None
 
+    def get_app_name(self, locale='\x00\x00'):
+        """
+            Return the android:label of the application, resolved through resources.arsc if it is a reference
+
+            :param locale: the language to resolve the label for, the default one if not given
+
+            :rtype: string
+        """
+        label = self.get_element("application", "label")
+        if not label or not label.startswith("@") or label.startswith("@android:"):
+            return label
+
+        resources = self.get_android_resources()
+        if resources is None:
+            return label
+
+        try:
+            value = resources.get_resource_value(int(label[1:], 16), locale)
+        except ValueError:
+            return label
+        return value if value is not None else label
+
     def get_signature_name(self):
         signature_expr = re.compile("^(META-INF/)(.*)(\.RSA|\.DSA)$")
         for i in self.get_files():
@@ -685,6 +793,7 @@ class APK(object):
 
     def show(self):
         self.get_files_types()
+        self.get_files_crc32()
 
         print "FILES: "
         for i in self.get_files():
@@ -735,10 +844,9 @@ class APK(object):
         parse_icon_rt = os.popen(aapt_line).read()
         icon_paths = [icon.replace("'", '') for icon in parse_icon_rt.split('\n') if icon]
 
-        zfile = zipfile.ZipFile(StringIO.StringIO(self.__raw), mode='r')
         for icon in icon_paths:
             icon_name = icon.replace('/', '_')
-            data = zfile.read(icon)
+            data = self.zip.read(icon)
             with open(os.path.join(pkg_name_path, icon_name), 'w+b') as icon_file:
                 icon_file.write(data)
         print "APK ICON in: %s" % pkg_name_path
@@ -757,35 +865,27 @@ def show_Certificate(cert):
 # Translated from http://code.google.com/p/android4me/source/browse/src/android/content/res/AXmlResourceParser.java
 
 UTF8_FLAG = 0x00000100
+# Decoded strings kept per string pool
+STRING_CACHE_SIZE = 4096
 
 
 class StringBlock(object):
-    def __init__(self, buff):
-        self.start = buff.get_idx()
-        self._cache = {}
-        self.header = unpack('<h', buff.read(2))[0]
-        self.header_size = unpack('<h', buff.read(2))[0]
-
-        self.chunkSize = unpack('<i', buff.read(4))[0]
-        self.stringCount = unpack('<i', buff.read(4))[0]
-        self.styleOffsetCount = unpack('<i', buff.read(4))[0]
+    """
+        String pool of an AXML or ARSC chunk. The offsets are read in bulk and the strings are decoded on demand,
+        straight from the raw bytes of the pool.
+    """
 
-        self.flags = unpack('<i', buff.read(4))[0]
+    def __init__(self, buff, cache_size=STRING_CACHE_SIZE):
+        self.start = buff.get_idx()
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self.header, self.header_size, self.chunkSize, self.stringCount, self.styleOffsetCount, self.flags, \
+            self.stringsOffset, self.stylesOffset = unpack('<hhiiiiii', buff.read(28))
         self.m_isUTF8 = ((self.flags & UTF8_FLAG) != 0)
 
-        self.stringsOffset = unpack('<i', buff.read(4))[0]
-        self.stylesOffset = unpack('<i', buff.read(4))[0]
-
-        self.m_stringOffsets = []
-        self.m_styleOffsets = []
-        self.m_strings = []
-        self.m_styles = []
-
-        for i in range(0, self.stringCount):
-            self.m_stringOffsets.append(unpack('<i', buff.read(4))[0])
-
-        for i in range(0, self.styleOffsetCount):
-            self.m_styleOffsets.append(unpack('<i', buff.read(4))[0])
+        self.m_stringOffsets = unpack('<%di' % self.stringCount, buff.read(4 * self.stringCount))
+        self.m_styleOffsets = unpack('<%di' % self.styleOffsetCount, buff.read(4 * self.styleOffsetCount))
+        self.m_styles = ()
 
         size = self.chunkSize - self.stringsOffset
         if self.stylesOffset != 0:
@@ -795,8 +895,7 @@ class StringBlock(object):
         if (size % 4) != 0:
             androconf.warning("ooo")
 
-        for i in range(0, size):
-            self.m_strings.append(unpack('=b', buff.read(1))[0])
+        self.m_strings = buff.read(size)
 
         if self.stylesOffset != 0:
             size = self.chunkSize - self.stylesOffset
@@ -805,12 +904,14 @@ class StringBlock(object):
             if (size % 4) != 0:
                 androconf.warning("ooo")
 
-            for i in range(0, size / 4):
-                self.m_styles.append(unpack('<i', buff.read(4))[0])
+            self.m_styles = unpack('<%di' % (size / 4), buff.read(size - size % 4))
 
     def getString(self, idx):
         if idx in self._cache:
-            return self._cache[idx]
+            # Move the string to the most recently used end
+            value = self._cache.pop(idx)
+            self._cache[idx] = value
+            return value
 
         if idx < 0 or not self.m_stringOffsets or idx >= len(self.m_stringOffsets):
             return ""
@@ -820,7 +921,7 @@ class StringBlock(object):
         if not self.m_isUTF8:
             length = self.getShort2(self.m_strings, offset)
             offset += 2
-            self._cache[idx] = self.decode(self.m_strings, offset, length)
+            value = self.decode(self.m_strings, offset, length)
         else:
             offset += self.getVarint(self.m_strings, offset)[1]
             varint = self.getVarint(self.m_strings, offset)
@@ -828,9 +929,12 @@ class StringBlock(object):
             offset += varint[1]
             length = varint[0]
 
-            self._cache[idx] = self.decode2(self.m_strings, offset, length)
+            value = self.decode2(self.m_strings, offset, length)
 
-        return self._cache[idx]
+        if len(self._cache) >= self._cache_size:
+            self._cache.popitem(last=False)
+        self._cache[idx] = value
+        return value
 
     def getStyle(self, idx):
         print idx
@@ -839,40 +943,25 @@ class StringBlock(object):
         print self.m_styles[0]
 
     def decode(self, array, offset, length):
-        length = length * 2
-        length = length + length % 2
-
-        data = ""
+        data = array[offset:offset + length * 2].decode("utf-16-le", 'replace')
 
-        for i in range(0, length):
-            t_data = pack("=b", self.m_strings[offset + i])
-            data += unicode(t_data, errors='ignore')
-            if data[-2:] == "\x00\x00":
-                break
-
-        end_zero = data.find("\x00\x00")
+        end_zero = data.find(u"\x00")
         if end_zero != -1:
             data = data[:end_zero]
 
-        return data.decode("utf-16", 'replace')
+        return data
 
     def decode2(self, array, offset, length):
-        data = ""
-
-        for i in range(0, length):
-            t_data = pack("=b", self.m_strings[offset + i])
-            data += unicode(t_data, errors='ignore')
-
-        return data.decode("utf-8", 'replace')
+        return array[offset:offset + length].decode("utf-8", 'replace')
 
     def getVarint(self, array, offset):
-        val = array[offset]
+        val = ord(array[offset])
         more = (val & 0x80) != 0
         val &= 0x7f
 
         if not more:
             return val, 1
-        return val << 8 | array[offset + 1] & 0xff, 2
+        return val << 8 | ord(array[offset + 1]), 2
 
     def getShort(self, array, offset):
         value = array[offset / 4]
@@ -882,7 +971,7 @@ class StringBlock(object):
             return value >> 16
 
     def getShort2(self, array, offset):
-        return (array[offset + 1] & 0xff) << 8 | array[offset] & 0xff
+        return unpack_from('<H', array, offset)[0]
 
     def show(self):
         print "StringBlock", hex(self.start), hex(self.header), hex(self.header_size), hex(self.chunkSize), hex(
@@ -1137,6 +1226,15 @@ class AXMLParser(object):
 
         return self.sb.getString(prefix)
 
+    def getAttributeNamespace(self, index):
+        offset = self.getAttributeOffset(index)
+        uri = self.m_attributes[offset + ATTRIBUTE_IX_NAMESPACE_URI]
+
+        if uri == 0xFFFFFFFF:
+            return u''
+
+        return self.sb.getString(uri)
+
     def getAttributeName(self, index):
         offset = self.getAttributeOffset(index)
         name = self.m_attributes[offset + ATTRIBUTE_IX_NAME]
@@ -1196,6 +1294,61 @@ def complexToFloat(xcomplex):
     return (float)(xcomplex & 0xFFFFFF00) * RADIX_MULTS[(xcomplex >> 4) & 3]
 
 
+def format_attribute_value(axml, index):
+    """
+        Return the value of an attribute of the current tag of an :class:`AXMLParser` as text
+    """
+    _type = axml.getAttributeValueType(index)
+    _data = axml.getAttributeValueData(index)
+
+    if _type == TYPE_STRING:
+        return axml.getAttributeValue(index)
+
+    return format_typed_value(_type, _data)
+
+
+def format_typed_value(_type, _data):
+    """
+        Return a value that is not a string as text
+    """
+    if _type == TYPE_ATTRIBUTE:
+        return "?%s%08X" % (_get_package_prefix(_data), _data)
+
+    elif _type == TYPE_REFERENCE:
+        return "@%s%08X" % (_get_package_prefix(_data), _data)
+
+    elif _type == TYPE_FLOAT:
+        return "%f" % unpack("=f", pack("=L", _data))[0]
+
+    elif _type == TYPE_INT_HEX:
+        return "0x%08X" % _data
+
+    elif _type == TYPE_INT_BOOLEAN:
+        if _data == 0:
+            return "false"
+        return "true"
+
+    elif _type == TYPE_DIMENSION:
+        return "%f%s" % (complexToFloat(_data), DIMENSION_UNITS[_data & COMPLEX_UNIT_MASK])
+
+    elif _type == TYPE_FRACTION:
+        return "%f%s" % (complexToFloat(_data) * 100, FRACTION_UNITS[_data & COMPLEX_UNIT_MASK])
+
+    elif _type >= TYPE_FIRST_COLOR_INT and _type <= TYPE_LAST_COLOR_INT:
+        return "#%08X" % _data
+
+    elif _type >= TYPE_FIRST_INT and _type <= TYPE_LAST_INT:
+        return "%d" % androconf.long2int(_data)
+
+    return "<0x%X, type 0x%02X>" % (_data, _type)
+
+
+def _get_package_prefix(id):
+    if id >> 24 == 1:
+        return "android:"
+    return ""
+
+
 class AXMLPrinter(object):
     def __init__(self, raw_buff):
         self.axml = AXMLParser(raw_buff)
@@ -1254,47 +1407,153 @@ class AXMLPrinter(object):
         return prefix + u':'
 
     def getAttributeValue(self, index):
-        _type = self.axml.getAttributeValueType(index)
-        _data = self.axml.getAttributeValueData(index)
+        return format_attribute_value(self.axml, index)
 
-        if _type == TYPE_STRING:
-            return self.axml.getAttributeValue(index)
+    def getPackage(self, id):
+        return _get_package_prefix(id)
 
-        elif _type == TYPE_ATTRIBUTE:
-            return "?%s%08X" % (self.getPackage(_data), _data)
 
-        elif _type == TYPE_REFERENCE:
-            return "@%s%08X" % (self.getPackage(_data), _data)
+class AXMLElement(object):
+    """
+        Element of a binary XML document
 
-        elif _type == TYPE_FLOAT:
-            return "%f" % unpack("=f", pack("=L", _data))[0]
+        :param tag: the tag name, with its prefix
+        :param attributes: the attribute values as text, by (namespace uri, name)
+        :param parent: the parent element, None for the root
+    """
 
-        elif _type == TYPE_INT_HEX:
-            return "0x%08X" % _data
+    def __init__(self, tag, attributes, parent=None):
+        self.tag = tag
+        self.attributes = attributes
+        self.parent = parent
+        self.children = []
 
-        elif _type == TYPE_INT_BOOLEAN:
-            if _data == 0:
-                return "false"
-            return "true"
+    def get(self, name, namespace=NS_ANDROID_URI):
+        """
+            Return the value of an attribute, an empty string if it is missing
 
-        elif _type == TYPE_DIMENSION:
-            return "%f%s" % (complexToFloat(_data), DIMENSION_UNITS[_data & COMPLEX_UNIT_MASK])
+            :rtype: string
+        """
+        return self.attributes.get((namespace, name), u'')
 
-        elif _type == TYPE_FRACTION:
-            return "%f%s" % (complexToFloat(_data) * 100, FRACTION_UNITS[_data & COMPLEX_UNIT_MASK])
+    def iter(self, tag):
+        """
+            Return the descendants with the given tag, in document order
+        """
+        for child in self.children:
+            if child.tag == tag:
+                yield child
+            for item in child.iter(tag):
+                yield item
 
-        elif _type >= TYPE_FIRST_COLOR_INT and _type <= TYPE_LAST_COLOR_INT:
-            return "#%08X" % _data
 
-        elif _type >= TYPE_FIRST_INT and _type <= TYPE_LAST_INT:
-            return "%d" % androconf.long2int(_data)
+class AXMLDocument(object):
+    """
+        Element tree of a binary XML file built in a single pass over the :class:`AXMLParser` events, with the
+        elements indexed by tag
+    """
 
-        return "<0x%X, type 0x%02X>" % (_data, _type)
+    def __init__(self, raw_buff):
+        self.root = None
+        self.index = {}
+
+        axml = AXMLParser(raw_buff)
+        stack = []
+        while axml.is_valid():
+            _type = axml.next()
+
+            if _type == START_TAG:
+                prefix = axml.getPrefix()
+                tag = (prefix + u':' if prefix else u'') + axml.getName()
+                attributes = {}
+                for i in range(0, axml.getAttributeCount()):
+                    attributes[(axml.getAttributeNamespace(i), axml.getAttributeName(i))] = \
+                        unicode(format_attribute_value(axml, i))
+
+                element = AXMLElement(tag, attributes, stack[-1] if stack else None)
+                if element.parent is not None:
+                    element.parent.children.append(element)
+                elif self.root is None:
+                    self.root = element
+                self.index.setdefault(tag, []).append(element)
+                stack.append(element)
 
-    def getPackage(self, id):
-        if id >> 24 == 1:
-            return "android:"
-        return ""
+            elif _type == END_TAG:
+                if stack:
+                    stack.pop()
+
+            elif _type == END_DOCUMENT:
+                break
+
+    def is_valid(self):
+        return self.root is not None
+
+    def get_elements(self, tag):
+        """
+            Return the elements with the given tag, in document order
+
+            :rtype: a list of :class:`AXMLElement`
+        """
+        return self.index.get(tag, [])
+
+
+class AndroidManifest(AXMLDocument):
+    """
+        Model of a binary AndroidManifest.xml
+    """
+
+    COMPONENTS = ("activity", "activity-alias", "service", "receiver", "provider")
+
+    def get_package(self):
+        return self.root.get("package", namespace=u'')
+
+    def get_version_code(self):
+        return self.root.get("versionCode")
+
+    def get_version_name(self):
+        return self.root.get("versionName")
+
+    def _get_sdk_version(self, attribute):
+        for item in self.get_elements("uses-sdk"):
+            value = item.get(attribute)
+            if value:
+                return value
+        return None
+
+    def get_min_sdk_version(self):
+        return self._get_sdk_version("minSdkVersion")
+
+    def get_target_sdk_version(self):
+        return self._get_sdk_version("targetSdkVersion")
+
+    def get_max_sdk_version(self):
+        return self._get_sdk_version("maxSdkVersion")
+
+    def get_permissions(self):
+        """
+            Return the android:name of the uses-permission elements
+
+            :rtype: a list of string
+        """
+        return [item.get("name") for item in self.get_elements("uses-permission")]
+
+    def get_components(self, tag):
+        """
+            Return the components (activities, services, receivers, providers) with the given tag
+
+            :rtype: a list of :class:`AXMLElement`
+        """
+        return self.get_elements(tag)
+
+    def get_intent_filters(self, component):
+        """
+            Return the actions and categories of the intent filters of a component
+
+            :rtype: a list of dictionnaries with the 'action' and 'category' names
+        """
+        return [{"action": [item.get("name") for item in intent_filter.iter("action")],
+                 "category": [item.get("name") for item in intent_filter.iter("category")]}
+                for intent_filter in component.iter("intent-filter")]
 
 
 RES_NULL_TYPE = 0x0000
@@ -1322,6 +1581,12 @@ RES_TABLE_TYPE_SPEC_TYPE = 0x0202
 
 
 class ARSCParser(object):
+    """
+        Parser of resources.arsc. Only the chunk offsets of every package, type and config are indexed up front, the
+        entries are decoded on demand: get_resource() looks a resource id up directly, the per locale lists behind
+        the get_*_resources() methods are only built when one of them is called.
+    """
+
     def __init__(self, raw_buff):
         self.analyzed = False
         self.buff = bytecode.BuffHandle(raw_buff)
@@ -1335,63 +1600,133 @@ class ARSCParser(object):
         self.stringpool_main = StringBlock(self.buff)
 
         self.next_header = ARSCHeader(self.buff)
-        self.packages = {}
+        self.__packages = None
         self.values = {}
+        self.__strings = {}
 
-        for i in range(0, self.packageCount):
-            current_package = ARSCResTablePackage(self.buff)
-            package_name = current_package.get_name()
+        # package id -> ARSCPackageIndex
+        self.resource_packages = {}
+        self.package_names = []
+        self._index()
 
-            self.packages[package_name] = []
+    def _index(self):
+        # Chunks are found through the offsets and sizes in their headers, whatever the size of the headers is
+        offset = self.next_header.start
+        for i in range(0, self.packageCount):
+            self.buff.set_idx(offset)
+            header = ARSCHeader(self.buff)
+            if header.type != RES_TABLE_PACKAGE_TYPE:
+                androconf.warning("unknown type")
+                break
 
+            current_package = ARSCResTablePackage(self.buff)
+            self.buff.set_idx(offset + current_package.typeStrings)
             mTableStrings = StringBlock(self.buff)
+            self.buff.set_idx(offset + current_package.keyStrings)
             mKeyStrings = StringBlock(self.buff)
 
-            #self.stringpool_main.show()
-            #self.mTableStrings.show()
-            #self.mKeyStrings.show()
+            package = ARSCPackageIndex(PackageContext(current_package, self.stringpool_main, mTableStrings,
+                                                      mKeyStrings))
+            self.resource_packages[current_package.id] = package
+            self.package_names.append(package.name)
 
-            self.packages[package_name].append(current_package)
-            self.packages[package_name].append(mTableStrings)
-            self.packages[package_name].append(mKeyStrings)
+            current = offset + header.header_size
+            end = min(offset + header.size, self.buff.size())
+            while current + 8 <= end:
+                self.buff.set_idx(current)
+                chunk = ARSCHeader(self.buff)
+                if chunk.size <= 0:
+                    break
+
+                if chunk.type == RES_TABLE_TYPE_TYPE:
+                    package.add_type(ARSCTypeIndex(ARSCResType(self.buff, package.context), chunk))
+                elif chunk.type == RES_TABLE_TYPE_SPEC_TYPE:
+                    package.add_chunk(chunk)
+
+                current += chunk.size
+            offset = end
+
+    @property
+    def packages(self):
+        """
+            The type specs, types and entries of every package in file order, decoded on first use
+        """
+        if self.__packages is None:
+            self.__packages = self._parse_packages()
+        return self.__packages
+
+    def _parse_packages(self):
+        packages = {}
+        for package_id in sorted(self.resource_packages):
+            package = self.resource_packages[package_id]
+            context = package.context
+            items = [context.current_package, context.mTableStrings, context.mKeyStrings]
+
+            for chunk in package.chunks:
+                if isinstance(chunk, ARSCTypeIndex):
+                    self.buff.set_idx(chunk.start)
+                    items.append(ARSCHeader(self.buff))
+                    items.append(chunk.res_type)
+
+                    offsets = unpack_from('<%di' % chunk.entry_count, self.buff.read_at(chunk.offsets,
+                                                                                        4 * chunk.entry_count))
+                    entries = [(entry, chunk.mResId & 0xffff0000 | i) for i, entry in enumerate(offsets)]
+                    items.append(entries)
+                    for i, (entry, res_id) in enumerate(entries):
+                        if entry != -1:
+                            items.append(self._read_entry(package, chunk, i))
+                else:
+                    self.buff.set_idx(chunk.start)
+                    items.append(ARSCHeader(self.buff))
+                    items.append(ARSCResTypeSpec(self.buff, context))
 
-            pc = PackageContext(current_package, self.stringpool_main, mTableStrings, mKeyStrings)
+            packages[package.name] = items
+        return packages
 
-            current = self.buff.get_idx()
-            while not self.buff.end():
-                header = ARSCHeader(self.buff)
-                self.packages[package_name].append(header)
+    def get_resource(self, res_id, locale='\x00\x00'):
+        """
+            Return the entry of a resource id, from a config of the locale if there is one, else from the default
+            config, else from any config
 
-                if header.type == RES_TABLE_TYPE_SPEC_TYPE:
-                    self.packages[package_name].append(ARSCResTypeSpec(self.buff, pc))
+            :param res_id: the resource id, e.g. 0x7f0b0027
+            :param locale: the language, as returned by :meth:`ARSCResTableConfig.get_language`
 
-                elif header.type == RES_TABLE_TYPE_TYPE:
-                    a_res_type = ARSCResType(self.buff, pc)
-                    self.packages[package_name].append(a_res_type)
+            :rtype: :class:`ARSCResTableEntry` or None
+        """
+        package = self.resource_packages.get(res_id >> 24)
+        if package is None:
+            return None
 
-                    entries = []
-                    for i in range(0, a_res_type.entryCount):
-                        current_package.mResId = current_package.mResId & 0xffff0000 | i
-                        entries.append((unpack('<i', self.buff.read(4))[0], current_package.mResId))
+        index = res_id & 0xffff
+        for res_type in package.get_types((res_id >> 16) & 0xff, locale):
+            ate = self._read_entry(package, res_type, index)
+            if ate is not None:
+                return ate
+        return None
 
-                    self.packages[package_name].append(entries)
+    def get_resource_value(self, res_id, locale='\x00\x00'):
+        """
+            Return the value of a resource id as text, see :meth:`get_resource`
 
-                    for entry, res_id in entries:
-                        if self.buff.end():
-                            break
+            :rtype: string or None
+        """
+        ate = self.get_resource(res_id, locale)
+        if ate is None or ate.is_complex():
+            return None
+        if ate.key.get_data_type() == TYPE_STRING:
+            return ate.get_key_data()
+        return format_typed_value(ate.key.get_data_type(), ate.key.get_data() & 0xFFFFFFFF)
 
-                        if entry != -1:
-                            ate = ARSCResTableEntry(self.buff, res_id, pc)
-                            self.packages[package_name].append(ate)
+    def _read_entry(self, package, res_type, index):
+        if index >= res_type.entry_count:
+            return None
 
-                elif header.type == RES_TABLE_PACKAGE_TYPE:
-                    break
-                else:
-                    androconf.warning("unknown type")
-                    break
+        offset = unpack_from('<i', self.buff.read_at(res_type.offsets + 4 * index, 4))[0]
+        if offset == -1:
+            return None
 
-                current += header.size
-                self.buff.set_idx(current)
+        self.buff.set_idx(res_type.entries + offset)
+        return ARSCResTableEntry(self.buff, res_type.mResId & 0xffff0000 | index, package.context)
 
     def _analyse(self):
         if self.analyzed:
@@ -1493,7 +1828,7 @@ class ARSCParser(object):
         return ["", ""]
 
     def get_packages_names(self):
-        return self.packages.keys()
+        return list(self.package_names)
 
     def get_locales(self, package_name):
         self._analyse()
@@ -1647,30 +1982,89 @@ class ARSCParser(object):
         return buff.encode('utf-8')
 
     def get_id(self, package_name, rid, locale='\x00\x00'):
-        self._analyse()
-
-        try:
-            for i in self.values[package_name][locale]["public"]:
-                if i[2] == rid:
-                    return i
-        except KeyError:
+        package = self.resource_packages.get(rid >> 24)
+        if package is None or package.name != package_name:
             return None
 
-    def get_string(self, package_name, name, locale='\x00\x00'):
-        self._analyse()
+        for res_type in package.get_types((rid >> 16) & 0xff):
+            if res_type.language == locale:
+                ate = self._read_entry(package, res_type, rid & 0xffff)
+                if ate is not None and ate.get_index() != -1:
+                    return res_type.res_type.get_type(), ate.get_value(), ate.mResId
+        return None
 
-        try:
-            for i in self.values[package_name][locale]["string"]:
-                if i[0] == name:
-                    return i
-        except KeyError:
-            return None
+    def get_string(self, package_name, name, locale='\x00\x00'):
+        key = (package_name, locale)
+        if key not in self.__strings:
+            self.__strings[key] = self._get_strings(package_name, locale)
+        return self.__strings[key].get(name)
+
+    def _get_strings(self, package_name, locale):
+        strings = {}
+        for package in self.resource_packages.values():
+            if package.name != package_name:
+                continue
+            for res_type in package.get_all_types():
+                if res_type.language != locale or res_type.res_type.get_type() != "string":
+                    continue
+                for index in range(0, res_type.entry_count):
+                    ate = self._read_entry(package, res_type, index)
+                    if ate is not None and ate.get_value() not in strings:
+                        strings[ate.get_value()] = self.get_resource_string(ate)
+        return strings
 
     def get_items(self, package_name):
         self._analyse()
         return self.packages[package_name]
 
 
+class ARSCPackageIndex(object):
+    """
+        The type chunks of a package of resources.arsc by type id, in file order
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.name = context.current_package.get_name()
+        self.types = {}
+        self.chunks = []
+
+    def add_type(self, res_type):
+        self.types.setdefault(res_type.id, []).append(res_type)
+        self.chunks.append(res_type)
+
+    def add_chunk(self, header):
+        self.chunks.append(header)
+
+    def get_all_types(self):
+        return [chunk for chunk in self.chunks if isinstance(chunk, ARSCTypeIndex)]
+
+    def get_types(self, type_id, locale=None):
+        """
+            Return the type chunks of a type id, the ones of the locale first, then the default config ones
+        """
+        types = self.types.get(type_id, [])
+        if locale is None:
+            return types
+        return sorted(types, key=lambda res_type: (res_type.language != locale, res_type.language != '\x00\x00'))
+
+
+class ARSCTypeIndex(object):
+    """
+        Where the entries of a type chunk are, they are decoded on demand
+    """
+
+    def __init__(self, res_type, header):
+        self.res_type = res_type
+        self.id = res_type.id
+        self.mResId = res_type.mResId
+        self.entry_count = res_type.entryCount
+        self.language = res_type.config.get_language()
+        self.start = header.start
+        self.offsets = header.start + header.header_size
+        self.entries = header.start + res_type.entriesStart
+
+
 class PackageContext(object):
     def __init__(self, current_package, stringpool_main, mTableStrings, mKeyStrings):
         self.stringpool_main = stringpool_main
@@ -1770,9 +2164,9 @@ class ARSCResTableConfig(object):
             if self.size >= 36:
                 self.screenSizeDp = unpack('<i', buff.read(4))[0]
 
+        # Fields added by newer platform versions are skipped
         self.exceedingSize = self.size - 36
         if self.exceedingSize > 0:
-            androconf.warning("too much bytes !")
             self.padding = buff.read(self.exceedingSize)
 
             #print "ARSCResTableConfig", hex(self.start), hex(self.size), hex(self.imsi), hex(self.locale), repr(self.get_language()), repr(self.get_country()), hex(self.screenType), hex(self.input), hex(self.screenSize), hex(self.version), hex(self.screenConfig), hex(self.screenSizeDp)
@@ -0,0 +1,342 @@
+"""
+Minimal DER (and BER indefinite length) reader for the PKCS#7 SignedData blocks of v1 (jar) signed APKs (META-INF/*.RSA, *.DSA and *.EC) and
+the X.509 certificates inside them. Only the fields needed to describe the signer are decoded.
+"""
+import hashlib
+from datetime import datetime
+
+# Universal tags
+TAG_INTEGER = 0x02
+TAG_BIT_STRING = 0x03
+TAG_OCTET_STRING = 0x04
+TAG_NULL = 0x05
+TAG_OID = 0x06
+TAG_UTF8_STRING = 0x0c
+TAG_SEQUENCE = 0x30
+TAG_SET = 0x31
+TAG_PRINTABLE_STRING = 0x13
+TAG_T61_STRING = 0x14
+TAG_IA5_STRING = 0x16
+TAG_UTC_TIME = 0x17
+TAG_GENERALIZED_TIME = 0x18
+TAG_UNIVERSAL_STRING = 0x1c
+TAG_BMP_STRING = 0x1e
+# [0] constructed, context specific
+TAG_CONTEXT_0 = 0xa0
+CONSTRUCTED = 0x20
+INDEFINITE_LENGTH = 0x80
+END_OF_CONTENTS = '\x00\x00'
+
+OID_SIGNED_DATA = '1.2.840.113549.1.7.2'
+
+NAME_ATTRIBUTES = {
+    '2.5.4.3': 'CN',
+    '2.5.4.5': 'serialNumber',
+    '2.5.4.6': 'C',
+    '2.5.4.7': 'L',
+    '2.5.4.8': 'ST',
+    '2.5.4.9': 'street',
+    '2.5.4.10': 'O',
+    '2.5.4.11': 'OU',
+    '2.5.4.12': 'title',
+    '2.5.4.42': 'GN',
+    '2.5.4.4': 'SN',
+    '0.9.2342.19200300.100.1.25': 'DC',
+    '1.2.840.113549.1.9.1': 'emailAddress',
+}
+
+SIGNATURE_ALGORITHMS = {
+    '1.2.840.113549.1.1.1': 'rsaEncryption',
+    '1.2.840.113549.1.1.4': 'md5WithRSAEncryption',
+    '1.2.840.113549.1.1.5': 'sha1WithRSAEncryption',
+    '1.2.840.113549.1.1.11': 'sha256WithRSAEncryption',
+    '1.2.840.113549.1.1.12': 'sha384WithRSAEncryption',
+    '1.2.840.113549.1.1.13': 'sha512WithRSAEncryption',
+    '1.2.840.10040.4.3': 'dsaWithSHA1',
+    '2.16.840.1.101.3.4.3.2': 'dsa_with_SHA256',
+    '1.2.840.10045.4.1': 'ecdsa-with-SHA1',
+    '1.2.840.10045.4.3.2': 'ecdsa-with-SHA256',
+    '1.2.840.10045.4.3.3': 'ecdsa-with-SHA384',
+    '1.2.840.10045.4.3.4': 'ecdsa-with-SHA512',
+}
+
+STRING_ENCODINGS = {
+    TAG_UTF8_STRING: 'utf-8',
+    TAG_PRINTABLE_STRING: 'ascii',
+    TAG_IA5_STRING: 'ascii',
+    TAG_T61_STRING: 'latin-1',
+    TAG_BMP_STRING: 'utf-16-be',
+    TAG_UNIVERSAL_STRING: 'utf-32-be',
+}
+
+
+class PKCS7Error(ValueError):
+    pass
+
+
+class Node(object):
+    """ A DER encoded value: its tag and where its header, content and end are in data. The content of a value
+        with an indefinite length stops at content_end, before the end-of-contents octets. """
+
+    def __init__(self, data, tag, start, content, end, content_end=None):
+        self.data = data
+        self.tag = tag
+        self.start = start
+        self.content = content
+        self.end = end
+        self.content_end = end if content_end is None else content_end
+
+    @property
+    def value(self):
+        return self.data[self.content:self.content_end]
+
+    @property
+    def der(self):
+        return self.data[self.start:self.end]
+
+    def children(self):
+        offset = self.content
+        while offset < self.content_end:
+            child = read_node(self.data, offset, self.content_end)
+            yield child
+            offset = child.end
+
+    def child(self, index):
+        for i, child in enumerate(self.children()):
+            if i == index:
+                return child
+        raise PKCS7Error('missing element {} in tag 0x{:02x}'.format(index, self.tag))
+
+    def expect(self, tag):
+        if self.tag != tag:
+            raise PKCS7Error('expected tag 0x{:02x}, found 0x{:02x}'.format(tag, self.tag))
+        return self
+
+
+def read_node(data, offset, limit=None):
+    """ Read the DER value starting at offset, BER indefinite lengths are accepted for constructed values. """
+    limit = len(data) if limit is None else limit
+    if offset + 2 > limit:
+        raise PKCS7Error('truncated value at offset {}'.format(offset))
+
+    tag = ord(data[offset])
+    if tag & 0x1f == 0x1f:
+        raise PKCS7Error('high tag numbers are not supported')
+    length = ord(data[offset + 1])
+    content = offset + 2
+    if length == INDEFINITE_LENGTH:
+        if not tag & CONSTRUCTED:
+            raise PKCS7Error('indefinite length of a primitive value at offset {}'.format(offset))
+        # The content runs up to the end-of-contents octets following the last child
+        end = content
+        while data[end:end + 2] != END_OF_CONTENTS:
+            end = read_node(data, end, limit).end
+        if end + 2 > limit:
+            raise PKCS7Error('truncated value at offset {}'.format(offset))
+        return Node(data, tag, offset, content, end + 2, end)
+    if length & 0x80:
+        count = length & 0x7f
+        if not count or count > 4:
+            raise PKCS7Error('unsupported length at offset {}'.format(offset))
+        if content + count > limit:
+            raise PKCS7Error('truncated length at offset {}'.format(offset))
+        length = 0
+        for byte in data[content:content + count]:
+            length = length << 8 | ord(byte)
+        content += count
+    end = content + length
+    if end > limit:
+        raise PKCS7Error('truncated value at offset {}'.format(offset))
+    return Node(data, tag, offset, content, end)
+
+
+def decode_integer(node):
+    value = 0
+    for byte in node.expect(TAG_INTEGER).value:
+        value = value << 8 | ord(byte)
+    if node.value and ord(node.value[0]) & 0x80:
+        value -= 1 << (8 * len(node.value))
+    return value
+
+
+def decode_oid(node):
+    value = node.expect(TAG_OID).value
+    if not value:
+        raise PKCS7Error('empty object identifier')
+    first = ord(value[0])
+    arcs = [min(first // 40, 2), first - 40 * min(first // 40, 2)]
+    arc = 0
+    for byte in value[1:]:
+        arc = arc << 7 | (ord(byte) & 0x7f)
+        if not ord(byte) & 0x80:
+            arcs.append(arc)
+            arc = 0
+    return '.'.join(str(arc) for arc in arcs)
+
+
+def decode_string(node):
+    encoding = STRING_ENCODINGS.get(node.tag)
+    if not encoding:
+        return node.value.encode('hex')
+    return node.value.decode(encoding, 'replace')
+
+
+def decode_time(node):
+    value = node.value
+    try:
+        if node.tag == TAG_UTC_TIME:
+            year = int(value[:2])
+            value = ('19' if year >= 50 else '20') + value
+        elif node.tag != TAG_GENERALIZED_TIME:
+            raise PKCS7Error('expected a time, found tag 0x{:02x}'.format(node.tag))
+        if not value.endswith('Z'):
+            raise PKCS7Error('only UTC times are supported')
+        value = value[:-1].split('.')[0]
+        return datetime.strptime(value, '%Y%m%d%H%M%S' if len(value) == 14 else '%Y%m%d%H%M')
+    except ValueError as err:
+        raise PKCS7Error('invalid time {!r}: {}'.format(node.value, err))
+
+
+def decode_algorithm(node):
+    oid = decode_oid(node.expect(TAG_SEQUENCE).child(0))
+    return SIGNATURE_ALGORITHMS.get(oid, oid)
+
+
+class X509Name(object):
+    """ A distinguished name, as the (attribute, value) pairs in the order of the certificate. """
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+    @staticmethod
+    def decode(node):
+        attributes = []
+        for rdn in node.expect(TAG_SEQUENCE).children():
+            for attribute in rdn.expect(TAG_SET).children():
+                oid = decode_oid(attribute.expect(TAG_SEQUENCE).child(0))
+                attributes.append((NAME_ATTRIBUTES.get(oid, oid), decode_string(attribute.child(1))))
+        return X509Name(attributes)
+
+    def get(self, name, default=None):
+        """ Return the value of the first attribute with the given name, e.g. 'CN'. """
+        for key, value in self.attributes:
+            if key == name:
+                return value
+        return default
+
+    @property
+    def common_name(self):
+        return self.get('CN')
+
+    def __unicode__(self):
+        return u', '.join(u'{}={}'.format(key, value) for key, value in self.attributes)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+    def __eq__(self, other):
+        return isinstance(other, X509Name) and self.attributes == other.attributes
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class Certificate(object):
+    """ The fields of an X.509 certificate describing who signed an APK. """
+
+    def __init__(self, der, version, serial_number, signature_algorithm, issuer, subject, not_before, not_after):
+        self.der = der
+        self.version = version
+        self.serial_number = serial_number
+        self.signature_algorithm = signature_algorithm
+        self.issuer = issuer
+        self.subject = subject
+        self.not_before = not_before
+        self.not_after = not_after
+
+    @staticmethod
+    def decode(node):
+        tbs = node.expect(TAG_SEQUENCE).child(0).expect(TAG_SEQUENCE)
+        fields = list(tbs.children())
+        version = 1
+        if fields and fields[0].tag == TAG_CONTEXT_0:
+            version = decode_integer(fields.pop(0).child(0)) + 1
+        if len(fields) < 6:
+            raise PKCS7Error('truncated certificate')
+        validity = fields[3].expect(TAG_SEQUENCE)
+        return Certificate(der=node.der,
+                           version=version,
+                           serial_number=decode_integer(fields[0]),
+                           signature_algorithm=decode_algorithm(fields[1]),
+                           issuer=X509Name.decode(fields[2]),
+                           subject=X509Name.decode(fields[4]),
+                           not_before=decode_time(validity.child(0)),
+                           not_after=decode_time(validity.child(1)))
+
+    def fingerprint(self, algorithm='sha256'):
+        """ Return the hex digest of the DER encoded certificate. """
+        return hashlib.new(algorithm, self.der).hexdigest()
+
+    def is_valid_at(self, when=None):
+        """ Return whether the certificate is valid at the given UTC datetime, now by default. """
+        when = when or datetime.utcnow()
+        return self.not_before <= when <= self.not_after
+
+    def to_text(self):
+        """ Return a readable description of the certificate, as a list of lines. """
+        lines = [u'Certificate:',
+                 u'    Version: {}'.format(self.version),
+                 u'    Serial Number: {0} (0x{0:x})'.format(self.serial_number),
+                 u'    Signature Algorithm: {}'.format(self.signature_algorithm),
+                 u'    Issuer: {}'.format(unicode(self.issuer)),
+                 u'    Validity',
+                 u'        Not Before: {} GMT'.format(self.not_before.strftime('%b %d %H:%M:%S %Y')),
+                 u'        Not After : {} GMT'.format(self.not_after.strftime('%b %d %H:%M:%S %Y')),
+                 u'    Subject: {}'.format(unicode(self.subject))]
+        for algorithm in ('md5', 'sha1', 'sha256'):
+            digest = self.fingerprint(algorithm).upper()
+            lines.append(u'    {} Fingerprint: {}'.format(algorithm.upper(),
+                                                          ':'.join(digest[i:i + 2] for i in range(0, len(digest), 2))))
+        return [line.encode('utf-8') for line in lines]
+
+
+class SignedData(object):
+    """ The certificates of a PKCS#7 SignedData block and the ones of its signers. """
+
+    def __init__(self, certificates, signers):
+        self.certificates = certificates
+        self.signers = signers
+
+    @staticmethod
+    def decode(data):
+        content_info = read_node(data, 0).expect(TAG_SEQUENCE)
+        if decode_oid(content_info.child(0)) != OID_SIGNED_DATA:
+            raise PKCS7Error('not a PKCS#7 SignedData block')
+
+        signed_data = content_info.child(1).expect(TAG_CONTEXT_0).child(0).expect(TAG_SEQUENCE)
+        certificates = []
+        signer_infos = []
+        for field in list(signed_data.children())[3:]:
+            if field.tag == TAG_CONTEXT_0:
+                certificates = [Certificate.decode(child) for child in field.children()]
+            elif field.tag == TAG_SET:
+                signer_infos = list(field.children())
+
+        signers = []
+        for signer_info in signer_infos:
+            issuer_and_serial = signer_info.expect(TAG_SEQUENCE).child(1).expect(TAG_SEQUENCE)
+            issuer = X509Name.decode(issuer_and_serial.child(0))
+            serial_number = decode_integer(issuer_and_serial.child(1))
+            signers.extend(certificate for certificate in certificates
+                           if certificate.issuer == issuer and certificate.serial_number == serial_number)
+        return SignedData(certificates, signers or certificates[:1])
+
+
+def load_pkcs7(data):
+    """
+        Parse a DER (or BER) encoded PKCS#7 SignedData block
+
+        :param data: the content of META-INF/*.RSA, *.DSA or *.EC
+        :rtype: SignedData
+    """
+    return SignedData.decode(data)
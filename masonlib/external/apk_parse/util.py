@@ -25,4 +25,12 @@ def read(filename, binary=True):
 def get_md5(buf):
     m = hashlib.md5()
     m.update(buf)
-    return m.hexdigest().lower()
\ No newline at end of file
+    return m.hexdigest().lower()
+
+
+def get_file_md5(filename, chunk_size=1 << 20):
+    m = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            m.update(chunk)
+    return m.hexdigest().lower()
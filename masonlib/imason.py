@@ -55,6 +55,19 @@ class IMason():
             :param binary: specify the path of the artifact file"""
         pass
 
+    @abstractmethod
+    def register_batch(self, item_type, binaries, jobs, resume=False):
+        """ Parse, upload and register many artifacts of the same type at once, returns true if every artifact was
+            registered, false otherwise. Parsing and hashing run in a worker pool, uploads run concurrently and each
+            artifact is registered as soon as its upload completes. A per artifact summary is printed at the end.
+
+            :param item_type: specify the artifact type, either 'apk' or 'config'
+            :param binaries: specify the paths of the artifact files
+            :param jobs: specify the maximum number of artifacts processed concurrently in each stage
+            :param resume: skip the work an interrupted run recorded as done in the local journal
+            :rtype: boolean"""
+        pass
+
     @abstractmethod
     def build(self, project, version):
         """ Public build method, returns true if build started, false otherwise
@@ -64,6 +77,16 @@ class IMason():
             :rtype: boolean"""
         pass
 
+    @abstractmethod
+    def build_and_wait(self, builds, timeout):
+        """ Start builds and wait for them to complete, returns one of the result codes of
+            masonlib.internal.builds: BUILD_SUCCEEDED, BUILD_NOT_STARTED, BUILD_FAILED or BUILD_TIMED_OUT.
+
+            :param builds: specify the (project, version) pairs to build
+            :param timeout: specify the number of seconds to wait for all builds to complete
+            :rtype: int"""
+        pass
+
     @abstractmethod
     def deploy(self, item_type, name, version, group, push):
         """ Public deploy method, returns true if item is deployed, false otherwise
@@ -76,6 +99,22 @@ class IMason():
             :rtype boolean"""
         pass
 
+    @abstractmethod
+    def deploy_batch(self, item_type, name, version, groups, push, jobs, resume=False):
+        """ Deploy one item to many groups at once, returns true if the item was deployed to every group, false
+            otherwise. Credentials and customer are resolved once, a single confirmation covers all groups and the
+            deploys are sent concurrently. A per group summary is printed at the end.
+
+            :param item_type: specify the item type to be deployed
+            :param name: specify the name of the item to be deployed
+            :param version: specify the version of the item to be deployed
+            :param groups: specify the groups to deploy the item to
+            :param push: whether to push the deploy to the devices in the groups
+            :param jobs: specify the maximum number of deploys sent concurrently
+            :param resume: skip the groups an interrupted run recorded as deployed in the local journal
+            :rtype boolean"""
+        pass
+
     @abstractmethod
     def stage(self, yaml):
         """ Public stage method, returns true if the configuration was staged, false otherwise.
@@ -85,6 +124,18 @@ class IMason():
             :rtype boolean"""
         pass
 
+    @abstractmethod
+    def apply(self, plan_yaml, jobs):
+        """ Public apply method, returns true if every step of the plan succeeded, false otherwise.
+            The plan lists artifacts to register, projects to build and items to deploy. Registers run before the
+            builds and deploys that need them, builds before the deploys of their configuration, and independent
+            steps run concurrently.
+
+            :param plan_yaml: The yaml file describing the plan
+            :param jobs: specify the maximum number of steps running at once
+            :rtype boolean"""
+        pass
+
     @abstractmethod
     def authenticate(self, user, password):
         """ Public authentication method, returns true if authed, false otherwise
@@ -99,3 +150,46 @@ class IMason():
         """ Public logout method, returns true if successfully logged out
             :rtype: boolean"""
         pass
+
+
+class IAsyncMason(IMason):
+    """ Mason interface for driving many operations at once. Every asynchronous method returns immediately with an
+        operation handle (see masonlib.internal.async_mason.Operation) which resolves to a BatchItem describing the
+        outcome. Operations never prompt for confirmation and can be cancelled until they complete.
+
+        :param config: A global config object detailing verbosity and extra functions."""
+
+    @abstractmethod
+    def register_async(self, item_type, binary):
+        """ Parse, upload and register a single artifact.
+
+            :param item_type: specify the artifact type, either 'apk' or 'config'
+            :param binary: specify the path of the artifact file
+            :rtype: Operation"""
+        pass
+
+    @abstractmethod
+    def build_async(self, project, version):
+        """ Start a build of a registered project.
+
+            :param project: specify the name of the project to start a build for
+            :param version: specify the version of the project for which to start a build for
+            :rtype: Operation"""
+        pass
+
+    @abstractmethod
+    def deploy_async(self, item_type, name, version, group, push):
+        """ Deploy an item to a group.
+
+            :param item_type: specify the item type to be deployed
+            :param name: specify the name of the item to be deployed
+            :param version: specify the version of the item to be deployed
+            :param group: specify the group to deploy the item to
+            :param push: whether to push the deploy to the devices in the group
+            :rtype: Operation"""
+        pass
+
+    @abstractmethod
+    def close(self):
+        """ Wait for every submitted operation to complete and release the workers. """
+        pass
@@ -1,9 +1,10 @@
 import os
-import re
 
 from masonlib.external.apk_parse.apk import APK
 from masonlib.internal.artifacts import IArtifact
 
+ANDROID_DEBUG_CN = 'Android Debug'
+
 
 class Apk(IArtifact):
     def __init__(self, apkf):
@@ -13,35 +14,31 @@ class Apk(IArtifact):
         self.details = self.apkf.cert_text
 
     @staticmethod
-    def parse(config, apk):
+    def parse(config, apk, cache=None, sha1=None):
         if not os.path.isfile(apk):
             print 'No file provided'
             return None
 
-        apk_abs = APK(apk)
-        apkf = Apk(apk_abs)
+        cached = cache.get(apk, sha1) if cache else None
+        if cached is not None:
+            apkf = Apk(ApkSummary(apk, cached))
+        else:
+            apkf = Apk(APK(apk))
+            if cache and sha1:
+                cache.put(apk, sha1, ApkSummary.from_artifact(apkf).to_dict())
 
         # Bail on non valid apk
-        if not apkf or not apkf.is_valid():
+        if not apkf.is_valid():
             return None
 
         # Check for 'Android Debug' CN for the given artifact, disallow upload
-        for line in apkf.details:
-            if re.search('Subject:', line) or re.search('Owner:', line):
-                if re.search('Android Debug', line):
-                    print '\n----------- ERROR -----------\n' \
-                          'Not allowing android debug key signed apk. \n' \
-                          'Please sign the APK with your release keys \n' \
-                          'before attempting to upload.               \n' \
-                          '-----------------------------\n'
-                    return None
-            elif re.search('Not a signed jar file', line):
-                print '\n----------- ERROR -----------\n' \
-                    'No certificate was detected in your APK. \n' \
-                    'Please sign the APK with your release keys \n' \
-                    'before attempting to upload.               \n' \
-                    '-----------------------------\n'
-                return None
+        if apkf.is_debug_signed():
+            print '\n----------- ERROR -----------\n' \
+                  'Not allowing android debug key signed apk. \n' \
+                  'Please sign the APK with your release keys \n' \
+                  'before attempting to upload.               \n' \
+                  '-----------------------------\n'
+            return None
 
         print '------------ APK ------------'
         print 'File Name: {}'.format(apk)
@@ -50,51 +47,78 @@ class Apk(IArtifact):
         print 'Version Name: {}'.format(apkf.apkf.get_androidversion_name())
         print 'Version Code: {}'.format(apkf.apkf.get_androidversion_code())
         if config.verbose:
+            print 'App Name: {}'.format((ApkSummary._get_app_name(apkf.apkf) or u'').encode('utf-8'))
             for line in apkf.details:
                 print line
         print '-----------------------------'
         return apkf
 
     def is_valid(self):
+        error = self.get_validation_error()
+        if error:
+            print error
+            return False
+        return True
+
+    def get_validation_error(self):
+        """ Returns why the APK can't be registered, None if it can. """
+        if isinstance(self.apkf, ApkSummary):
+            return self.apkf.error
+
         try:
             value = int(self.version)
             if value > 2147483647:
                 raise ValueError('The apk versionCode cannot be larger than MAX_INT (2147483647)')
         except ValueError as err:
-            print "Error in configuration file: {}".format(err)
-            return False
+            return "Error in configuration file: {}".format(err)
 
         # TODO: Move this entire validation to service side.
         # if not parsed well by apk_parse
         if not self.apkf.is_valid_APK():
-            print "Not a valid APK, only APK's are currently supported"
-            return False
+            return "Not a valid APK, only APK's are currently supported"
 
         # We don't support anything higher than Marshmallow as a min right now
         if int(self.apkf.get_min_sdk_version()) > 23:
-            print '\n----------- ERROR -----------\n' \
-                  "File Name: {}\n" \
-                  "Details:\n" \
-                  "  Mason Platform does not currently support applications with a minimum sdk\n" \
-                  "  greater than 23 (Marshmallow). Please lower the minimum sdk value in your\n" \
-                  "  manifest or gradle file.\n" \
+            return '\n----------- ERROR -----------\n' \
+                   "File Name: {}\n" \
+                   "Details:\n" \
+                   "  Mason Platform does not currently support applications with a minimum sdk\n" \
+                   "  greater than 23 (Marshmallow). Please lower the minimum sdk value in your\n" \
+                   "  manifest or gradle file.\n" \
                    '-----------------------------\n'.format(self.apkf.filename)
-            return False
 
-        # We can safely assume since this cert wasn't provided that we're dealing with a v2 signed apk.
-        if not self.apkf.cert_text:
-            print '\n----------- ERROR -----------\n' \
-                  "File Name: {}\n" \
-                  "Details:\n" \
-                  "  Mason Platform does not currently support v2 signing scheme for APK's.\n" \
-                  "  Full Apk (v2) signing is included for Nougat devices and an option in \n" \
-                  "  Android Studio 2.3+. Please select to either sign the APK with both v1 \n" \
-                  "  (Jar Signature) and v2 (Full APK Signature) or v1 alone. For further\n" \
-                  "  details reference https://source.android.com/security/apksigning/index.html#\n" \
-                  '-----------------------------\n'.format(self.apkf.filename)
-            return False
+        if self.apkf.get_certificate_error():
+            return '\n----------- ERROR -----------\n' \
+                   "File Name: {}\n" \
+                   "Details:\n" \
+                   "  Unable to read the signature of your APK ({}).\n" \
+                   '-----------------------------\n'.format(self.apkf.filename, self.apkf.get_certificate_error())
+
+        if not self.apkf.get_certificates() and not self.apkf.is_signed_v2():
+            return '\n----------- ERROR -----------\n' \
+                   'No certificate was detected in your APK. \n' \
+                   'Please sign the APK with your release keys \n' \
+                   'before attempting to upload.               \n' \
+                   '-----------------------------\n'
+
+        # Signed, but without a v1 signature, so we're dealing with a v2 only signed apk.
+        if not self.apkf.get_certificates():
+            return '\n----------- ERROR -----------\n' \
+                   "File Name: {}\n" \
+                   "Details:\n" \
+                   "  Mason Platform does not currently support v2 signing scheme for APK's.\n" \
+                   "  Full Apk (v2) signing is included for Nougat devices and an option in \n" \
+                   "  Android Studio 2.3+. Please select to either sign the APK with both v1 \n" \
+                   "  (Jar Signature) and v2 (Full APK Signature) or v1 alone. For further\n" \
+                   "  details reference https://source.android.com/security/apksigning/index.html#\n" \
+                   '-----------------------------\n'.format(self.apkf.filename)
 
-        return True
+        return None
+
+    def is_debug_signed(self):
+        if isinstance(self.apkf, ApkSummary):
+            return self.apkf.debug_signed
+        return any(certificate.subject.common_name == ANDROID_DEBUG_CN for certificate in self.apkf.get_certificates())
 
     def get_content_type(self):
         return 'application/vnd.android.package-archive'
@@ -123,3 +147,81 @@ class Apk(IArtifact):
 
     def get_details(self):
         return self.details
+
+
+class ApkSummary(object):
+    """ What parsing an APK taught us, small enough to be cached between runs. Answers the APK accessors Apk relies
+        on, so a cached APK is registered without being parsed again.
+
+        :param filename: path of the APK
+        :param data: the summary, as returned by to_dict"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.package = data['package']
+        self.version_code = data['version_code']
+        self.version_name = data['version_name']
+        self.min_sdk_version = data['min_sdk_version']
+        self.app_name = data['app_name']
+        self.signers = data['signers']
+        self.cert_text = data['cert_text']
+        self.debug_signed = data['debug_signed']
+        self.error = data['error']
+        if self.error and data['filename'] != filename:
+            # The same content cached under another path
+            self.error = self.error.replace(data['filename'], filename)
+
+    @staticmethod
+    def from_artifact(apk):
+        """ Summarizes a parsed APK.
+
+            :param apk: the Apk wrapping the parsed APK"""
+        return ApkSummary(apk.apkf.filename, {
+            'filename': apk.apkf.filename,
+            'package': apk.apkf.package,
+            'version_code': apk.apkf.get_androidversion_code(),
+            'version_name': apk.apkf.get_androidversion_name(),
+            'min_sdk_version': apk.apkf.get_min_sdk_version(),
+            'app_name': ApkSummary._get_app_name(apk.apkf),
+            'signers': [{'subject': unicode(certificate.subject),
+                         'sha256': certificate.fingerprint('sha256'),
+                         'not_after': certificate.not_after.isoformat()}
+                        for certificate in apk.apkf.get_certificates()],
+            'cert_text': apk.apkf.cert_text,
+            'debug_signed': apk.is_debug_signed(),
+            'error': apk.get_validation_error(),
+        })
+
+    @staticmethod
+    def _get_app_name(apkf):
+        # Only informational, a broken resources table mustn't fail the registration
+        try:
+            return apkf.get_app_name()
+        except Exception:
+            return None
+
+    def to_dict(self):
+        return {
+            'filename': self.filename,
+            'package': self.package,
+            'version_code': self.version_code,
+            'version_name': self.version_name,
+            'min_sdk_version': self.min_sdk_version,
+            'app_name': self.app_name,
+            'signers': self.signers,
+            'cert_text': self.cert_text,
+            'debug_signed': self.debug_signed,
+            'error': self.error,
+        }
+
+    def get_androidversion_code(self):
+        return self.version_code
+
+    def get_androidversion_name(self):
+        return self.version_name
+
+    def get_min_sdk_version(self):
+        return self.min_sdk_version
+
+    def get_app_name(self):
+        return self.app_name
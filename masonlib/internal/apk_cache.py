@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import tempfile
+
+CACHE_VERSION = 1
+DEFAULT_MAX_SIZE = 8 << 20
+ENTRY_SUFFIX = '.json'
+TMP_PREFIX = '.tmp-'
+
+
+class ApkCache(object):
+    """ On disk cache of what was learned parsing APKs, shared by every mason process of the machine. A file is
+        looked up by its size, mtime and inode first, then by the SHA1 of its content so copies of the same APK, ex.
+        in another checkout, hit the cache too. The SHA1 is the one computed to register the file, the cache never
+        reads the file itself. Every entry is its own file replaced atomically, so concurrent
+        processes never see a partial entry, and the least recently used entries are evicted once the cache grows
+        over `max_size` bytes.
+
+        :param directory: directory holding the cache entries
+        :param max_size: size in bytes the cache is trimmed to"""
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def get(self, filename, sha1=None):
+        """ Returns the data cached for the given file, None if there is none.
+
+            :param sha1: hex SHA1 of the file, when known a copy of a cached file hits the cache too"""
+        try:
+            stat_key = self._stat_key(filename)
+            content_key = self._read(stat_key)
+            data = self._read(content_key) if content_key else None
+            if data is None and sha1:
+                content_key = self._content_key(sha1)
+                data = self._read(content_key)
+                if data is not None:
+                    self._write(stat_key, content_key)
+            return data
+        except (IOError, OSError):
+            return None
+
+    def put(self, filename, sha1, data):
+        """ Caches the given JSON serializable data for the file. Failing to write the cache isn't an error.
+
+            :param sha1: hex SHA1 of the file"""
+        try:
+            stat_key = self._stat_key(filename)
+            content_key = self._content_key(sha1)
+            self._write(content_key, data)
+            self._write(stat_key, content_key)
+            self._evict()
+        except (IOError, OSError):
+            pass
+
+    @staticmethod
+    def _stat_key(filename):
+        stat = os.stat(filename)
+        key = '{}:{}:{}:{!r}'.format(stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+        return 'stat-' + hashlib.sha1(key).hexdigest()
+
+    @staticmethod
+    def _content_key(sha1):
+        return 'sha1-' + sha1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as entry_file:
+                entry = json.load(entry_file)
+            # Entries are evicted least recently used first
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION:
+            return None
+        return entry.get('data')
+
+    def _write(self, key, data):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        fd, tmp_file = tempfile.mkstemp(prefix=TMP_PREFIX, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as entry_file:
+                json.dump({'version': CACHE_VERSION, 'data': data}, entry_file)
+            os.rename(tmp_file, self._path(key))
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX) or name.startswith(TMP_PREFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            size -= entry_size
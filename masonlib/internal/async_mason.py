@@ -0,0 +1,189 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+from masonlib.imason import IAsyncMason
+from masonlib.internal.batch import BatchItem, RegisterItem
+from masonlib.internal.mason import Mason
+
+DEFAULT_WORKERS = 16
+DEFAULT_ENDPOINT_LIMITS = {
+    'user_info': 1,
+    'signed_url': 8,
+    'upload': 4,
+    'registry': 8,
+    'builder': 4,
+    'deploy': 16,
+}
+
+
+class Cancelled(Exception):
+    """ The operation was cancelled before it completed. """
+
+
+class Operation(object):
+    """ Handle of an operation submitted to AsyncMason.
+
+        :param label: human readable identifier of the operation"""
+
+    def __init__(self, label):
+        self.label = label
+        self._cancelled = threading.Event()
+        self._async_result = None
+
+    def cancel(self):
+        """ Request cancellation. Takes effect before the next request the operation makes. """
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def ready(self):
+        return self._async_result.ready()
+
+    def wait(self, timeout=None):
+        self._async_result.wait(timeout)
+        return self.ready()
+
+    def result(self, timeout=None):
+        """ Wait for the operation and return the BatchItem describing its outcome. """
+        return self._async_result.get(timeout)
+
+
+class LimitedSession(object):
+    """ Wraps the shared Session to bound the number of in flight requests per platform endpoint, and to abort
+        requests made on behalf of a cancelled operation.
+
+        :param session: the shared Session
+        :param store: the Store holding the platform endpoints
+        :param limits: maximum number of concurrent requests per endpoint"""
+
+    def __init__(self, session, store, limits):
+        self.session = session
+        self.store = store
+        self._semaphores = dict((endpoint, threading.BoundedSemaphore(limit)) for endpoint, limit in limits.items())
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def bind(self, operation):
+        self._local.operation = operation
+
+    def _endpoint(self, url):
+        endpoints = [('user_info', self.store.user_info_url()),
+                     ('signed_url', self.store.registry_signer_url()),
+                     ('registry', self.store.registry_artifact_url()),
+                     ('builder', self.store.builder_url()),
+                     ('deploy', self.store.deploy_url())]
+        for endpoint, prefix in endpoints:
+            if prefix and url.startswith(prefix):
+                return endpoint
+        # Anything else is a signed storage url
+        return 'upload'
+
+    def request(self, method, url, **kwargs):
+        operation = getattr(self._local, 'operation', None)
+        if operation and operation.cancelled():
+            raise Cancelled('{} was cancelled'.format(operation.label))
+
+        semaphore = self._semaphores.get(self._endpoint(url))
+        if not semaphore:
+            return self.session.request(method, url, **kwargs)
+        with semaphore:
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+
+class AsyncMason(Mason, IAsyncMason):
+    """ IMason implementation running register, build and deploy operations concurrently on a fixed pool of
+        workers, so thousands of operations can be queued without a thread each. Requests to every platform
+        endpoint are limited separately and credentials and customer are resolved once for all operations."""
+
+    def __init__(self, config, workers=DEFAULT_WORKERS, limits=None):
+        super(AsyncMason, self).__init__(config)
+        endpoint_limits = dict(DEFAULT_ENDPOINT_LIMITS)
+        endpoint_limits.update(limits or {})
+        self.session = LimitedSession(self.session, self.store, endpoint_limits)
+        self._pool = ThreadPool(workers)
+        self._customer = None
+        self._customer_lock = threading.Lock()
+
+    def _resolve_customer(self):
+        with self._customer_lock:
+            if not self._customer:
+                if not self._validate_credentials():
+                    raise ValueError('not logged in')
+                self._customer = self._get_customer()
+                if not self._customer:
+                    raise ValueError('could not retrieve customer information')
+            return self._customer
+
+    def _submit(self, label, work):
+        operation = Operation(label)
+
+        def run():
+            item = BatchItem(label)
+            if operation.cancelled():
+                return item.fail('cancelled')
+            self.session.bind(operation)
+            try:
+                return work(item)
+            except Cancelled:
+                return item.fail('cancelled')
+            except Exception as err:
+                return item.fail(str(err))
+            finally:
+                self.session.bind(None)
+
+        operation._async_result = self._pool.apply_async(run)
+        return operation
+
+    def register_async(self, item_type, binary):
+        parser = self._get_parser(item_type)
+
+        def work(item):
+            if not parser:
+                return item.fail('unsupported register type {}'.format(item_type))
+            customer = self._resolve_customer()
+            register_item = RegisterItem(binary)
+            self._prepare_batch_item(parser, register_item)
+            self._upload_batch_item(customer, register_item)
+            if register_item.ok and register_item.status == 'uploaded':
+                self._register_batch_item(customer, register_item)
+            return register_item
+
+        return self._submit(binary, work)
+
+    def build_async(self, project, version):
+        def work(item):
+            self._resolve_customer()
+            if not self._build_project(project, version):
+                return item.fail('build rejected')
+            return item.succeed('queued')
+
+        return self._submit('{}:{}'.format(project, version), work)
+
+    def deploy_async(self, item_type, name, version, group, push):
+        def work(item):
+            if item_type not in ('apk', 'config', 'ota'):
+                return item.fail('unsupported deploy type {}'.format(item_type))
+            customer = self._resolve_customer()
+            deploy_name = 'mason-os' if item_type == 'ota' else name
+            payload = self._get_deploy_payload(customer, group, deploy_name, version, item_type, push)
+            if not self._post_deploy(payload):
+                return item.fail('deploy rejected')
+            return item.succeed('deployed {}:{}'.format(deploy_name, version))
+
+        return self._submit(group, work)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,56 @@
+from masonlib.internal.utils import print_err, print_msg
+
+
+class BatchItem(object):
+    """ Tracks a single unit of work (an artifact to register, a group to deploy to) within a batch operation.
+
+        :param label: human readable identifier used when reporting the outcome"""
+
+    def __init__(self, label):
+        self.label = label
+        self.status = 'pending'
+        self.error = None
+        self.journal_key = None
+
+    def succeed(self, status):
+        self.status = status
+        return self
+
+    def fail(self, error):
+        self.status = 'failed'
+        self.error = error
+        return self
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class RegisterItem(BatchItem):
+    """ A single artifact flowing through the batch register pipeline.
+
+        :param binary: path of the artifact file"""
+
+    def __init__(self, binary):
+        super(RegisterItem, self).__init__(binary)
+        self.binary = binary
+        self.artifact = None
+        self.digests = None
+        self.download_url = None
+
+
+def print_summary(config, title, items):
+    """
+    Print a per item report of a batch operation.
+    :param config: Global config object
+    :param title: Name of the batch operation, ex. 'REGISTER'
+    :param items: The BatchItem's making up the batch
+    """
+    print '---------- {} SUMMARY ----------'.format(title)
+    for item in items:
+        if item.ok:
+            print_msg(config, '{}: {}'.format(item.label, item.status))
+        else:
+            print_err(config, '{}: failed ({})'.format(item.label, item.error))
+    failed = len([item for item in items if not item.ok])
+    print '{} succeeded, {} failed'.format(len(items) - failed, failed)
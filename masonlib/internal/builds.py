@@ -0,0 +1,175 @@
+import json
+import time
+
+from masonlib.internal.batch import BatchItem
+
+BUILD_SUCCEEDED = 0
+BUILD_NOT_STARTED = 1
+BUILD_FAILED = 2
+BUILD_TIMED_OUT = 3
+
+SUCCESS_STATUSES = ('success', 'succeeded', 'complete', 'completed', 'done')
+FAILURE_STATUSES = ('failed', 'failure', 'error', 'errored', 'cancelled', 'canceled')
+
+DEFAULT_WAIT_TIMEOUT = 60 * 60
+MIN_POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 30
+POLL_BACKOFF = 1.5
+
+
+class BuildJob(BatchItem):
+    """ A queued build being tracked until it completes.
+
+        :param project: name of the project being built
+        :param version: version of the project being built
+        :param status_url: url reporting the status of the build job
+        :param job_id: id of the build job on the builder"""
+
+    def __init__(self, project, version, status_url, job_id=None):
+        super(BuildJob, self).__init__('{}:{}'.format(project, version))
+        self.project = project
+        self.version = version
+        self.status_url = status_url
+        self.job_id = job_id
+        self.status = 'queued'
+        self.etag = None
+        self.interval = MIN_POLL_INTERVAL
+        self.next_poll = 0
+        self.done = False
+
+    @staticmethod
+    def get_job_id(response_text):
+        try:
+            data = json.loads(response_text)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict):
+            return None
+        if isinstance(data.get('data'), dict):
+            data = data['data']
+        return data.get('id') or data.get('jobId')
+
+
+class BuildWaiter(object):
+    """ Tracks many build jobs at once from a single thread over the shared session. Every job is polled with
+        its own adaptive interval: the interval grows while the status doesn't change and resets when it does.
+        Conditional requests are used when the builder returns an ETag, so an unchanged status costs no body.
+        A job the builder doesn't know fails right away, as does one the status requests aren't authorized for once
+        the credentials can't be renewed.
+
+        :param session: the shared Session
+        :param headers: headers authorizing the status requests
+        :param timeout: seconds to wait for all jobs before giving up
+        :param renew_headers: called when the status requests are rejected, returns headers authorizing them with
+                              renewed credentials or None if the credentials couldn't be renewed"""
+
+    def __init__(self, session, headers, timeout=DEFAULT_WAIT_TIMEOUT, min_interval=None, max_interval=None,
+                 renew_headers=None):
+        self.session = session
+        self.headers = headers
+        self.renew_headers = renew_headers
+        self.timeout = timeout
+        self.min_interval = min_interval or MIN_POLL_INTERVAL
+        self.max_interval = max_interval or MAX_POLL_INTERVAL
+
+    def wait(self, jobs):
+        """ Wait for the given BuildJob's, returns one of the BUILD_* result codes. """
+        deadline = time.time() + self.timeout
+        for job in jobs:
+            job.interval = self.min_interval
+            job.next_poll = time.time() + self.min_interval
+
+        while True:
+            pending = [job for job in jobs if not job.done]
+            if not pending:
+                break
+
+            now = time.time()
+            if now >= deadline:
+                for job in pending:
+                    job.fail('timed out while {}'.format(job.status))
+                return BUILD_TIMED_OUT
+
+            next_poll = min(job.next_poll for job in pending)
+            if next_poll > now:
+                time.sleep(min(next_poll, deadline) - now)
+                continue
+
+            for job in pending:
+                if job.next_poll <= time.time():
+                    self._poll(job)
+
+        if all(job.ok for job in jobs):
+            return BUILD_SUCCEEDED
+        return BUILD_FAILED
+
+    def _poll(self, job):
+        headers = dict(self.headers)
+        if job.etag:
+            headers['If-None-Match'] = job.etag
+
+        changed = False
+        try:
+            r = self.session.get(job.status_url, headers=headers)
+        except Exception as err:
+            print 'Unable to get status of build {}: {}'.format(job.label, err)
+            r = None
+
+        if r is not None and r.status_code == 200:
+            job.etag = r.headers.get('ETag')
+            status = self._get_status(r.text)
+            if status and status != job.status:
+                changed = True
+                print 'Build {}: {}'.format(job.label, status)
+                job.status = status
+            if status in SUCCESS_STATUSES:
+                job.succeed(status)
+                job.done = True
+            elif status in FAILURE_STATUSES:
+                job.fail(status)
+                job.done = True
+        elif r is not None and r.status_code == 404:
+            job.fail('job not found')
+            job.done = True
+        elif r is not None and r.status_code in (401, 403):
+            changed = self._renew_headers(job, r.status_code)
+        elif r is not None and r.status_code != 304:
+            print 'Unable to get status of build {}: {}'.format(job.label, r.status_code)
+
+        # Poll quickly while things are moving, back off while they aren't
+        if changed:
+            job.interval = self.min_interval
+        else:
+            job.interval = min(self.max_interval, job.interval * POLL_BACKOFF)
+        retry_after = r is not None and r.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            job.interval = max(job.interval, float(retry_after))
+        job.next_poll = time.time() + job.interval
+
+    def _renew_headers(self, job, status_code):
+        """ Returns true if the status of the job can be requested again with renewed credentials, fails the job
+            otherwise. """
+        headers = self.renew_headers() if self.renew_headers else self.headers
+        if headers is None:
+            job.fail('session expired')
+        elif headers == self.headers:
+            # Nothing changed, asking again would be rejected again
+            job.fail('not authorized ({})'.format(status_code))
+        else:
+            self.headers = headers
+            return True
+        job.done = True
+        return False
+
+    @staticmethod
+    def _get_status(response_text):
+        try:
+            data = json.loads(response_text)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict):
+            return None
+        if isinstance(data.get('data'), dict):
+            data = data['data']
+        status = data.get('status') or data.get('state')
+        return str(status).lower() if status else None
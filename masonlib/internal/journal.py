@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only the threads of this process are kept in order
+    fcntl = None
+
+STALE_AFTER = 7 * 24 * 60 * 60
+
+
+class Journal(object):
+    """ Append only, crash safe record of the phases every operation of a batch went through, so an interrupted
+        batch can be resumed where it stopped. Every entry is a JSON line flushed to disk before the next phase
+        starts, a torn last line left by a crash is ignored. Appending and rewriting the journal hold a lock on a
+        sibling lock file, so concurrent mason processes can share it.
+
+        :param file_path: path of the journal file
+        :param stale_after: seconds after which the entries of an operation that wasn't resumed are dropped"""
+
+    def __init__(self, file_path, stale_after=STALE_AFTER):
+        self.file = file_path
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+
+    def load(self):
+        """ Returns the latest state of every operation in the journal: the data of all its entries merged, with
+            'phase' being the last phase it reached. """
+        state = {}
+        if not os.path.isfile(self.file):
+            return state
+
+        with open(self.file) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                    key = entry.pop('key')
+                except (KeyError, ValueError):
+                    continue
+                state.setdefault(key, {}).update(entry)
+        return state
+
+    def record(self, key, phase, **data):
+        entry = dict(data)
+        entry.update({'key': key, 'phase': phase, 'time': time.time()})
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._locked():
+            with open(self.file, 'a+') as journal_file:
+                journal_file.seek(0, os.SEEK_END)
+                if journal_file.tell():
+                    # Don't extend a line torn by a crash
+                    journal_file.seek(-1, os.SEEK_END)
+                    if journal_file.read(1) != '\n':
+                        line = '\n' + line
+                    journal_file.seek(0, os.SEEK_END)
+                journal_file.write(line)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def complete(self, keys):
+        """ Drop the entries of operations that no longer need to be resumed, along with the stale ones. """
+        self._rewrite(set(keys))
+
+    def prune(self):
+        """ Drop the entries of operations that weren't resumed for `stale_after` seconds. """
+        self._rewrite(set())
+
+    def _rewrite(self, keys):
+        with self._locked():
+            if not os.path.isfile(self.file):
+                return
+            with open(self.file) as journal_file:
+                entries = [(self._parse(line), line) for line in journal_file]
+
+            last_update = {}
+            for entry, _ in entries:
+                if entry:
+                    last_update[entry['key']] = max(last_update.get(entry['key'], 0), entry.get('time', 0))
+            stale = set(key for key, updated in last_update.items() if updated < time.time() - self.stale_after)
+            lines = [line for entry, line in entries if entry and entry['key'] not in keys | stale]
+            if len(lines) == len(entries):
+                return
+
+            # Replaced in one step, a crash leaves either the previous journal or the new one
+            fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(self.file) + '.',
+                                            dir=os.path.dirname(self.file) or '.')
+            try:
+                with os.fdopen(fd, 'w') as journal_file:
+                    journal_file.writelines(line if line.endswith('\n') else line + '\n' for line in lines)
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+                os.rename(tmp_file, self.file)
+            except Exception:
+                os.remove(tmp_file)
+                raise
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            directory = os.path.dirname(self.file)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.file + '.lock', 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    @staticmethod
+    def _parse(line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(entry, dict) or 'key' not in entry:
+            return None
+        return entry
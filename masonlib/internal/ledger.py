@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where only the threads of this process are kept in order
+    fcntl = None
+
+
+class Ledger(object):
+    """ Local content addressed record of the artifacts this machine has registered, keyed by their SHA1. Recording
+        holds a lock on a sibling lock file and merges the entries written meanwhile by other mason processes.
+
+        :param file_path: path of the ledger file"""
+
+    def __init__(self, file_path):
+        self.file = file_path
+        self.data = self._load_stored_data()
+        self._lock = threading.Lock()
+
+    def _load_stored_data(self):
+        if not os.path.isfile(self.file):
+            return {}
+
+        with open(self.file) as data_file:
+            try:
+                data = json.load(data_file)
+            except ValueError:
+                return {}
+        return data if isinstance(data, dict) else {}
+
+    def reload(self):
+        self.data = self._load_stored_data()
+
+    @staticmethod
+    def _key(customer, artifact_data):
+        return '/'.join([customer, artifact_data.get_type(), str(artifact_data.get_name()),
+                         str(artifact_data.get_version())])
+
+    def contains(self, customer, artifact_data, sha1):
+        return self._key(customer, artifact_data) in self.data.get(sha1, [])
+
+    def record(self, customer, artifact_data, sha1):
+        """ Records the artifact as registered. Failing to write the ledger isn't an error, the artifact is only
+            checked against the server again next time.
+
+            :return: True if the ledger was saved"""
+        with self._lock:
+            entries = self.data.setdefault(sha1, [])
+            key = self._key(customer, artifact_data)
+            if key not in entries:
+                entries.append(key)
+            try:
+                with self._locked():
+                    self._merge(self._load_stored_data())
+                    self._save()
+            except (IOError, OSError):
+                return False
+            return True
+
+    def _merge(self, data):
+        for sha1, keys in data.items():
+            entries = self.data.setdefault(sha1, [])
+            entries.extend(key for key in keys if key not in entries)
+
+    def _save(self):
+        # Replaced in one step, a crash leaves either the previous ledger or the new one
+        fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(self.file) + '.',
+                                        dir=os.path.dirname(self.file) or '.')
+        try:
+            with os.fdopen(fd, 'w') as outfile:
+                json.dump(self.data, outfile)
+            os.rename(tmp_file, self.file)
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    @contextmanager
+    def _locked(self):
+        directory = os.path.dirname(self.file)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.file + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
@@ -1,18 +1,42 @@
 import base64
+import hashlib
 import json
 import os.path
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
+from urllib import urlencode
 from urlparse import urlparse
 
 import requests
-from tqdm import tqdm
 
 from masonlib.imason import IMason
 from masonlib.internal.apk import Apk
+from masonlib.internal.apk_cache import ApkCache
+from masonlib.internal.batch import BatchItem, RegisterItem, print_summary
+from masonlib.internal.builds import BUILD_NOT_STARTED, BUILD_SUCCEEDED, BUILD_TIMED_OUT, DEFAULT_WAIT_TIMEOUT, \
+    BuildJob, BuildWaiter
+from masonlib.internal.journal import Journal
+from masonlib.internal.ledger import Ledger
 from masonlib.internal.media import Media
+from masonlib.internal.metrics import Metrics
+from masonlib.internal.multipart import MULTIPART_THRESHOLD, PART_SIZE, MultipartUpload, PartManifest
 from masonlib.internal.os_config import OSConfig
 from masonlib.internal.persist import Persist
+from masonlib.internal.plan import Plan, PlanNode, execute_graph
+from masonlib.internal.scheduler import UploadScheduler
+from masonlib.internal.session import Session
 from masonlib.internal.store import Store
-from masonlib.internal.utils import hash_file, print_err, format_errors
+from masonlib.internal.upload import UploadBody
+from masonlib.internal.utils import FileDigests, capture_output, digest_file, print_err, format_errors
+
+REGISTERED = 'registered'
+CONFLICT = 'conflict'
+# Tokens expiring sooner than this are refreshed before starting any work with them
+TOKEN_REFRESH_MARGIN = 5 * 60
+AUTH_DEVICE = 'mason-cli'
 
 
 class Mason(IMason):
@@ -23,8 +47,23 @@ class Mason(IMason):
         self.id_token = None
         self.access_token = None
         self.artifact = None
+        self.artifact_digests = None
+        self._output_lock = threading.Lock()
+        self._credentials_lock = threading.Lock()
         self.persist = Persist('.masonrc')
         self.store = Store(os.path.join(os.path.expanduser('~'), '.mason.yml'))
+        self.ledger = Ledger(os.path.join(os.path.expanduser('~'), '.mason', 'registered.json'))
+        self.journal = Journal(os.path.join(os.path.expanduser('~'), '.mason', 'journal.jsonl'))
+        self.apk_cache = ApkCache(os.path.join(os.path.expanduser('~'), '.mason', 'apk_cache'))
+        self.metrics = Metrics()
+        self.session = Session(pool_connections=getattr(config, 'pool_connections', None),
+                               pool_maxsize=getattr(config, 'pool_maxsize', None),
+                               read_timeout=getattr(config, 'timeout', None),
+                               retries=getattr(config, 'retries', None),
+                               on_retry=self._report_attempt)
+        self.session.set_deadline(getattr(config, 'deadline', None))
+        max_bandwidth = getattr(config, 'max_bandwidth', None)
+        self.uploads = UploadScheduler(max_bandwidth=max_bandwidth and int(max_bandwidth * (1 << 20)))
 
     def set_access_token(self, access_token):
         self.access_token = access_token
@@ -39,33 +78,95 @@ class Mason(IMason):
         if not self.id_token or not self.access_token:
             print 'Please run \'mason login\' first'
             return False
+        return self._renew_credentials()
+
+    def _renew_credentials(self):
+        """ Refresh the tokens when they are about to expire, so no work is started (or carried on) with tokens
+            that will be rejected. Returns false if the tokens expired and could not be refreshed. """
+        with self._credentials_lock:
+            expiry = self.persist.retrieve_token_expiry()
+            if expiry is None or expiry - time.time() > TOKEN_REFRESH_MARGIN:
+                return True
+            if self._refresh_tokens():
+                return True
+            if expiry <= time.time():
+                print 'Your session has expired, please run \'mason login\' again'
+                return False
+            print 'Your session expires in {} seconds, run \'mason login\' to renew it'.format(
+                int(expiry - time.time()))
+            return True
+
+    def _refresh_tokens(self):
+        refresh_token = self.persist.retrieve_refresh_token()
+        if not refresh_token:
+            return False
+
+        try:
+            r = self.session.post(self._get_token_url(), json=self._get_refresh_payload(refresh_token))
+        except requests.RequestException as err:
+            self._report_request_error('Unable to refresh session', err)
+            return False
+        if r.status_code != 200:
+            if self.config.debug:
+                print 'Unable to refresh session: {}'.format(r.status_code)
+            return False
+
+        try:
+            data = json.loads(r.text)
+        except ValueError:
+            return False
+        if not data.get('id_token'):
+            return False
+        self.persist.update_tokens(data)
+        self.id_token = self.persist.retrieve_id_token()
+        self.access_token = self.persist.retrieve_access_token()
         return True
 
+    def _get_token_url(self):
+        return urlparse(self.store.auth_url())._replace(path='/oauth/token', query='').geturl()
+
+    def _get_refresh_payload(self, refresh_token):
+        return {'client_id': self.store.client_id(),
+                'grant_type': 'refresh_token',
+                'refresh_token': refresh_token,
+                'scope': 'openid'}
+
     def parse_apk(self, apk):
-        apk = Apk.parse(self.config, apk)
+        # Hashed first, the digests both look the APK up in the cache and register it
+        digests = self._digest_file(apk) if os.path.isfile(apk) else None
+        with self.metrics.span('parse', artifact=apk) as span:
+            artifact = self._parse_apk(self.config, apk, digests)
+            span.ok = bool(artifact)
 
-        if not apk:
+        if not artifact:
             return False
 
-        self.artifact = apk
+        self.artifact = artifact
+        self.artifact_digests = digests
         return True
 
     def parse_media(self, name, type, version, binary):
-        media = Media.parse(self.config, name, type, version, binary)
+        with self.metrics.span('parse', artifact=binary) as span:
+            media = Media.parse(self.config, name, type, version, binary)
+            span.ok = bool(media)
 
         if not media:
             return False
 
         self.artifact = media
+        self.artifact_digests = None
         return True
 
     def parse_os_config(self, config_yaml):
-        os_config = OSConfig.parse(self.config, config_yaml)
+        with self.metrics.span('parse', artifact=config_yaml) as span:
+            os_config = OSConfig.parse(self.config, config_yaml)
+            span.ok = bool(os_config)
 
         if not os_config:
             return False
 
         self.artifact = os_config
+        self.artifact_digests = None
         return True
 
     def register(self, binary):
@@ -80,47 +181,299 @@ class Mason(IMason):
         else:
             return True
 
+    def register_batch(self, item_type, binaries, jobs, resume=False):
+        parser = self._get_parser(item_type)
+        if not parser:
+            print 'Unsupported register type {}'.format(item_type)
+            return False
+
+        if not self._validate_credentials():
+            return False
+
+        customer = self._get_customer()
+        if not customer:
+            print 'Could not retrieve customer information'
+            return False
+
+        jobs = max(1, int(jobs))
+        self.uploads.set_concurrency(jobs)
+        items = [RegisterItem(binary) for binary in binaries]
+        # Small artifacts go first, so a large one doesn't hold up everything behind it
+        pending = sorted(self._resume_register_items(customer, items, resume), key=self._get_file_size)
+        hash_pool = ThreadPool(jobs)
+        upload_pool = ThreadPool(jobs)
+        try:
+            # Parse and hash in a worker pool, feed the results straight into a bounded upload stage and register
+            # every artifact as soon as its upload completes.
+            prepared = hash_pool.imap(lambda item: self._prepare_batch_item(parser, item), pending)
+            if not self.config.skip_verify and pending:
+                prepared = list(prepared)
+                response = raw_input('Continue register of {} artifacts? (y)'.format(len(pending)))
+                if response and response.lower() != 'y':
+                    print 'Artifact register aborted'
+                    return False
+            uploaded = upload_pool.imap(lambda item: self._upload_batch_item(customer, item), prepared)
+            for item in uploaded:
+                if item.ok and item.status == 'uploaded':
+                    self._register_batch_item(customer, item)
+        finally:
+            for pool in (hash_pool, upload_pool):
+                pool.close()
+                pool.join()
+
+        print_summary(self.config, 'REGISTER', items)
+        return self._complete_batch(items)
+
+    def _resume_register_items(self, customer, items, resume):
+        """ Journal the given items and, when resuming, pick up where the journal says the previous run stopped.
+            Returns the items that still need work. """
+        state = self._load_journal(resume)
+        pending = []
+        for item in items:
+            item.journal_key = 'register/{}/{}'.format(customer, os.path.abspath(item.binary))
+            entry = state.get(item.journal_key)
+            if entry and self._is_journal_entry_current(item.binary, entry):
+                if entry['phase'] == REGISTERED:
+                    item.succeed('already registered')
+                    continue
+                item.digests = FileDigests.from_dict(entry['size'], entry['digests'])
+                item.download_url = entry.get('download_url')
+            pending.append(item)
+        return pending
+
+    @staticmethod
+    def _get_file_size(item):
+        try:
+            return os.path.getsize(item.binary)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _is_journal_entry_current(binary, entry):
+        # Anything recorded for a file that changed since is stale
+        return 'digests' in entry and os.path.isfile(binary) and os.path.getsize(binary) == entry.get('size') \
+            and os.path.getmtime(binary) == entry.get('mtime')
+
+    def _load_journal(self, resume):
+        """ Every batch is journaled so it can be resumed if it gets interrupted, only a resumed batch reads what
+            was journaled before. """
+        self.journal.prune()
+        return self.journal.load() if resume else {}
+
+    def _journal(self, item, phase, **data):
+        if item.journal_key:
+            self.journal.record(item.journal_key, phase, **data)
+
+    def _complete_batch(self, items):
+        if not all(item.ok for item in items):
+            return False
+        keys = [item.journal_key for item in items if item.journal_key]
+        if keys:
+            self.journal.complete(keys)
+        return True
+
+    def _get_parser(self, item_type):
+        """ Returns the parser of the given type of artifact, called with the config, the artifact file and its
+            digests. """
+        if item_type == 'apk':
+            return self._parse_apk
+        elif item_type == 'config':
+            return self._parse_os_config
+        else:
+            return None
+
+    def _parse_apk(self, config, binary, digests):
+        sha1 = digests.hexdigest('sha1') if digests else None
+        return Apk.parse(config, binary, cache=self.apk_cache, sha1=sha1)
+
+    @staticmethod
+    def _parse_os_config(config, binary, digests):
+        return OSConfig.parse(config, binary)
+
+    def _prepare_batch_item(self, parser, item):
+        try:
+            if not item.digests:
+                item.digests = self._digest_file(item.binary)
+                self._journal(item, 'hashed', size=item.digests.size, mtime=os.path.getmtime(item.binary),
+                              digests=item.digests.to_dict())
+            output = StringIO()
+            try:
+                with capture_output(output), self.metrics.span('parse', artifact=item.binary) as span:
+                    item.artifact = parser(self.config, item.binary, item.digests)
+                    span.ok = bool(item.artifact)
+            finally:
+                # Parsing prints the artifact details, keep them together
+                with self._output_lock:
+                    sys.stdout.write(output.getvalue())
+            if not item.artifact:
+                return item.fail('invalid artifact')
+        except Exception as err:
+            return item.fail(str(err))
+        return item.succeed('hashed')
+
+    def _upload_batch_item(self, customer, item):
+        if not item.ok:
+            return item
+        if not self._renew_credentials():
+            return item.fail('session expired')
+        if item.download_url:
+            # Uploaded by a previous run
+            return item.succeed('uploaded')
+        try:
+            registered = self._check_registered(customer, item.artifact, item.digests.hexdigest('sha1'))
+            if registered == REGISTERED:
+                self._journal(item, REGISTERED)
+                return item.succeed('already registered')
+            elif registered == CONFLICT:
+                return item.fail('registered with a different checksum')
+            item.download_url = self._upload_artifact(customer, item.binary, item.artifact, item.digests.digest('md5'),
+                                                      progress=False)
+        except Exception as err:
+            return item.fail(str(err))
+        if not item.download_url:
+            return item.fail('upload failed')
+        self._journal(item, 'uploaded', download_url=item.download_url)
+        return item.succeed('uploaded')
+
+    def _register_batch_item(self, customer, item):
+        if not self._renew_credentials():
+            return item.fail('session expired')
+        sha1 = item.digests.hexdigest('sha1')
+        if not self._register_to_mason(customer, item.download_url, sha1, item.artifact):
+            return item.fail('registry rejected artifact')
+        self.ledger.record(customer, item.artifact, sha1)
+        self._journal(item, REGISTERED)
+        return item.succeed('registered {}:{}'.format(item.artifact.get_name(), item.artifact.get_version()))
+
     def _register_artifact(self, binary):
         if not self._validate_credentials():
             return False
 
-        sha1 = hash_file(binary, 'sha1', True)
+        digests = self.artifact_digests or self._digest_file(binary)
+        sha1 = digests.hexdigest('sha1')
+        md5 = digests.digest('md5')
         if self.config.verbose:
             print 'File SHA1: {}'.format(sha1)
-        md5 = hash_file(binary, 'md5', False)
-        if self.config.verbose:
-            print 'File MD5: {}'.format(hash_file(binary, 'md5', True))
+            print 'File MD5: {}'.format(digests.hexdigest('md5'))
 
         customer = self._get_customer()
         if not customer:
             print 'Could not retrieve customer information'
             return False
 
-        # Get the signed url data for the user and artifact
-        signed_url_data = self._request_signed_url(customer, self.artifact, md5)
-
-        if not signed_url_data:
+        # Skip the upload entirely if this exact artifact is already registered
+        registered = self._check_registered(customer, self.artifact, sha1)
+        if registered == REGISTERED:
+            print 'Artifact already registered.'
+            return True
+        elif registered == CONFLICT:
             return False
 
-        # Get the signed request url from the response
-        signed_request_url = signed_url_data['signed_request']
-
-        # Store the download url for mason registry
-        download_url = signed_url_data['url']
+        download_url = self._upload_artifact(customer, binary, self.artifact, md5)
+        if not download_url:
+            return False
 
-        # Upload the artifact to the signed url
-        if not self._upload_to_signed_url(signed_request_url, binary, self.artifact, md5):
+        # The upload may have taken long enough for the tokens to need a refresh
+        if not self._renew_credentials():
             return False
 
         # Publish to mason services
         if not self._register_to_mason(customer, download_url, sha1, self.artifact):
             return False
 
+        self.ledger.record(customer, self.artifact, sha1)
         return True
 
+    def _digest_file(self, binary):
+        with self.metrics.span('hash', artifact=binary) as span:
+            span.bytes = os.path.getsize(binary)
+            return digest_file(binary)
+
+    def _check_registered(self, customer, artifact_data, sha1):
+        if self.ledger.contains(customer, artifact_data, sha1):
+            return REGISTERED
+
+        headers = {'Authorization': 'Bearer {}'.format(self.id_token)}
+        try:
+            with self.metrics.span('registry_lookup', artifact=artifact_data.get_name()):
+                r = self.session.get(self._get_registry_lookup_endpoint(customer, artifact_data), headers=headers)
+        except requests.RequestException as err:
+            # The upload will tell whether the platform is reachable
+            if self.config.debug:
+                print 'Unable to look up the registry: {}'.format(err)
+            return None
+        if r.status_code != 200:
+            # Not registered yet, or the registry can't tell us: go ahead with the upload
+            return None
+
+        try:
+            registered_sha1 = json.loads(r.text)['checksum']['sha1']
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if registered_sha1 == sha1:
+            self.ledger.record(customer, artifact_data, sha1)
+            return REGISTERED
+
+        print_err(self.config, '{}:{} is already registered with a different checksum (registered SHA1: {}, local '
+                               'SHA1: {})'.format(artifact_data.get_name(), artifact_data.get_version(),
+                                                  registered_sha1, sha1))
+        return CONFLICT
+
+    def _get_registry_lookup_endpoint(self, customer, artifact_data):
+        return self.store.registry_artifact_url() \
+            + '/{0}/{1}/{2}?type={3}'.format(customer, artifact_data.get_name(), artifact_data.get_version(),
+                                             artifact_data.get_type())
+
+    def _upload_artifact(self, customer, binary, artifact_data, md5, progress=True):
+        # Large artifacts are uploaded in parts when the signer supports it
+        manifest = None
+        multipart = None
+        size = os.path.getsize(binary)
+        if size >= MULTIPART_THRESHOLD:
+            manifest = self._get_part_manifest(customer, artifact_data, md5)
+            multipart = {'parts': MultipartUpload.part_count(size), 'part_size': PART_SIZE}
+            if manifest.upload_id():
+                multipart['upload_id'] = manifest.upload_id()
+
+        # Get the signed url data for the user and artifact
+        signed_url_data = self._request_signed_url(customer, artifact_data, md5, multipart)
+
+        if not signed_url_data:
+            return None
+
+        if multipart and signed_url_data.get('multipart'):
+            print 'Uploading artifact in {} parts...'.format(multipart['parts'])
+            upload = MultipartUpload(self.session, binary, signed_url_data['multipart'], manifest, progress=progress,
+                                     throttle=self.uploads.bucket)
+            with self.uploads.slot(size) as slot, \
+                    self.metrics.span('upload', artifact=artifact_data.get_name(), multipart=True) as span:
+                span.bytes = size
+                span.ok = slot.ok = upload.upload()
+            if not span.ok:
+                return None
+            print 'File upload complete.'
+            return signed_url_data['url']
+
+        # Get the signed request url from the response
+        signed_request_url = signed_url_data['signed_request']
+
+        # Upload the artifact to the signed url
+        if not self._upload_to_signed_url(signed_request_url, binary, artifact_data, md5, progress):
+            return None
+
+        # The download url is what gets stored in the mason registry
+        return signed_url_data['url']
+
     def _request_user_info(self):
         headers = {'Authorization': 'Bearer {}'.format(self.access_token)}
-        r = requests.get(self.store.user_info_url(), headers=headers)
+        try:
+            with self.metrics.span('user_info') as span:
+                r = self.session.get(self.store.user_info_url(), headers=headers)
+                span.ok = r.status_code == 200
+        except requests.RequestException as err:
+            self._report_request_error('Unable to get user info', err)
+            return None
 
         if r.status_code == 200:
             data = json.loads(r.text)
@@ -133,6 +486,11 @@ class Mason(IMason):
             return None
 
     def _get_customer(self):
+        # Reuse the customer resolved for this token if we have it
+        customer = self.persist.retrieve_customer(self.access_token)
+        if customer:
+            return customer
+
         # Get the user info
         user_info_data = self._request_user_info()
 
@@ -140,13 +498,26 @@ class Mason(IMason):
             return None
 
         # Extract the customer info
-        return user_info_data['user_metadata']['clients'][0]
+        customer = user_info_data['user_metadata']['clients'][0]
+        self.persist.write_customer(self.access_token, customer)
+        return customer
 
-    def _request_signed_url(self, customer, artifact_data, md5):
+    def _get_part_manifest(self, customer, artifact_data, md5):
+        key = hashlib.sha1('/'.join([customer, artifact_data.get_type(), str(artifact_data.get_name()),
+                                     str(artifact_data.get_version()), base64.b16encode(md5)])).hexdigest()
+        return PartManifest(os.path.join(os.path.expanduser('~'), '.mason', 'uploads', key + '.json'))
+
+    def _request_signed_url(self, customer, artifact_data, md5, multipart=None):
         print 'Connecting to server...'
         headers = self._get_signed_url_request_headers(md5)
-        url = self._get_signed_url_request_endpoint(customer, artifact_data)
-        r = requests.get(url, headers=headers)
+        url = self._get_signed_url_request_endpoint(customer, artifact_data, multipart)
+        try:
+            with self.metrics.span('signed_url', artifact=artifact_data.get_name()) as span:
+                r = self.session.get(url, headers=headers)
+                span.ok = r.status_code == 200
+        except requests.RequestException as err:
+            self._report_request_error('Unable to get signed url', err)
+            return None
         if r.status_code == 200:
             data = json.loads(r.text)
             return data
@@ -168,18 +539,28 @@ class Mason(IMason):
                 'Content-MD5': base64encodedmd5,
                 'Authorization': 'Bearer {}'.format(self.id_token)}
 
-    def _get_signed_url_request_endpoint(self, customer, artifact_data):
-        return self.store.registry_signer_url() \
+    def _get_signed_url_request_endpoint(self, customer, artifact_data, multipart=None):
+        url = self.store.registry_signer_url() \
               + '/{0}/{1}/{2}?type={3}'.format(customer, artifact_data.get_name(), artifact_data.get_version(),
                                                artifact_data.get_type())
+        if multipart:
+            url += '&' + urlencode(sorted(multipart.items()))
+        return url
 
-    def _upload_to_signed_url(self, url, artifact, artifact_data, md5):
+    def _upload_to_signed_url(self, url, artifact, artifact_data, md5, progress=True):
         print 'Uploading artifact...'
         headers = self._get_signed_url_post_headers(artifact_data, md5)
-        artifact_file = open(artifact, 'rb')
-        iterable = UploadInChunks(artifact_file.name, chunksize=10)
 
-        r = requests.put(url, data=IterableToFileAdapter(iterable), headers=headers)
+        try:
+            with self.uploads.slot(os.path.getsize(artifact)) as slot, \
+                    UploadBody(artifact, progress=progress, throttle=self.uploads.bucket) as body, \
+                    self.metrics.span('upload', artifact=artifact_data.get_name()) as span:
+                span.bytes = len(body)
+                r = self.session.put(url, data=body, headers=headers)
+                span.ok = slot.ok = r.status_code == 200
+        except requests.RequestException as err:
+            self._report_request_error('Unable to upload to signed url', err)
+            return False
         if r.status_code == 200:
             print 'File upload complete.'
             return True
@@ -206,7 +587,13 @@ class Mason(IMason):
             payload.update(artifact_data.get_registry_meta_data())
 
         url = self.store.registry_artifact_url() + '/{0}/'.format(customer)
-        r = requests.post(url, headers=headers, json=payload)
+        try:
+            with self.metrics.span('registry', artifact=artifact_data.get_name()) as span:
+                r = self.session.post(url, headers=headers, json=payload)
+                span.ok = r.status_code == 200
+        except requests.RequestException as err:
+            self._report_request_error('Unable to register artifact', err)
+            return False
         if r.status_code == 200:
             print 'Artifact registered.'
             return True
@@ -227,6 +614,15 @@ class Mason(IMason):
                     'sha1': sha1
                 }}
 
+    def _report_attempt(self, method, url, attempt, response, error, delay):
+        host = urlparse(url).hostname
+        if response is not None:
+            print 'Attempt {} to reach {} failed: {}'.format(attempt, host, response.status_code)
+            self._handle_status(response.status_code)
+        else:
+            print 'Attempt {} to reach {} failed: {}'.format(attempt, host, error)
+        print 'Retrying in {:.1f}s...'.format(delay)
+
     @staticmethod
     def _handle_status(status_code):
         if status_code == 400:
@@ -237,32 +633,108 @@ class Mason(IMason):
             print 'Access to domain is forbidden. Please contact support.'
         elif status_code == 404:
             print 'Resource is unavailable, failed'
+        elif status_code == 429:
+            print 'Too many requests, the Mason service is throttling this client.'
         elif status_code == 500:
             print 'Mason service or resource is currently unavailable.'
+        elif status_code in (502, 503, 504):
+            print 'Mason service is temporarily unavailable.'
+
+    def _report_request_error(self, message, err):
+        """ Report a platform call that got no response at all: the connection failed or timed out, the command
+            deadline passed or the circuit to the host is open. """
+        print_err(self.config, '{}: {}'.format(message, err))
 
     def build(self, project, version):
         return self._build_project(project, version)
 
+    def build_and_wait(self, builds, timeout):
+        if not self._validate_credentials():
+            return BUILD_NOT_STARTED
+
+        customer = self._get_customer()
+        if not customer:
+            print 'Could not retrieve customer information'
+            return BUILD_NOT_STARTED
+
+        jobs = []
+        result = self._build_and_wait(customer, builds, timeout, jobs)
+        print_summary(self.config, 'BUILD', jobs)
+        return result
+
+    def _build_and_wait(self, customer, builds, timeout, jobs):
+        """ Queue the given (project, version) builds and wait for all of them to complete, tracking every queued
+            build in `jobs`. Returns one of the BUILD_* result codes. """
+        for project, version in builds:
+            response = self._queue_build(customer, project, version)
+            job_id = response is not None and BuildJob.get_job_id(response.text)
+            if not job_id:
+                if response is not None:
+                    print_err(self.config, 'Unable to track build {}:{}, no job was returned'.format(project,
+                                                                                                      version))
+                self._report_queued_builds(jobs)
+                jobs.append(BuildJob(project, version, None).fail('not queued'))
+                return BUILD_NOT_STARTED
+            jobs.append(BuildJob(project, version, self._get_build_status_url(customer, job_id), job_id))
+
+        print 'Waiting for {} build(s) to complete...'.format(len(jobs))
+        waiter = BuildWaiter(self.session, self._get_build_status_headers(), timeout or DEFAULT_WAIT_TIMEOUT,
+                             renew_headers=self._renew_build_status_headers)
+        with self.metrics.span('build_wait') as span:
+            result = waiter.wait(jobs)
+            span.ok = result == BUILD_SUCCEEDED
+        return result
+
+    def _get_build_status_headers(self):
+        return {'Authorization': 'Bearer {}'.format(self.id_token)}
+
+    def _renew_build_status_headers(self):
+        # The tokens may have expired during a long wait
+        if not self._renew_credentials():
+            return None
+        return self._get_build_status_headers()
+
+    @staticmethod
+    def _report_queued_builds(jobs):
+        # Left running on the builder, say where they can be followed
+        if not jobs:
+            return
+        print 'Not waiting for the {} build(s) already queued:'.format(len(jobs))
+        for job in jobs:
+            print '  {}: job {} ({})'.format(job.label, job.job_id, job.status_url)
+
+    def _get_build_status_url(self, customer, job_id):
+        return self.store.builder_url() + '/{0}/jobs/{1}'.format(customer, job_id)
+
     def _build_project(self, project, version):
         if not self._validate_credentials():
             return False
 
-        headers = {'Content-Type': 'application/json',
-                   'Authorization': 'Bearer {}'.format(self.id_token)}
-
         customer = self._get_customer()
         if not customer:
             print 'Could not retrieve customer information'
             return False
 
+        return self._queue_build(customer, project, version) is not None
+
+    def _queue_build(self, customer, project, version):
+        headers = {'Content-Type': 'application/json',
+                   'Authorization': 'Bearer {}'.format(self.id_token)}
+
         payload = self._get_build_payload(customer, project, version)
         builder_url = self.store.builder_url() + '/{0}/'.format(customer) + 'jobs'
         print 'Queueing build...'
-        r = requests.post(builder_url, headers=headers, json=payload)
+        try:
+            with self.metrics.span('build', project=project) as span:
+                r = self.session.post(builder_url, headers=headers, json=payload)
+                span.ok = r.status_code == 200
+        except requests.RequestException as err:
+            self._report_request_error('Unable to enqueue build', err)
+            return None
         if r.status_code == 200:
             hostname = urlparse(self.store.deploy_url()).hostname
             print 'Build queued.\nYou can see the status of your build at https://{}/controller/projects/{}'.format(hostname, project)
-            return True
+            return r
         else:
             print_err(self.config, 'Unable to enqueue build: {}'.format(r.status_code))
             self._handle_status(r.status_code)
@@ -272,7 +744,7 @@ class Mason(IMason):
                     print_err(self.config, "Details: " + msg)
                 except ValueError:  # Something wrong in the error message received
                     pass
-            return False
+            return None
 
     @staticmethod
     def _get_build_payload(customer, project, version):
@@ -330,31 +802,108 @@ class Mason(IMason):
         payload = self._get_deploy_payload(customer, group, name, version, 'ota', push)
         return self._deploy_payload(payload)
 
+    def deploy_batch(self, item_type, name, version, groups, push, jobs, resume=False):
+        if item_type not in ('apk', 'config', 'ota'):
+            print 'Unsupported deploy type {}'.format(item_type)
+            return False
+
+        if not self._validate_credentials():
+            return False
+
+        customer = self._get_customer()
+        if not customer:
+            print 'Could not retrieve customer information'
+            return False
+
+        if item_type == 'ota' and name != 'mason-os':
+            print "Warning: Unknown name '{0}' for 'ota' deployments, forcing it to 'mason-os'".format(name)
+            name = 'mason-os'
+        payloads = [self._get_deploy_payload(customer, group, name, version, item_type, push) for group in groups]
+        if not payloads:
+            return False
+
+        state = self._load_journal(resume)
+        items = []
+        pending = []
+        for payload in payloads:
+            item = BatchItem(payload['group'])
+            item.journal_key = 'deploy/' + '/'.join(str(payload[key]) for key in ('customer', 'type', 'name',
+                                                                                   'version', 'group'))
+            if state.get(item.journal_key, {}).get('phase') == 'deployed':
+                item.succeed('already deployed')
+            else:
+                pending.append((item, payload))
+            items.append(item)
+
+        if pending:
+            if not self._confirm_deploy([payload for _, payload in pending]):
+                return False
+            pool = ThreadPool(max(1, min(int(jobs), len(pending))))
+            try:
+                pool.map(lambda args: self._deploy_batch_item(*args), pending)
+            finally:
+                pool.close()
+                pool.join()
+
+        print_summary(self.config, 'DEPLOY', items)
+        return self._complete_batch(items)
+
+    def _deploy_batch_item(self, item, payload):
+        if not self._renew_credentials():
+            return item.fail('session expired')
+        try:
+            if not self._post_deploy(payload):
+                return item.fail('deploy rejected')
+        except Exception as err:
+            return item.fail(str(err))
+        self._journal(item, 'deployed')
+        return item.succeed('deployed {}:{}'.format(payload['name'], payload['version']))
+
     def _deploy_payload(self, payload):
         if not payload:
             return False
 
-        if not self.config.skip_verify:
-            print '---------- DEPLOY -----------'
-            print 'Name: {}'.format(payload['name'])
-            print 'Type: {}'.format(payload['type'])
-            print 'Version: {}'.format(payload['version'])
+        if not self._confirm_deploy([payload]):
+            return False
+
+        return self._post_deploy(payload)
+
+    def _confirm_deploy(self, payloads):
+        if self.config.skip_verify:
+            return True
+
+        payload = payloads[0]
+        print '---------- DEPLOY -----------'
+        print 'Name: {}'.format(payload['name'])
+        print 'Type: {}'.format(payload['type'])
+        print 'Version: {}'.format(payload['version'])
+        if len(payloads) == 1:
             print 'Group: {}'.format(payload['group'])
-            print 'Push: {}'.format(payload['push'])
-            if self.config.verbose:
-                print 'Customer: {}'.format(payload['customer'])
-            print '-----------------------------'
-            response = raw_input('Continue deploy? (y)')
-            if not response or response.lower() == 'y':
-                print 'Continuing deploy...'
-            else:
-                print 'Deploy aborted'
-                return False
+        else:
+            print 'Groups: {}'.format(', '.join(p['group'] for p in payloads))
+        print 'Push: {}'.format(payload['push'])
+        if self.config.verbose:
+            print 'Customer: {}'.format(payload['customer'])
+        print '-----------------------------'
+        response = raw_input('Continue deploy? (y)')
+        if not response or response.lower() == 'y':
+            print 'Continuing deploy...'
+            return True
+        else:
+            print 'Deploy aborted'
+            return False
 
+    def _post_deploy(self, payload):
         headers = {'Content-Type': 'application/json',
                    'Authorization': 'Bearer {}'.format(self.id_token)}
 
-        r = requests.post(self.store.deploy_url(), headers=headers, json=payload)
+        try:
+            with self.metrics.span('deploy', group=payload['group']) as span:
+                r = self.session.post(self.store.deploy_url(), headers=headers, json=payload)
+                span.ok = r.status_code == 200
+        except requests.RequestException as err:
+            self._report_request_error('Unable to deploy to {}'.format(payload['group']), err)
+            return False
 
         if r.status_code == 200:
             if r.text:
@@ -391,9 +940,132 @@ class Mason(IMason):
             print 'Unable to stage configuration'
             return False
 
+    def apply(self, plan_yaml, jobs):
+        plan = Plan.load(plan_yaml)
+        if not plan:
+            return False
+
+        if not self._validate_credentials():
+            return False
+
+        customer = self._get_customer()
+        if not customer:
+            print 'Could not retrieve customer information'
+            return False
+
+        nodes = self._get_plan_nodes(plan, customer)
+        if nodes is None:
+            return False
+
+        if not self.config.skip_verify:
+            print '---------- APPLY ------------'
+            for node in nodes:
+                if node.deps:
+                    print '{} (after {})'.format(node.id, ', '.join(node.deps))
+                else:
+                    print node.id
+            print '-----------------------------'
+            response = raw_input('Continue apply? (y)')
+            if response and response.lower() != 'y':
+                print 'Apply aborted'
+                return False
+
+        self.uploads.set_concurrency(jobs)
+        result = execute_graph(nodes, jobs)
+        print_summary(self.config, 'APPLY', [node.item for node in nodes])
+        return result
+
+    def _get_plan_nodes(self, plan, customer):
+        registers = []
+        for entry in plan.artifacts:
+            item = RegisterItem(entry['path'])
+            if entry['type'] == 'apk' and os.path.isfile(item.binary):
+                # Looks the APK up in the cache, the other artifacts are hashed when registered
+                item.digests = self._digest_file(item.binary)
+            if entry['type'] == 'media':
+                artifact = Media.parse(self.config, entry['name'], entry['media_type'], entry['version'],
+                                       entry['path'])
+            else:
+                artifact = self._get_parser(entry['type'])(self.config, entry['path'], item.digests)
+            if not artifact:
+                print 'Invalid artifact {} in plan'.format(entry['path'])
+                return None
+            item.artifact = artifact
+            registers.append(PlanNode('register {}'.format(entry['path']), self._get_register_work(customer),
+                                      item))
+
+        builds = []
+        for entry in plan.builds:
+            project, version = str(entry['project']), str(entry['version'])
+            node = PlanNode('build {}:{}'.format(project, version), self._get_build_work(customer, project, version))
+            node.depends_on(r for r in registers if self._plan_artifact_matches(r.item.artifact, 'config', project,
+                                                                                 version))
+            builds.append(node)
+
+        deploys = []
+        for entry in plan.deploys:
+            item_type, version = entry['type'], str(entry['version'])
+            name = 'mason-os' if item_type == 'ota' else str(entry['name'])
+            for group in entry['groups']:
+                payload = self._get_deploy_payload(customer, group, name, version, item_type,
+                                                   bool(entry.get('push', False)))
+                node = PlanNode('deploy {} {}:{} to {}'.format(item_type, name, version, group),
+                                self._get_deploy_work(payload))
+                node.depends_on(r for r in registers if self._plan_artifact_matches(r.item.artifact, item_type, name,
+                                                                                     version))
+                if item_type == 'config':
+                    node.depends_on(b for b in builds if b.id == 'build {}:{}'.format(name, version))
+                deploys.append(node)
+
+        return registers + builds + deploys
+
+    @staticmethod
+    def _plan_artifact_matches(artifact, item_type, name, version):
+        return artifact.get_type() == item_type and str(artifact.get_name()) == name \
+            and str(artifact.get_version()) == version
+
+    def _get_register_work(self, customer):
+        def work(item):
+            if not item.digests:
+                item.digests = self._digest_file(item.binary)
+            self._upload_batch_item(customer, item)
+            if item.ok and item.status == 'uploaded':
+                self._register_batch_item(customer, item)
+            return item
+        return work
+
+    def _get_build_work(self, customer, project, version):
+        def work(item):
+            # Deploys of the build depend on it, only succeed once the build itself did
+            if not self._renew_credentials():
+                return item.fail('session expired')
+            result = self._build_and_wait(customer, [(project, version)], DEFAULT_WAIT_TIMEOUT, [])
+            if result == BUILD_NOT_STARTED:
+                return item.fail('build rejected')
+            elif result == BUILD_TIMED_OUT:
+                return item.fail('build timed out')
+            elif result != BUILD_SUCCEEDED:
+                return item.fail('build failed')
+            return item.succeed('built')
+        return work
+
+    def _get_deploy_work(self, payload):
+        def work(item):
+            # Deploys run last, often after a long wait on builds
+            if not self._renew_credentials():
+                return item.fail('session expired')
+            if not self._post_deploy(payload):
+                return item.fail('deploy rejected')
+            return item.succeed('deployed')
+        return work
+
     def authenticate(self, user, password):
         payload = self._get_auth_payload(user, password)
-        r = requests.post(self.store.auth_url(), json=payload)
+        try:
+            r = self.session.post(self.store.auth_url(), json=payload)
+        except requests.RequestException as err:
+            self._report_request_error('Unable to log in', err)
+            return False
         if r.status_code == 200:
             data = json.loads(r.text)
             return self.persist.write_tokens(data)
@@ -407,43 +1079,9 @@ class Mason(IMason):
                 'id_token': str(self.id_token),
                 'connection': 'Username-Password-Authentication',
                 'grant_type': 'password',
-                'scope': 'openid',
-                'device': ''}
+                'scope': 'openid offline_access',
+                'device': AUTH_DEVICE}
 
     def logout(self):
         return self.persist.delete_tokens()
 
-
-class UploadInChunks(object):
-
-    def __init__(self, filename, chunksize=1 << 13):
-        self.filename = filename
-        self.chunksize = int(chunksize)
-        self.totalsize = os.stat(filename).st_size
-        self.pbar = tqdm(total=self.totalsize, ncols=100, unit='kb', dynamic_ncols=True)
-
-    def __iter__(self):
-        with open(self.filename, 'rb') as file_to_upload:
-            while True:
-                data = file_to_upload.read(self.chunksize)
-                if not data:
-                    self.pbar.close()
-                    break
-                self.pbar.update(len(data))
-                yield data
-
-    def __len__(self):
-        return self.totalsize
-
-
-class IterableToFileAdapter(object):
-
-    def __init__(self, iterable):
-        self.iterator = iter(iterable)
-        self.length = len(iterable)
-
-    def read(self, size=-1):
-        return next(self.iterator, b'')
-
-    def __len__(self):
-        return self.length
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_EXTENSIONS = ('.prom',)
+
+
+class Span(object):
+    """ Timing of a single phase of a command.
+
+        :param phase: name of the phase, e.g. hash, signed_url, upload
+        :param labels: additional dimensions of the span, e.g. the artifact"""
+
+    def __init__(self, phase, labels):
+        self.phase = phase
+        self.labels = labels
+        self.start = time.time()
+        self.duration = 0.0
+        self.bytes = 0
+        self.ok = True
+
+    def to_dict(self):
+        data = {'phase': self.phase,
+                'start': self.start,
+                'duration': self.duration,
+                'bytes': self.bytes,
+                'ok': self.ok}
+        data.update(self.labels)
+        return data
+
+
+class Metrics(object):
+    """ Collects a timing span, and the bytes transferred, for every phase of the commands that ran. Safe to use
+        from the batch worker threads. """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase, **labels):
+        """ Time the enclosed block. The yielded Span can be marked failed or given the bytes transferred, a span
+            is also marked failed when the block raises. """
+        span = Span(phase, dict((key, str(value)) for key, value in labels.items()))
+        clock = time.time()
+        try:
+            yield span
+        except Exception:
+            span.ok = False
+            raise
+        finally:
+            span.duration = time.time() - clock
+            with self._lock:
+                self.spans.append(span)
+
+    def to_json_lines(self):
+        with self._lock:
+            spans = list(self.spans)
+        return ''.join(json.dumps(span.to_dict(), sort_keys=True) + '\n' for span in spans)
+
+    def to_prometheus(self):
+        """ Aggregate the spans per phase into the Prometheus text exposition format. """
+        with self._lock:
+            spans = list(self.spans)
+
+        phases = {}
+        for span in spans:
+            totals = phases.setdefault(span.phase, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'failures': 0})
+            totals['count'] += 1
+            totals['seconds'] += span.duration
+            totals['bytes'] += span.bytes
+            if not span.ok:
+                totals['failures'] += 1
+
+        lines = ['# HELP mason_phase_duration_seconds Time spent in each phase',
+                 '# TYPE mason_phase_duration_seconds summary']
+        for phase in sorted(phases):
+            lines.append('mason_phase_duration_seconds_sum{{phase="{}"}} {}'.format(phase, phases[phase]['seconds']))
+            lines.append('mason_phase_duration_seconds_count{{phase="{}"}} {}'.format(phase, phases[phase]['count']))
+        for name, key, description in [('mason_phase_bytes_total', 'bytes', 'Bytes transferred in each phase'),
+                                       ('mason_phase_failures_total', 'failures', 'Failed runs of each phase')]:
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} counter'.format(name))
+            for phase in sorted(phases):
+                lines.append('{}{{phase="{}"}} {}'.format(name, phase, phases[phase][key]))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """ Write the metrics to the given file, in the Prometheus textfile format if it ends in .prom or as JSON
+            lines otherwise. The file is replaced atomically so collectors never read a partial file. """
+        if os.path.splitext(filename)[1] in PROMETHEUS_EXTENSIONS:
+            content = self.to_prometheus()
+        else:
+            content = self.to_json_lines()
+
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'w') as outfile:
+            outfile.write(content)
+        os.rename(tmp_file, filename)
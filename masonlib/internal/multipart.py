@@ -0,0 +1,218 @@
+import base64
+import binascii
+import hashlib
+import io
+import json
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+from xml.sax.saxutils import escape
+
+import requests
+from tqdm import tqdm
+
+from masonlib.internal.scheduler import ThrottledStream
+
+MULTIPART_THRESHOLD = 64 << 20
+PART_SIZE = 16 << 20
+DEFAULT_PART_JOBS = 4
+
+
+class PartManifest(object):
+    """ Local record of the parts of a multipart upload the storage service has acknowledged, allowing an
+        interrupted upload to resume from the last acknowledged part.
+
+        :param file_path: path of the manifest file"""
+
+    def __init__(self, file_path):
+        self.file = file_path
+        self.data = self._load_stored_data()
+        self._lock = threading.Lock()
+
+    def _load_stored_data(self):
+        if not os.path.isfile(self.file):
+            return {}
+
+        with open(self.file) as data_file:
+            try:
+                return json.load(data_file)
+            except ValueError:
+                return {}
+
+    def matches(self, size, part_size):
+        return self.data.get('size') == size and self.data.get('part_size') == part_size
+
+    def upload_id(self):
+        return self.data.get('upload_id')
+
+    def parts(self):
+        return dict((int(number), etag) for number, etag in self.data.get('parts', {}).items())
+
+    def start(self, upload_id, size, part_size):
+        with self._lock:
+            self.data = {'upload_id': upload_id, 'size': size, 'part_size': part_size, 'parts': {}}
+            self._save()
+
+    def acknowledge(self, part_number, etag):
+        with self._lock:
+            self.data.setdefault('parts', {})[str(part_number)] = etag
+            self._save()
+
+    def delete(self):
+        self.data = {}
+        try:
+            os.remove(self.file)
+        except OSError:
+            pass
+
+    def _save(self):
+        directory = os.path.dirname(self.file)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write aside and rename so an interrupted run never leaves a truncated manifest behind
+        tmp_file = self.file + '.tmp'
+        with open(tmp_file, 'w') as outfile:
+            json.dump(self.data, outfile)
+        os.rename(tmp_file, self.file)
+
+
+class MultipartUpload(object):
+    """ Uploads a file as parts of an S3 style multipart upload. Parts are sent in parallel over the shared session,
+        every part carries its own Content-MD5 and the ETag returned for it is verified, and the ETag of the
+        completed object is checked against the digests of all parts.
+
+        :param session: the shared Session used for all requests
+        :param filename: path of the file to upload
+        :param multipart_data: the 'multipart' section of the signed url response
+        :param manifest: the PartManifest used to resume an interrupted upload
+        :param jobs: maximum number of parts uploaded concurrently
+        :param throttle: optional TokenBucket limiting the upload bandwidth"""
+
+    def __init__(self, session, filename, multipart_data, manifest, part_size=PART_SIZE, jobs=DEFAULT_PART_JOBS,
+                 progress=True, throttle=None):
+        self.session = session
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+        self.upload_id = multipart_data['upload_id']
+        self.part_urls = dict((part['part_number'], part['signed_request']) for part in multipart_data['parts'])
+        self.complete_url = multipart_data['complete_request']
+        self.manifest = manifest
+        self.part_size = part_size
+        self.jobs = max(1, int(jobs))
+        self.progress = progress
+        self.throttle = throttle
+        self.errors = []
+
+    @staticmethod
+    def part_count(size, part_size=PART_SIZE):
+        return max(1, (size + part_size - 1) // part_size)
+
+    def upload(self):
+        if self.manifest.upload_id() != self.upload_id or not self.manifest.matches(self.size, self.part_size):
+            self.manifest.start(self.upload_id, self.size, self.part_size)
+        acknowledged = self.manifest.parts()
+
+        part_numbers = range(1, self.part_count(self.size, self.part_size) + 1)
+        pending = [number for number in part_numbers if number not in acknowledged]
+        if len(pending) < len(part_numbers):
+            print 'Resuming upload, {} of {} parts already uploaded.'.format(len(part_numbers) - len(pending),
+                                                                             len(part_numbers))
+
+        pbar = None
+        if self.progress:
+            pbar = tqdm(total=self.size, initial=self.size - self._pending_size(pending), ncols=100, unit='B',
+                        unit_scale=True, dynamic_ncols=True)
+        pool = ThreadPool(min(self.jobs, max(1, len(pending))))
+        try:
+            for number, etag in pool.imap_unordered(self._upload_part, pending):
+                if etag:
+                    acknowledged[number] = etag
+                    if pbar:
+                        pbar.update(self._part_length(number))
+        finally:
+            pool.close()
+            pool.join()
+            if pbar:
+                pbar.close()
+
+        if len(acknowledged) < len(part_numbers):
+            for error in self.errors:
+                print error
+            print 'Upload interrupted, run the command again to resume.'
+            return False
+
+        if not self._complete([(number, acknowledged[number]) for number in part_numbers]):
+            return False
+
+        self.manifest.delete()
+        return True
+
+    def _part_length(self, part_number):
+        offset = (part_number - 1) * self.part_size
+        return min(self.part_size, self.size - offset)
+
+    def _pending_size(self, pending):
+        return sum(self._part_length(number) for number in pending)
+
+    def _read_part(self, part_number):
+        with open(self.filename, 'rb') as part_file:
+            part_file.seek((part_number - 1) * self.part_size)
+            return part_file.read(self._part_length(part_number))
+
+    def _upload_part(self, part_number):
+        url = self.part_urls.get(part_number)
+        if not url:
+            self.errors.append('No signed url for part {}'.format(part_number))
+            return part_number, None
+
+        data = self._read_part(part_number)
+        digest = hashlib.md5(data)
+        headers = {'Content-MD5': base64.b64encode(digest.digest()).decode('utf-8')}
+        if self.throttle:
+            data = ThrottledStream(io.BytesIO(data), len(data), self.throttle)
+        try:
+            r = self.session.put(url, data=data, headers=headers)
+        except Exception as err:
+            self.errors.append('Unable to upload part {}: {}'.format(part_number, err))
+            return part_number, None
+
+        if r.status_code != 200:
+            self.errors.append('Unable to upload part {}: {}'.format(part_number, r.status_code))
+            return part_number, None
+
+        etag = r.headers.get('ETag', '').strip('"')
+        if etag != digest.hexdigest():
+            self.errors.append('Checksum mismatch for part {}'.format(part_number))
+            return part_number, None
+
+        self.manifest.acknowledge(part_number, etag)
+        return part_number, etag
+
+    def _complete(self, parts):
+        body = '<CompleteMultipartUpload>'
+        for number, etag in parts:
+            body += '<Part><PartNumber>{}</PartNumber><ETag>"{}"</ETag></Part>'.format(number, escape(etag))
+        body += '</CompleteMultipartUpload>'
+
+        try:
+            r = self.session.post(self.complete_url, data=body, headers={'Content-Type': 'application/xml'})
+        except requests.RequestException as err:
+            print 'Unable to complete multipart upload: {}'.format(err)
+            return False
+        if r.status_code != 200:
+            print 'Unable to complete multipart upload: {}'.format(r.status_code)
+            return False
+
+        # S3 reports the md5 of the concatenated part digests followed by the number of parts
+        expected = '{}-{}'.format(hashlib.md5(b''.join(binascii.unhexlify(etag) for _, etag in parts)).hexdigest(),
+                                  len(parts))
+        if '<ETag>' not in r.text:
+            # Every part was already checked against its own MD5 when it was uploaded
+            print 'No checksum reported for the uploaded artifact, relying on the checksums of its {} parts'.format(
+                len(parts))
+            return True
+        etag = r.text.split('<ETag>')[1].split('</ETag>')[0].replace('&quot;', '').strip('"')
+        if etag != expected:
+            print 'Checksum mismatch for uploaded artifact'
+            return False
+        return True
@@ -1,9 +1,15 @@
 # COPYRIGHT MASONAMERICA
+import hashlib
 import json
 import os
+import time
 
 from os.path import expanduser
 
+from masonlib.internal.utils import decode_jwt_claims
+
+CUSTOMER_CACHE_TTL = 60 * 60
+
 
 class Persist(object):
 
@@ -38,12 +44,58 @@ class Persist(object):
     def retrieve_access_token(self):
         return self._get('access_token')
 
+    def retrieve_refresh_token(self):
+        return self._get('refresh_token')
+
+    def retrieve_token_expiry(self):
+        claims = decode_jwt_claims(self.retrieve_id_token())
+        if claims and 'exp' in claims:
+            return claims['exp']
+        return None
+
+    def retrieve_customer(self, token):
+        cached = self._get('customer')
+        if not cached or not token:
+            return None
+        if cached.get('token') != self._fingerprint(token) or cached.get('expires_at', 0) <= time.time():
+            return None
+        return cached.get('name')
+
+    def write_customer(self, token, customer):
+        if not self.data or not token:
+            return False
+        self.data['customer'] = {'token': self._fingerprint(token),
+                                 'name': customer,
+                                 'expires_at': self._customer_expiry()}
+        return self.write_tokens(self.data)
+
+    def _customer_expiry(self):
+        # The customer is only valid for as long as the tokens it was resolved with
+        return self.retrieve_token_expiry() or time.time() + CUSTOMER_CACHE_TTL
+
+    @staticmethod
+    def _fingerprint(token):
+        return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
     def write_tokens(self, data):
         with open(self.file, 'w') as outfile:
             json.dump(data, outfile)
+            self.data = data
             return True
 
+    def update_tokens(self, data):
+        """ Store refreshed tokens, keeping the refresh token and the customer resolved with the previous ones. """
+        customer = self.retrieve_customer(self.retrieve_access_token())
+        tokens = dict(self.data or {})
+        tokens.pop('customer', None)
+        tokens.update(data)
+        self.write_tokens(tokens)
+        if customer:
+            self.write_customer(self.retrieve_access_token(), customer)
+        return True
+
     def delete_tokens(self):
+        self.data = None
         try:
             return os.remove(self.file)
         except OSError:
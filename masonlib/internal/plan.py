@@ -0,0 +1,174 @@
+import os
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+
+import yaml
+
+from masonlib.internal.batch import BatchItem
+
+ARTIFACT_TYPES = ('apk', 'config', 'media')
+DEPLOY_TYPES = ('apk', 'config', 'ota')
+SECTIONS = ('artifacts', 'builds', 'deploys')
+
+
+class Plan(object):
+    """ A declarative release: the artifacts to register, the projects to build and the items to deploy.
+    ::
+
+        artifacts:
+          - type: apk
+            path: apks/app.apk
+          - type: config
+            path: configs/mason-test.yml
+          - type: media
+            path: bootanimation.zip
+            name: bootanimation
+            media_type: bootanimation
+            version: 1
+        builds:
+          - project: mason-test
+            version: 5
+        deploys:
+          - type: config
+            name: mason-test
+            version: 5
+            groups: [development, staging]
+            push: false
+
+    :param data: The parsed plan definition
+    """
+
+    def __init__(self, data):
+        self.data = data or {}
+        # Malformed plans are reported by validate()
+        sections = self.data if isinstance(self.data, dict) else {}
+        self.artifacts = sections.get('artifacts') or []
+        self.builds = sections.get('builds') or []
+        self.deploys = sections.get('deploys') or []
+
+    @staticmethod
+    def load(plan_yaml):
+        if not os.path.isfile(plan_yaml):
+            print 'No file provided'
+            return None
+
+        with open(plan_yaml) as data_file:
+            try:
+                plan = Plan(yaml.load(data_file, Loader=yaml.SafeLoader))
+            except yaml.YAMLError as err:
+                print 'Error in plan file: {}'.format(err)
+                return None
+
+        errors = plan.validate()
+        for error in errors:
+            print 'Error in plan file: {}'.format(error)
+        if errors:
+            return None
+        return plan
+
+    def validate(self):
+        if not isinstance(self.data, dict):
+            return ['a plan is a mapping of artifacts, builds and deploys']
+        errors = []
+        for section in SECTIONS:
+            entries = getattr(self, section)
+            if not isinstance(entries, list):
+                errors.append('{} must be a list'.format(section))
+            elif not all(isinstance(entry, dict) for entry in entries):
+                errors.append('every entry of {} must be a mapping'.format(section))
+        if errors:
+            return errors
+
+        for artifact in self.artifacts:
+            if artifact.get('type') not in ARTIFACT_TYPES:
+                errors.append('unsupported artifact type {}'.format(artifact.get('type')))
+            if not artifact.get('path'):
+                errors.append('artifact without a path')
+            if artifact.get('type') == 'media':
+                for key in ('name', 'media_type', 'version'):
+                    if key not in artifact:
+                        errors.append('media artifact {} is missing {}'.format(artifact.get('path'), key))
+        for build in self.builds:
+            if 'project' not in build or 'version' not in build:
+                errors.append('builds require a project and a version')
+        for deploy in self.deploys:
+            if deploy.get('type') not in DEPLOY_TYPES:
+                errors.append('unsupported deploy type {}'.format(deploy.get('type')))
+            for key in ('name', 'version', 'groups'):
+                if key not in deploy:
+                    errors.append('deploy of {} is missing {}'.format(deploy.get('name'), key))
+            if 'groups' in deploy and not isinstance(deploy['groups'], list):
+                errors.append('groups of the deploy of {} must be a list'.format(deploy.get('name')))
+        return errors
+
+
+class PlanNode(object):
+    """ A single step of a plan, run once every node it depends on has succeeded.
+
+        :param node_id: unique identifier of the node within the plan
+        :param work: called with the node's BatchItem, returns the BatchItem describing the outcome
+        :param item: the BatchItem tracking the outcome, defaults to one labelled with the node id"""
+
+    def __init__(self, node_id, work, item=None):
+        self.id = node_id
+        self.work = work
+        self.item = item or BatchItem(node_id)
+        self.deps = []
+
+    def depends_on(self, nodes):
+        self.deps.extend(node.id for node in nodes if node.id not in self.deps)
+
+
+def _run_node(node):
+    try:
+        node.work(node.item)
+    except Exception as err:
+        node.item.fail(str(err))
+    return node
+
+
+def execute_graph(nodes, jobs):
+    """
+    Run a dependency graph of PlanNode's, running independent nodes concurrently. Nodes whose dependencies
+    failed are not run.
+    :param nodes: The nodes making up the graph
+    :param jobs: Maximum number of nodes running at once
+    :return: True if every node succeeded
+    """
+    pending = list(nodes)
+    done = {}
+    completions = Queue()
+    running = 0
+    pool = ThreadPool(max(1, int(jobs)))
+    try:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for node in list(pending):
+                    if any(dep in done and not done[dep].item.ok for dep in node.deps):
+                        node.item.fail('dependency failed')
+                    elif all(dep in done for dep in node.deps):
+                        pool.apply_async(_run_node, (node,), callback=completions.put)
+                        running += 1
+                    else:
+                        continue
+                    pending.remove(node)
+                    if not node.item.ok:
+                        done[node.id] = node
+                        changed = True
+
+            if not running:
+                # Whatever is left depends on nodes that are not part of the graph
+                for node in pending:
+                    node.item.fail('unresolved dependency')
+                break
+
+            node = completions.get()
+            running -= 1
+            done[node.id] = node
+    finally:
+        pool.close()
+        pool.join()
+
+    return all(node.item.ok for node in nodes)
@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_INITIAL_UPLOADS = 2
+DEFAULT_MAX_UPLOADS = 8
+# Fraction by which the throughput of a window has to change before the concurrency is adjusted
+THROUGHPUT_TOLERANCE = 0.1
+# Seconds worth of bandwidth that may be sent in a single burst
+BURST_SECONDS = 0.1
+MIN_BURST = 16 * 1024
+
+
+class TokenBucket(object):
+    """ Token bucket limiting the number of bytes sent per second, shared by every upload.
+
+        :param rate: bytes per second
+        :param burst: maximum number of bytes sent at once, defaults to BURST_SECONDS worth of rate"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(MIN_BURST, self.rate * BURST_SECONDS))
+        self._tokens = self.capacity
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """ Block until amount bytes may be sent. """
+        while amount > 0:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                take = min(amount, self.capacity)
+                if self._tokens >= take:
+                    self._tokens -= take
+                    amount -= take
+                    continue
+                wait = (take - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ThrottledStream(object):
+    """ File-like request body reading from another one while honouring a TokenBucket.
+
+        :param stream: the file-like body to read from
+        :param length: number of bytes in the body
+        :param bucket: the TokenBucket limiting the bandwidth"""
+
+    def __init__(self, stream, length, bucket):
+        self.stream = stream
+        self.length = length
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bucket.consume(len(data))
+        return data
+
+    def __len__(self):
+        return self.length
+
+    def tell(self):
+        return self.stream.tell()
+
+    def seek(self, offset, whence=0):
+        return self.stream.seek(offset, whence)
+
+
+class UploadSlot(object):
+
+    def __init__(self, size):
+        self.size = size
+        self.ok = True
+
+
+class UploadScheduler(object):
+    """ Decides when uploads may start. Waiting uploads start smallest first, the number of uploads running at once
+        adapts to the observed throughput (it grows while adding uploads increases throughput, shrinks when it
+        doesn't and halves on errors) and all uploads share a global bandwidth cap.
+
+        :param max_bandwidth: bytes per second shared by all uploads, unlimited if None
+        :param max_concurrency: maximum number of concurrent uploads
+        :param initial_concurrency: number of concurrent uploads to start with"""
+
+    def __init__(self, max_bandwidth=None, max_concurrency=DEFAULT_MAX_UPLOADS,
+                 initial_concurrency=DEFAULT_INITIAL_UPLOADS):
+        self.bucket = TokenBucket(max_bandwidth) if max_bandwidth else None
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.limit = max(1, min(int(initial_concurrency), self.max_concurrency))
+        self._active = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._last_throughput = None
+        self._reset_window()
+
+    def set_concurrency(self, concurrency):
+        """ Restart the adaptation from the given number of concurrent uploads, capped by max_concurrency, ex. the
+            --jobs asked for by the user. """
+        with self._condition:
+            self.limit = max(1, min(int(concurrency), self.max_concurrency))
+            self._last_throughput = None
+            self._reset_window()
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, size):
+        """ Wait for the upload of size bytes to be allowed to start, mark the yielded UploadSlot not ok if the
+            upload failed. An exception raised by the upload counts as a failure. """
+        slot = UploadSlot(size)
+        self._acquire(size)
+        try:
+            yield slot
+        except Exception:
+            slot.ok = False
+            raise
+        finally:
+            self._release(slot)
+
+    def _acquire(self, size):
+        with self._condition:
+            ticket = (size, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or self._active >= self.limit:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._condition.notify_all()
+
+    def _release(self, slot):
+        with self._condition:
+            self._active -= 1
+            if slot.ok:
+                self._window_bytes += slot.size
+                self._window_count += 1
+                if self._window_count >= self.limit:
+                    self._adapt(self._window_bytes / max(time.time() - self._window_start, 1e-6))
+            else:
+                # Back off hard on errors, the link or the server is overwhelmed
+                self.limit = max(1, self.limit // 2)
+                self._last_throughput = None
+                self._reset_window()
+            self._condition.notify_all()
+
+    def _adapt(self, throughput):
+        if self._last_throughput is None or throughput > self._last_throughput * (1 + THROUGHPUT_TOLERANCE):
+            self.limit = min(self.max_concurrency, self.limit + 1)
+        elif throughput < self._last_throughput * (1 - THROUGHPUT_TOLERANCE):
+            self.limit = max(1, self.limit - 1)
+        self._last_throughput = throughput
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.time()
+        self._window_bytes = 0
+        self._window_count = 0
@@ -0,0 +1,218 @@
+import random
+import threading
+import time
+from urlparse import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Status codes for which the request is known not to have been processed, safe to retry for any method
+UNPROCESSED_STATUS_CODES = (429, 503)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """ The overall deadline of the running command passed before the request could complete. """
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """ Requests to a host are failing fast after repeated failures. """
+
+
+class CircuitBreaker(object):
+    """ Tracks consecutive failures per host. Once `threshold` failures in a row are seen, requests to that host
+        fail fast for `cooldown` seconds, after which a single trial request is let through.
+
+        :param threshold: number of consecutive failures opening the circuit
+        :param cooldown: number of seconds the circuit stays open"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._opened_at = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.time() - opened_at >= self.cooldown:
+                # Half open: let one request through, a failure re-opens the circuit right away
+                self._opened_at.pop(host)
+                self._failures[host] = self.threshold - 1
+                return True
+            return False
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, host):
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.threshold:
+                self._opened_at[host] = time.time()
+
+
+class Session(object):
+    """ Shared HTTP transport for every call made to the Mason platform. Connections are pooled per host and
+        kept alive, so consecutive requests to the same host reuse an already established TCP/TLS connection
+        instead of paying for a new handshake each time.
+
+        Every request gets connect/read timeouts bounded by the overall deadline of the command. Failed requests
+        are retried with jittered exponential backoff when it is safe to do so: idempotent methods on connection
+        errors and retry-safe status codes, any method when the request provably wasn't processed. A circuit
+        breaker makes requests fail fast while a host keeps failing.
+
+        :param pool_connections: number of per-host connection pools to cache
+        :param pool_maxsize: maximum number of connections kept alive in each pool
+        :param connect_timeout: seconds to wait for a connection to be established
+        :param read_timeout: seconds to wait for the server between bytes
+        :param retries: maximum number of retries of a single request
+        :param backoff: base delay in seconds of the exponential backoff
+        :param on_retry: called with (method, url, attempt, response, error, delay) before every retry"""
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, on_retry=None):
+        self.pool_connections = int(pool_connections or DEFAULT_POOL_CONNECTIONS)
+        self.pool_maxsize = int(pool_maxsize or DEFAULT_POOL_MAXSIZE)
+        self.connect_timeout = connect_timeout or DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or DEFAULT_READ_TIMEOUT
+        self.retries = DEFAULT_RETRIES if retries is None else int(retries)
+        self.backoff = DEFAULT_BACKOFF if backoff is None else backoff
+        self.on_retry = on_retry
+        self.breaker = CircuitBreaker()
+        self.deadline = None
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def _get_session(self):
+        session = self._session
+        if session is None:
+            # Threads often make their first request at the same time, they must all share one connection pool
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                session = self._session
+        return session
+
+    def set_deadline(self, seconds):
+        """ Bound the time all further requests may take, in seconds from now. None removes the deadline. """
+        self.deadline = None if seconds is None else time.time() + seconds
+
+    def _remaining(self):
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def _timeout(self):
+        remaining = self._remaining()
+        if remaining is None:
+            return self.connect_timeout, self.read_timeout
+        if remaining <= 0:
+            raise DeadlineExceeded('Command deadline exceeded')
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def _delay(self, attempt, response=None):
+        retry_after = response is not None and response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), MAX_BACKOFF)
+        # Full jitter keeps concurrent clients from retrying in lock step
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * (2 ** (attempt - 1))))
+
+    def _wait(self, delay):
+        remaining = self._remaining()
+        if remaining is not None and delay >= remaining:
+            return False
+        time.sleep(delay)
+        return True
+
+    def request(self, method, url, retry=None, **kwargs):
+        """ Send a request, retrying it according to the session policy.
+
+            :param retry: whether the request may be retried, defaults to True for idempotent methods"""
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        host = urlparse(url).netloc
+
+        # Remember where a streamed body starts so it can be rewound for a retry
+        body = kwargs.get('data')
+        position = body.tell() if hasattr(body, 'tell') and hasattr(body, 'seek') else None
+
+        timeout = kwargs.pop('timeout', None)
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow(host):
+                raise CircuitOpen('Too many failed requests to {}, not retrying for now'.format(host))
+            session_timeout = self._timeout()
+            kwargs['timeout'] = session_timeout if timeout is None else timeout
+
+            try:
+                r = self._get_session().request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self.breaker.record_failure(host)
+                # A connection that was never established can't have been processed
+                safe = retry or isinstance(err, requests.exceptions.ConnectTimeout)
+                if not safe or attempt > self.retries:
+                    raise
+                delay = self._delay(attempt)
+                self._report(method, url, attempt, None, err, delay)
+                if not self._wait(delay):
+                    raise err
+            else:
+                if r.status_code >= 500:
+                    self.breaker.record_failure(host)
+                else:
+                    self.breaker.record_success(host)
+
+                safe = retry or r.status_code in UNPROCESSED_STATUS_CODES
+                if r.status_code not in RETRY_STATUS_CODES or not safe or attempt > self.retries:
+                    return r
+                delay = self._delay(attempt, r)
+                self._report(method, url, attempt, r, None, delay)
+                if not self._wait(delay):
+                    return r
+
+            if position is not None:
+                body.seek(position)
+
+    def _report(self, method, url, attempt, response, error, delay):
+        if self.on_retry:
+            self.on_retry(method, url, attempt, response, error, delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
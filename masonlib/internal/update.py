@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+
+import packaging.version
+import requests
+
+VERSION_URL = 'https://raw.githubusercontent.com/MasonAmerica/mason-cli/master/VERSION'
+DISABLE_ENV = 'MASON_CLI_NO_UPDATE_CHECK'
+CHECK_TTL = 24 * 60 * 60
+CHECK_TIMEOUT = 2
+
+
+class UpdateCheck(object):
+    """ Checks for a newer mason-cli release in the background. The outcome of the last check is cached on disk
+        so the remote is contacted at most once per `ttl` seconds, whether or not that attempt succeeded.
+
+        :param current_version: the version of the running mason-cli
+        :param cache_file: path of the file used to cache the last check"""
+
+    def __init__(self, current_version, cache_file, url=VERSION_URL, ttl=CHECK_TTL, timeout=CHECK_TIMEOUT):
+        self.current_version = packaging.version.parse(current_version)
+        self.cache_file = cache_file
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.remote_version = None
+        self._thread = None
+
+    @staticmethod
+    def is_disabled(stream):
+        if os.environ.get(DISABLE_ENV):
+            return True
+        return not hasattr(stream, 'isatty') or not stream.isatty()
+
+    def start(self):
+        cached = self._load_cache()
+        if cached and time.time() - cached.get('checked_at', 0) < self.ttl:
+            self.remote_version = cached.get('remote_version')
+            return
+
+        self._thread = threading.Thread(target=self._check)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def newer_version(self, deadline=None):
+        """ Returns the newer remote version if one is known, waiting at most `deadline` seconds for a running
+            check to complete. """
+        if self._thread:
+            self._thread.join(self.timeout if deadline is None else deadline)
+        if not self.remote_version:
+            return None
+        try:
+            remote_version = packaging.version.parse(self.remote_version)
+        except (TypeError, ValueError):
+            return None
+        if remote_version > self.current_version:
+            return remote_version
+        return None
+
+    def _check(self):
+        remote_version = None
+        try:
+            r = requests.get(self.url, timeout=self.timeout)
+            if r.status_code == 200 and r.text:
+                remote_version = r.text.strip()
+        except requests.RequestException:
+            pass
+        self.remote_version = remote_version
+        self._write_cache({'checked_at': time.time(), 'remote_version': remote_version})
+
+    def _load_cache(self):
+        if not os.path.isfile(self.cache_file):
+            return None
+
+        with open(self.cache_file) as data_file:
+            try:
+                return json.load(data_file)
+            except ValueError:
+                return None
+
+    def _write_cache(self, data):
+        try:
+            with open(self.cache_file, 'w') as outfile:
+                json.dump(data, outfile)
+        except IOError:
+            pass
@@ -0,0 +1,90 @@
+import io
+import os
+import time
+
+from tqdm import tqdm
+
+BUFFER_SIZE = 1 << 20
+PROGRESS_INTERVAL = 0.2
+
+
+class UploadBody(object):
+    """ File-like request body used to stream an artifact to a signed url. The file is read through a large
+        buffer, every read honours the requested size and the progress bar is refreshed at a fixed rate rather
+        than on every read, so uploading a large file does not turn into millions of Python level iterations.
+
+        :param filename: path of the file to upload
+        :param progress: whether to display a progress bar
+        :param buffer_size: size of the read buffer in bytes
+        :param throttle: optional TokenBucket limiting the upload bandwidth"""
+
+    def __init__(self, filename, progress=True, buffer_size=BUFFER_SIZE, throttle=None):
+        self.filename = filename
+        self.buffer_size = int(buffer_size)
+        self.throttle = throttle
+        self.totalsize = os.stat(filename).st_size
+        self._file = io.open(filename, 'rb', buffering=self.buffer_size)
+        self._pending = 0
+        self._last_refresh = 0
+        self.pbar = None
+        if progress:
+            self.pbar = tqdm(total=self.totalsize, ncols=100, unit='B', unit_scale=True, dynamic_ncols=True)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._file.read()
+        else:
+            data = self._file.read(size)
+        if self.throttle:
+            self.throttle.consume(len(data))
+        self._update_progress(len(data))
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.buffer_size)
+            if not data:
+                break
+            yield data
+
+    def __len__(self):
+        return self.totalsize
+
+    def tell(self):
+        return self._file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Rewinding for a retried request restarts the progress bar along with the file
+        position = self._file.seek(offset, whence)
+        if self.pbar:
+            self.pbar.n = position
+            self.pbar.refresh()
+        self._pending = 0
+        return position
+
+    def close(self):
+        self._flush_progress()
+        if self.pbar:
+            self.pbar.close()
+            self.pbar = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _update_progress(self, length):
+        if not self.pbar:
+            return
+        self._pending += length
+        now = time.time()
+        if not length or now - self._last_refresh >= PROGRESS_INTERVAL:
+            self._last_refresh = now
+            self._flush_progress()
+
+    def _flush_progress(self):
+        if self.pbar and self._pending:
+            self.pbar.update(self._pending)
+            self._pending = 0
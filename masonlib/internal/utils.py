@@ -1,7 +1,106 @@
+import base64
+import binascii
 import hashlib
+import json
+import sys
+import threading
+from contextlib import contextmanager
+from Queue import Queue
+
 import colorama
 
 
+DIGEST_BUFFER_SIZE = 1 << 20
+DEFAULT_DIGESTS = ('md5', 'sha1')
+
+
+class FileDigests(object):
+    """
+    Digests of a file computed in a single pass by `digest_file`.
+    """
+
+    def __init__(self, size, hashes):
+        self.size = size
+        self._hashes = hashes
+
+    def digest(self, type_of_hash):
+        return self._hashes[type_of_hash].digest()
+
+    def hexdigest(self, type_of_hash):
+        return self._hashes[type_of_hash].hexdigest()
+
+    def to_dict(self):
+        return dict((type_of_hash, digest.hexdigest()) for type_of_hash, digest in self._hashes.items())
+
+    @staticmethod
+    def from_dict(size, hexdigests):
+        """ Restore digests recorded with to_dict. """
+        return FileDigests(size, dict((type_of_hash, _KnownDigest(hexdigest))
+                                      for type_of_hash, hexdigest in hexdigests.items()))
+
+
+class _KnownDigest(object):
+
+    def __init__(self, hexdigest):
+        self._hexdigest = str(hexdigest)
+
+    def digest(self):
+        return binascii.unhexlify(self._hexdigest)
+
+    def hexdigest(self):
+        return self._hexdigest
+
+
+def digest_file(filename, types_of_hash=DEFAULT_DIGESTS):
+    """
+    Compute several digests of a file while reading it only once. The file is read in large chunks and, when
+    more than one digest is requested, every digest is updated on its own thread since hashlib releases the
+    GIL while hashing large buffers.
+    :param filename:
+    :param types_of_hash: names of hashlib algorithms, ex. ('md5', 'sha1', 'sha256')
+    :return: A FileDigests record
+    """
+    hashes = dict((type_of_hash, hashlib.new(type_of_hash)) for type_of_hash in types_of_hash)
+    size = 0
+
+    workers = []
+    if len(hashes) > 1:
+        for h in hashes.values():
+            chunks = Queue(maxsize=4)
+            worker = threading.Thread(target=_update_digest, args=(h, chunks))
+            worker.daemon = True
+            worker.start()
+            workers.append((worker, chunks))
+
+    try:
+        with open(filename, 'rb') as file_to_hash:
+            while True:
+                chunk = file_to_hash.read(DIGEST_BUFFER_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if workers:
+                    for _, chunks in workers:
+                        chunks.put(chunk)
+                else:
+                    for h in hashes.values():
+                        h.update(chunk)
+    finally:
+        for worker, chunks in workers:
+            chunks.put(None)
+            worker.join()
+
+    return FileDigests(size, hashes)
+
+
+def _update_digest(h, chunks):
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        h.update(chunk)
+
+
 def hash_file(filename, type_of_hash, as_hex):
     """
     Hash a file using SHA1 or MD5
@@ -10,25 +109,90 @@ def hash_file(filename, type_of_hash, as_hex):
     :param as_hex: True to return a string of hex digits
     :return: The hash of the requested file
     """
-    if type_of_hash == 'sha1':
-        h = hashlib.sha1()
-    else:
-        h = hashlib.md5()
+    if type_of_hash != 'sha1':
+        type_of_hash = 'md5'
 
-    with open(filename, 'rb') as file_to_hash:
-        # loop till the end of the file
-        chunk = 0
-        while chunk != b'':
-            # read only 1024 bytes at a time
-            chunk = file_to_hash.read(1024)
-            h.update(chunk)
+    digests = digest_file(filename, (type_of_hash,))
 
     # return the hex representation of digest
     if as_hex:
-        return h.hexdigest()
+        return digests.hexdigest(type_of_hash)
     else:
         # return regular digest
-        return h.digest()
+        return digests.digest(type_of_hash)
+
+
+def decode_jwt_claims(token):
+    """
+    Decode the claims of a JWT without verifying its signature. Only meant for reading non-sensitive
+    information such as the expiry of a token we already trust.
+    :param token: The encoded JWT
+    :return: A dict of claims, or None if the token could not be decoded
+    """
+    try:
+        payload = str(token).split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, TypeError, ValueError):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    return claims
+
+
+class _ThreadOutput(object):
+    """ Stands in for sys.stdout while threads capture their output: what a capturing thread prints goes to its
+        own buffer, everything else to the wrapped stream.
+
+        :param stream: the stream being wrapped"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.captures = 0
+        self._local = threading.local()
+
+    @property
+    def buffer(self):
+        return getattr(self._local, 'buffer', None)
+
+    @buffer.setter
+    def buffer(self, value):
+        self._local.buffer = value
+
+    def write(self, data):
+        (self.buffer or self.stream).write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_output_lock = threading.Lock()
+
+
+@contextmanager
+def capture_output(buffer):
+    """
+    Capture what the calling thread prints, other threads keep printing to stdout.
+    :param buffer: file like object the output is written to
+    """
+    with _output_lock:
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+        output = sys.stdout
+        output.captures += 1
+    output.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        output.buffer = None
+        with _output_lock:
+            output.captures -= 1
+            if not output.captures and sys.stdout is output:
+                sys.stdout = output.stream
 
 
 def print_err(config, msg):
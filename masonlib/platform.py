@@ -1,5 +1,6 @@
-from masonlib.imason import IMason
+from masonlib.imason import IMason, IAsyncMason
 
+from masonlib.internal.async_mason import AsyncMason
 from masonlib.internal.mason import Mason
 
 
@@ -11,10 +12,12 @@ class Platform(object):
     def get(self, interface):
         """
         Get a specific interface from the Mason Platform
-        :param interface: (ex, IMason)
+        :param interface: (ex, IMason or IAsyncMason)
         :return: instance of the given interface
         """
-        if type(interface) is IMason.__class__:
+        if interface is IAsyncMason:
+            return AsyncMason(self.config)
+        elif type(interface) is IMason.__class__:
             return Mason(self.config)
         else:
             raise NotImplementedError("Interface " + str(interface) + " is unknown")
@@ -0,0 +1,78 @@
+"""
+Measures the time and peak memory of parsing a large APK, opened from its path and from an in memory copy (how
+every APK used to be parsed). Every run happens in a fresh process so the peak RSS is its own.
+
+Usage:
+    python bench_apk.py [--size 256] [--assets 2000] [--runs 3]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+import zipfile
+
+from masonlib.external.apk_parse.apk import APK
+from masonlib.external.apk_parse.util import read
+
+MB = 1 << 20
+TEST_APK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'res', 'v1.apk')
+
+
+def create_apk(filename, size, assets):
+    """ Copy of the test APK padded with stored random assets, size MB in total. """
+    source = zipfile.ZipFile(TEST_APK)
+    with zipfile.ZipFile(filename, 'w') as apk:
+        for info in source.infolist():
+            apk.writestr(info, source.read(info.filename))
+        chunk = os.urandom(max(1, size * MB // max(1, assets)))
+        for i in range(assets):
+            apk.writestr(zipfile.ZipInfo('assets/asset-{}.bin'.format(i)), chunk)
+
+
+def _peak_rss():
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 if os.uname()[0] == 'Darwin' else peak
+
+
+def _parse(filename, raw, results):
+    baseline = _peak_rss()
+    start = time.time()
+    apk = APK(read(filename), raw=True) if raw else APK(filename)
+    wall = time.time() - start
+    results.put((wall, (_peak_rss() - baseline) / 1024.0, apk.get_package()))
+
+
+def measure(filename, raw):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_parse, args=(filename, raw, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main(options):
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'bench.apk')
+        create_apk(filename, options.size, options.assets)
+        print 'APK: {:.1f}MB, {} entries'.format(os.path.getsize(filename) / float(MB), options.assets)
+        print '{:<10} {:>8} {:>14}'.format('mode', 'wall s', 'peak RSS +MB')
+        for mode, raw in (('path', False), ('in memory', True)):
+            for _ in range(options.runs):
+                wall, rss, _ = measure(filename, raw)
+                print '{:<10} {:>8.3f} {:>14.1f}'.format(mode, wall, rss)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=256, help='size of the APK in MB')
+    parser.add_argument('--assets', type=int, default=2000, help='number of assets in the APK')
+    parser.add_argument('--runs', type=int, default=3, help='runs per mode')
+    main(parser.parse_args())
@@ -0,0 +1,194 @@
+"""
+End to end register, stage and deploy benchmarks against the fake platform, which runs in a separate process so
+the reported CPU time is the client's alone.
+
+Usage:
+    python bench_platform.py [--sizes 1,16] [--jobs 1,4] [--count 8] [--latency 0.02] [--bandwidth MB/s]
+                             [--error-rate 0]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from mock import MagicMock
+
+from fake_platform import FakePlatform, attach
+from masonlib.imason import IMason
+from masonlib.internal.artifacts import IArtifact
+from masonlib.platform import Platform
+
+MB = 1 << 20
+
+
+class BenchArtifact(IArtifact):
+    """ Artifact of arbitrary content, so only the register flow itself is measured. """
+
+    def __init__(self, name, binary):
+        self.name = name
+        self.binary = binary
+
+    def is_valid(self):
+        return True
+
+    def get_content_type(self):
+        return 'application/octet-stream'
+
+    def get_type(self):
+        return 'media'
+
+    def get_sub_type(self):
+        return 'bench'
+
+    def get_name(self):
+        return self.name
+
+    def get_version(self):
+        return '1'
+
+    def get_registry_meta_data(self):
+        return None
+
+    def get_details(self):
+        return None
+
+
+def _serve(options, ready, stop):
+    platform = FakePlatform(latency=options.latency, bandwidth=options.bandwidth and options.bandwidth * MB,
+                            error_rate=options.error_rate, build_polls=0, seed=1).start()
+    ready.put((platform.url(), platform.tokens))
+    stop.wait()
+    platform.stop()
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+class Bench(object):
+
+    def __init__(self, options, base_url, tokens, directory):
+        self.options = options
+        self.base_url = base_url
+        self.tokens = tokens
+        self.directory = directory
+
+    def _mason(self):
+        config = MagicMock()
+        config.skip_verify = True
+        config.verbose = False
+        config.no_colorize = True
+        config.pool_connections = config.pool_maxsize = config.timeout = config.retries = config.deadline = None
+        config.max_bandwidth = None
+        state = tempfile.mkdtemp(dir=self.directory)
+        return attach(Platform(config).get(IMason), state, self.base_url, self.tokens)
+
+    def _run(self, scenario, size, jobs, phase, operations, mason, nbytes=0):
+        cpu = os.times()
+        start = time.time()
+        ok = operations()
+        wall = time.time() - start
+        cpu = sum(os.times()[:2]) - sum(cpu[:2])
+        mason.session.close()
+
+        latencies = [span.duration * 1000 for span in mason.metrics.spans if span.phase == phase]
+        return '{:<8} {:>6} {:>4} {:>4} {:>7.2f} {:>8.1f} {:>7.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>6.2f} {}'.format(
+            scenario, size, jobs, len(latencies), wall, nbytes / float(MB) / wall, len(latencies) / wall,
+            _percentile(latencies, 50), _percentile(latencies, 90), _percentile(latencies, 99), cpu,
+            'ok' if ok else 'FAILED')
+
+    def register(self, size, jobs):
+        mason = self._mason()
+        binaries = []
+        for i in range(self.options.count):
+            binary = os.path.join(self.directory, 'bench-{}-{}-{}.bin'.format(size, jobs, i))
+            with open(binary, 'wb') as artifact:
+                chunk = os.urandom(min(size * MB, MB))
+                for _ in range(max(1, size)):
+                    artifact.write(chunk)
+            binaries.append(binary)
+
+        mason._get_parser = lambda item_type: lambda config, binary, digests: BenchArtifact(os.path.basename(binary),
+                                                                                          binary)
+        try:
+            return self._run('register', '{}MB'.format(size), jobs, 'upload',
+                             lambda: mason.register_batch('media', binaries, jobs), mason,
+                             sum(os.path.getsize(binary) for binary in binaries))
+        finally:
+            for binary in binaries:
+                os.remove(binary)
+
+    def stage(self):
+        mason = self._mason()
+        configs = []
+        for i in range(self.options.count):
+            config_yaml = os.path.join(self.directory, 'bench-stage-{}.yml'.format(i))
+            with open(config_yaml, 'w') as config_file:
+                config_file.write('os:\n  name: bench-stage\n  version: {}\n'.format(i + 1))
+            configs.append(config_yaml)
+
+        def stage_all():
+            # Stage works on the parsed artifact, so configs are staged one at a time like the CLI does
+            return all(mason.parse_os_config(config_yaml) and mason.stage(config_yaml) for config_yaml in configs)
+
+        return self._run('stage', '-', 1, 'build', stage_all, mason)
+
+    def deploy(self, jobs):
+        mason = self._mason()
+        groups = ['group-{}'.format(i) for i in range(self.options.count)]
+        return self._run('deploy', '-', jobs, 'deploy',
+                         lambda: mason.deploy_batch('config', 'bench-stage', '1', groups, False, jobs), mason)
+
+
+def main(options):
+    ready = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(options, ready, stop))
+    server.start()
+    directory = tempfile.mkdtemp()
+    try:
+        base_url, tokens = ready.get(timeout=10)
+        bench = Bench(options, base_url, tokens, directory)
+        scenarios = [(bench.register, (size, jobs)) for size in options.sizes for jobs in options.jobs]
+        scenarios.append((bench.stage, ()))
+        scenarios.extend((bench.deploy, (jobs,)) for jobs in options.jobs)
+
+        print '{:<8} {:>6} {:>4} {:>4} {:>7} {:>8} {:>7} {:>8} {:>8} {:>8} {:>6}'.format(
+            'scenario', 'size', 'jobs', 'ops', 'wall s', 'MB/s', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'cpu s')
+        stdout, stderr = sys.stdout, os.dup(2)
+        with open(os.path.join(directory, 'bench.log'), 'w') as log:
+            for scenario, args in scenarios:
+                # Keep the output and progress bars of the CLI itself out of the results
+                sys.stdout = log
+                os.dup2(log.fileno(), 2)
+                try:
+                    row = scenario(*args)
+                finally:
+                    sys.stdout = stdout
+                    os.dup2(stderr, 2)
+                print row
+    finally:
+        stop.set()
+        server.join()
+        shutil.rmtree(directory)
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=_int_list, default=[1, 16], help='artifact sizes in MB')
+    parser.add_argument('--jobs', type=_int_list, default=[1, 4], help='concurrency levels')
+    parser.add_argument('--count', type=int, default=8, help='operations per scenario')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every platform response')
+    parser.add_argument('--bandwidth', type=float, default=None, help='upload bandwidth in MB/s, unlimited if unset')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests failing with a 503')
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+"""
+Measures loading the main string pool of resources.arsc and decoding all of its strings, with the previous byte at a
+time implementation and the current one.
+
+Usage:
+    python bench_strings.py [--apk res/v1.apk] [--runs 10]
+"""
+import argparse
+import time
+from struct import pack, unpack
+
+from masonlib.external.apk_parse import bytecode
+from masonlib.external.apk_parse.apk import APK, StringBlock, UTF8_FLAG
+
+
+class LegacyStringBlock(object):
+    """ The previous string pool: a Python list of the bytes, strings rebuilt a byte at a time. """
+
+    def __init__(self, buff):
+        self._cache = {}
+        unpack('<h', buff.read(2))
+        unpack('<h', buff.read(2))
+        self.chunkSize = unpack('<i', buff.read(4))[0]
+        self.stringCount = unpack('<i', buff.read(4))[0]
+        styleOffsetCount = unpack('<i', buff.read(4))[0]
+        self.m_isUTF8 = (unpack('<i', buff.read(4))[0] & UTF8_FLAG) != 0
+        self.stringsOffset = unpack('<i', buff.read(4))[0]
+        self.stylesOffset = unpack('<i', buff.read(4))[0]
+
+        self.m_stringOffsets = []
+        self.m_strings = []
+        for i in range(0, self.stringCount):
+            self.m_stringOffsets.append(unpack('<i', buff.read(4))[0])
+        for i in range(0, styleOffsetCount):
+            unpack('<i', buff.read(4))
+
+        size = self.chunkSize - self.stringsOffset
+        if self.stylesOffset != 0:
+            size = self.stylesOffset - self.stringsOffset
+        for i in range(0, size):
+            self.m_strings.append(unpack('=b', buff.read(1))[0])
+
+    def getString(self, idx):
+        if idx in self._cache:
+            return self._cache[idx]
+
+        offset = self.m_stringOffsets[idx]
+        if not self.m_isUTF8:
+            length = (self.m_strings[offset + 1] & 0xff) << 8 | self.m_strings[offset] & 0xff
+            self._cache[idx] = self.decode(offset + 2, length)
+        else:
+            offset += self.getVarint(offset)[1]
+            length, size = self.getVarint(offset)
+            self._cache[idx] = self.decode2(offset + size, length)
+        return self._cache[idx]
+
+    def decode(self, offset, length):
+        data = ""
+        for i in range(0, length * 2):
+            data += unicode(pack("=b", self.m_strings[offset + i]), errors='ignore')
+            if data[-2:] == "\x00\x00":
+                break
+        end_zero = data.find("\x00\x00")
+        if end_zero != -1:
+            data = data[:end_zero]
+        return data.decode("utf-16", 'replace')
+
+    def decode2(self, offset, length):
+        data = ""
+        for i in range(0, length):
+            data += unicode(pack("=b", self.m_strings[offset + i]), errors='ignore')
+        return data.decode("utf-8", 'replace')
+
+    def getVarint(self, offset):
+        val = self.m_strings[offset]
+        if not val & 0x80:
+            return val & 0x7f, 1
+        return (val & 0x7f) << 8 | self.m_strings[offset + 1] & 0xff, 2
+
+
+def measure(block_class, arsc, runs):
+    load = decode = 0.0
+    for _ in range(runs):
+        buff = bytecode.BuffHandle(arsc)
+        # Skip the table header
+        buff.read(12)
+        start = time.time()
+        pool = block_class(buff)
+        load += time.time() - start
+        start = time.time()
+        for i in range(pool.stringCount):
+            pool.getString(i)
+        decode += time.time() - start
+    return pool.stringCount, load / runs * 1000, decode / runs * 1000
+
+
+def main(options):
+    arsc = APK(options.apk).get_file('resources.arsc')
+    print '{:<8} {:>8} {:>9} {:>10}'.format('pool', 'strings', 'load ms', 'decode ms')
+    for name, block_class in (('legacy', LegacyStringBlock), ('current', StringBlock)):
+        print '{:<8} {:>8} {:>9.2f} {:>10.2f}'.format(name, *measure(block_class, arsc, options.runs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--apk', default='res/v1.apk', help='APK whose resources.arsc is decoded')
+    parser.add_argument('--runs', type=int, default=10, help='runs per implementation')
+    main(parser.parse_args())
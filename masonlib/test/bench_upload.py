@@ -0,0 +1,94 @@
+"""
+Measures signed url upload throughput against a local sink server.
+
+Usage:
+    python bench_upload.py [size in MB]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import requests
+
+from masonlib.internal.upload import UploadBody
+
+READ_SIZE = 1 << 16
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        remaining = int(self.headers.getheader('Content-Length', 0))
+        while remaining > 0:
+            data = self.rfile.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SinkServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LegacyUploadBody(object):
+    """ The previous upload body: 10 byte reads with a progress update per read. """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.totalsize = os.stat(filename).st_size
+
+    def read(self, size=-1):
+        return self.file.read(10)
+
+    def __len__(self):
+        return self.totalsize
+
+
+def _measure(url, body):
+    start = time.time()
+    cpu_start = time.clock()
+    r = requests.put(url, data=body)
+    cpu = time.clock() - cpu_start
+    elapsed = time.time() - start
+    assert r.status_code == 200
+    return elapsed, cpu
+
+
+def main(size_mb):
+    server = SinkServer(('127.0.0.1', 0), SinkHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{}/upload'.format(server.server_address[1])
+
+    fd, filename = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            chunk = os.urandom(1 << 20)
+            for _ in range(size_mb):
+                f.write(chunk)
+
+        with UploadBody(filename, progress=False) as body:
+            elapsed, cpu = _measure(url, body)
+        print 'UploadBody:   {:8.1f} MB/s  ({:.2f}s wall, {:.2f}s cpu)'.format(size_mb / elapsed, elapsed, cpu)
+
+        elapsed, cpu = _measure(url, LegacyUploadBody(filename))
+        print '10 byte reads: {:7.1f} MB/s  ({:.2f}s wall, {:.2f}s cpu)'.format(size_mb / elapsed, elapsed, cpu)
+    finally:
+        os.remove(filename)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
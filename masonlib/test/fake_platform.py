@@ -0,0 +1,334 @@
+"""
+Local stand-in for the Mason platform: Auth0 login and userinfo, the registry signer, an upload sink, the registry,
+the builder and the deploy endpoints. Latency, bandwidth and errors can be injected so the register, stage, build
+and deploy flows can be exercised and measured without any network access.
+"""
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qs, urlparse
+
+import yaml
+
+from masonlib.internal.journal import Journal
+from masonlib.internal.ledger import Ledger
+from masonlib.internal.persist import Persist
+from masonlib.internal.store import CURRENT_CONFIG_VERSION, Store
+
+CUSTOMER = 'mason-test'
+READ_SIZE = 1 << 16
+BUILD_POLLS = 2
+
+
+def _encode_segment(data):
+    return base64.urlsafe_b64encode(json.dumps(data)).rstrip('=')
+
+
+def create_token(subject, ttl=60 * 60):
+    """ Unsigned JWT, good enough for the claims the CLI reads. """
+    return '.'.join([_encode_segment({'alg': 'none', 'typ': 'JWT'}),
+                     _encode_segment({'sub': subject, 'exp': int(time.time() + ttl),
+                                      'jti': os.urandom(8).encode('hex')}),
+                     'signature'])
+
+
+class FakePlatformHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _handle(self, method):
+        platform = self.server
+        url = urlparse(self.path)
+        route = platform.route(method, url.path)
+        platform.count(route[0] if route else 'unknown')
+
+        if platform.latency:
+            time.sleep(platform.latency)
+        if platform.should_fail():
+            self._drain()
+            return self._respond(platform.error_status, {'error': 'injected'}, {'Retry-After': '0'})
+        if not route:
+            self._drain()
+            return self._respond(404, {'error': 'not found'})
+
+        name, args = route
+        getattr(self, '_' + name)(url, *args)
+
+    def _authorized(self, token):
+        if self.headers.getheader('Authorization') == 'Bearer {}'.format(token):
+            return True
+        self._drain()
+        self._respond(401, {'error': 'unauthorized'})
+        return False
+
+    def _auth(self, url):
+        payload = self._read_json()
+        if not payload.get('username') or not payload.get('password'):
+            return self._respond(401, {'error': 'invalid credentials'})
+        tokens = dict(self.server.tokens)
+        if 'offline_access' in payload.get('scope', '').split() and payload.get('device'):
+            tokens['refresh_token'] = self.server.refresh_token
+        self._respond(200, tokens)
+
+    def _token(self, url):
+        payload = self._read_json()
+        if payload.get('grant_type') != 'refresh_token' or payload.get('refresh_token') != self.server.refresh_token:
+            return self._respond(403, {'error': 'invalid_grant'})
+        self._respond(200, self.server.issue_tokens())
+
+    def _user_info(self, url):
+        if self._authorized(self.server.tokens['access_token']):
+            self._respond(200, {'user_metadata': {'clients': [CUSTOMER]}})
+
+    def _signed_url(self, url, customer, name, version):
+        if not self._authorized(self.server.tokens['id_token']):
+            return
+        query = parse_qs(url.query)
+        storage_url = self.server.url('/storage/{}/{}/{}/{}'.format(customer, query.get('type', [''])[0], name,
+                                                                    version))
+        self._respond(200, {'signed_request': storage_url + '?signature=fake', 'url': storage_url})
+
+    def _upload(self, url, key):
+        md5 = hashlib.md5()
+        sha1 = hashlib.sha1()
+        size = self._drain(md5, sha1)
+        if base64.b64encode(md5.digest()) != self.headers.getheader('Content-MD5'):
+            return self._respond(400, {'error': 'Content-MD5 mismatch'})
+        with self.server.lock:
+            self.server.uploads[key] = {'size': size, 'sha1': sha1.hexdigest()}
+        self._respond(200)
+
+    def _lookup(self, url, customer, name, version):
+        if not self._authorized(self.server.tokens['id_token']):
+            return
+        key = '/'.join([customer, parse_qs(url.query).get('type', [''])[0], name, version])
+        artifact = self.server.artifacts.get(key)
+        if not artifact:
+            return self._respond(404, {'error': 'not found'})
+        self._respond(200, artifact)
+
+    def _register(self, url, customer):
+        if not self._authorized(self.server.tokens['id_token']):
+            return
+        payload = self._read_json()
+        upload = self.server.uploads.get(urlparse(payload.get('url', '')).path[len('/storage/'):])
+        if not upload or upload['sha1'] != payload.get('checksum', {}).get('sha1'):
+            return self._respond(400, {'data': 'artifact was not uploaded'})
+        key = '/'.join([customer, payload['type'], str(payload['name']), str(payload['version'])])
+        with self.server.lock:
+            if key in self.server.artifacts:
+                return self._respond(409, {'data': 'artifact already registered'})
+            self.server.artifacts[key] = payload
+        self._respond(200, payload)
+
+    def _queue_build(self, url, customer):
+        if not self._authorized(self.server.tokens['id_token']):
+            return
+        payload = self._read_json()
+        with self.server.lock:
+            job_id = 'job-{}'.format(len(self.server.jobs) + 1)
+            self.server.jobs[job_id] = {'payload': payload, 'polls': 0}
+        self._respond(200, {'data': {'id': job_id, 'status': 'queued'}})
+
+    def _build_status(self, url, customer, job_id):
+        if not self._authorized(self.server.tokens['id_token']):
+            return
+        with self.server.lock:
+            job = self.server.jobs.get(job_id)
+            if job:
+                job['polls'] += 1
+        if not job:
+            return self._respond(404, {'error': 'not found'})
+        status = 'success' if job['polls'] > self.server.build_polls else 'running'
+        etag = '"{}"'.format(status)
+        if self.headers.getheader('If-None-Match') == etag:
+            return self._respond(304, headers={'ETag': etag})
+        self._respond(200, {'data': {'id': job_id, 'status': status}}, {'ETag': etag})
+
+    def _deploy(self, url):
+        if not self._authorized(self.server.tokens['id_token']):
+            return
+        payload = self._read_json()
+        with self.server.lock:
+            self.server.deploys.append(payload)
+        self._respond(200, {'data': 'deployed'})
+
+    def _read_json(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length)) if length else {}
+        except ValueError:
+            return {}
+
+    def _drain(self, *hashes):
+        """ Consume the request body at the configured bandwidth, returns the number of bytes read. """
+        remaining = int(self.headers.getheader('Content-Length') or 0)
+        size = 0
+        start = time.time()
+        while remaining > 0:
+            data = self.rfile.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            for digest in hashes:
+                digest.update(data)
+            remaining -= len(data)
+            size += len(data)
+            if self.server.bandwidth:
+                delay = size / float(self.server.bandwidth) - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        return size
+
+    def _respond(self, status, data=None, headers=None):
+        body = json.dumps(data) if data is not None and status != 304 else ''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePlatform(ThreadingMixIn, HTTPServer):
+    """ In process fake of the Mason platform.
+
+        :param latency: seconds added before every response
+        :param bandwidth: bytes per second the upload sink accepts, unlimited if None
+        :param error_rate: fraction of requests answered with error_status
+        :param error_status: status returned for injected errors
+        :param build_polls: number of status polls a build stays running for
+        :param token_ttl: seconds the issued tokens are valid for
+        :param seed: seed of the error injection, for reproducible runs"""
+    daemon_threads = True
+
+    ROUTES = [
+        ('POST', '^/oauth/ro$', 'auth'),
+        ('POST', '^/oauth/token$', 'token'),
+        ('GET', '^/userinfo$', 'user_info'),
+        ('GET', '^/api/registry/signedurl/([^/]+)/([^/]+)/([^/]+)$', 'signed_url'),
+        ('PUT', '^/storage/(.+)$', 'upload'),
+        ('GET', '^/api/registry/artifacts/([^/]+)/([^/]+)/([^/]+)$', 'lookup'),
+        ('POST', '^/api/registry/artifacts/([^/]+)/$', 'register'),
+        ('POST', '^/api/tracker/builder/([^/]+)/jobs$', 'queue_build'),
+        ('GET', '^/api/tracker/builder/([^/]+)/jobs/([^/]+)$', 'build_status'),
+        ('POST', '^/api/deploy$', 'deploy'),
+    ]
+
+    def __init__(self, latency=0, bandwidth=None, error_rate=0, error_status=503, build_polls=BUILD_POLLS,
+                 token_ttl=60 * 60, seed=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakePlatformHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.build_polls = build_polls
+        self.token_ttl = token_ttl
+        self.tokens = None
+        self.issue_tokens()
+        self.refresh_token = 'refresh-' + os.urandom(8).encode('hex')
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.uploads = {}
+        self.artifacts = {}
+        self.jobs = {}
+        self.deploys = []
+        self._failures = 0
+        self._random = random.Random(seed)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def issue_tokens(self):
+        """ Issue new tokens, the previous ones are no longer accepted. """
+        self.tokens = {'id_token': create_token(CUSTOMER, self.token_ttl),
+                       'access_token': create_token(CUSTOMER, self.token_ttl)}
+        return dict(self.tokens)
+
+    def url(self, path=''):
+        return 'http://127.0.0.1:{}{}'.format(self.server_address[1], path)
+
+    def route(self, method, path):
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern, path)
+            if match and route_method == method:
+                return name, match.groups()
+        return None
+
+    def count(self, name):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+
+    def fail_next(self, count):
+        """ Answer the next count requests with error_status. """
+        with self.lock:
+            self._failures += count
+
+    def should_fail(self):
+        with self.lock:
+            if self._failures:
+                self._failures -= 1
+                return True
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def attach(self, mason, directory):
+        """ Point a Mason at this platform, logged in, with its state kept in the given directory. """
+        return attach(mason, directory, self.url(), self.tokens)
+
+
+def store_config(base_url):
+    return {Store.CLIENT_ID: 'fake-client',
+            Store.AUTH_URL: base_url + '/oauth/ro',
+            Store.USER_INFO_URL: base_url + '/userinfo',
+            Store.REGISTRY_SIGNED_URL: base_url + '/api/registry/signedurl',
+            Store.REGISTRY_ARTIFACT_URL: base_url + '/api/registry/artifacts',
+            Store.BUILDER_URL: base_url + '/api/tracker/builder',
+            Store.DEPLOY_URL: base_url + '/api/deploy',
+            Store.CONFIG_VERSION: CURRENT_CONFIG_VERSION}
+
+
+def attach(mason, directory, base_url, tokens):
+    """ Point a Mason at the fake platform at base_url, logged in with the given tokens and with its state kept in
+        the given directory. The platform may be running in another process. """
+    store_file = os.path.join(directory, 'mason.yml')
+    with open(store_file, 'w') as stream:
+        stream.write(yaml.dump(store_config(base_url)))
+    mason.store = Store(store_file)
+    mason.persist = Persist(os.path.join(directory, 'masonrc'))
+    mason.persist.write_tokens(dict(tokens))
+    mason.ledger = Ledger(os.path.join(directory, 'registered.json'))
+    mason.journal = Journal(os.path.join(directory, 'journal.jsonl'))
+    return mason
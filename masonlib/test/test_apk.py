@@ -1,9 +1,14 @@
+import StringIO
+import hashlib
 import unittest
+from zlib import crc32
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
+from masonlib.external.apk_parse.apk import APK, zipfile
 from masonlib.internal.apk import Apk
 from test_common import Common
+from test_pkcs7 import to_indefinite_length
 
 
 class ApkTest(unittest.TestCase):
@@ -73,6 +78,78 @@ class ApkTest(unittest.TestCase):
         apk = Apk.parse(mock_config, "res/debug.apk")
         self.assertIsNone(apk)
 
+    def test_apk_parse_only_reads_manifest_and_signature(self):
+        read = zipfile.ZipFile.read
+        with patch.object(zipfile.ZipFile, 'read', autospec=True, side_effect=read) as mock_read:
+            APK("res/v1.apk")
+        read_files = set(call[0][1] for call in mock_read.call_args_list)
+        self.assertTrue(read_files)
+        self.assertTrue(all(name == 'AndroidManifest.xml' or name.startswith('META-INF/') for name in read_files))
+
+    def test_apk_files_crc32(self):
+        apk = APK("res/v1.apk")
+        with patch.object(zipfile.ZipFile, 'read') as mock_read:
+            files_crc32 = apk.get_files_crc32()
+        mock_read.assert_not_called()
+
+        archive = zipfile.ZipFile("res/v1.apk")
+        self.assertEqual(files_crc32, dict((name, crc32(archive.read(name))) for name in archive.namelist()))
+
+    def test_apk_file_backed(self):
+        with open("res/v1.apk", 'rb') as apk_file:
+            data = apk_file.read()
+        with patch('masonlib.external.apk_parse.apk.read') as mock_read:
+            apk = APK("res/v1.apk")
+            mock_read.assert_not_called()
+        raw_apk = APK(data, raw=True)
+
+        self.assertEqual(apk.file_size, len(data))
+        self.assertEqual(apk.file_md5, hashlib.md5(data).hexdigest())
+        self.assertEqual(apk.file_md5, raw_apk.file_md5)
+        self.assertEqual(apk.get_package(), raw_apk.get_package())
+        self.assertEqual(apk.get_raw(), data)
+
+    def test_apk_certificates(self):
+        with patch('subprocess.Popen') as mock_popen:
+            apk = APK("res/v1.apk")
+        mock_popen.assert_not_called()
+        self.assertEqual([certificate.subject.common_name for certificate in apk.get_certificates()], ['Test'])
+        self.assertIn('    Subject: C=US, ST=WA, L=test, O=test, OU=test, CN=Test', apk.cert_text)
+        self.assertFalse(apk.is_signed_v2())
+
+    def test_apk_ber_certificates(self):
+        apk = APK(self._replace_signature("res/v1.apk", to_indefinite_length), raw=True)
+        self.assertEqual([certificate.subject.common_name for certificate in apk.get_certificates()], ['Test'])
+        self.assertIsNone(apk.get_certificate_error())
+
+    def test_apk_unreadable_certificates(self):
+        apk = APK(self._replace_signature("res/v1.apk", lambda signature: signature[:len(signature) // 2]), raw=True)
+        self.assertEqual(apk.get_certificates(), [])
+        self.assertIn('META-INF/CERT.RSA', apk.get_certificate_error())
+        self.assertIn('Unable to read the signature of your APK', Apk(apk).get_validation_error())
+
+    @staticmethod
+    def _replace_signature(filename, replace):
+        data = StringIO.StringIO()
+        with zipfile.ZipFile(filename) as source, zipfile.ZipFile(data, 'w') as target:
+            for info in source.infolist():
+                content = source.read(info.filename)
+                if info.filename == 'META-INF/CERT.RSA':
+                    content = replace(content)
+                target.writestr(info, content)
+        return data.getvalue()
+
+    def test_apk_v2_only_certificates(self):
+        apk = APK("res/v2.apk")
+        self.assertEqual(apk.get_certificates(), [])
+        self.assertTrue(apk.is_signed_v2())
+
+    def test_apk_closed_after_parse(self):
+        apk = APK("res/v1.apk")
+        self.assertIsNone(apk._APK__zip)
+        self.assertTrue(apk.get_file("AndroidManifest.xml"))
+        apk.close()
+        self.assertIsNone(apk._APK__zip)
 
     @staticmethod
     def _create_test_apk():
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import MagicMock, patch
+
+from masonlib.internal.apk import Apk
+from masonlib.internal.apk_cache import ApkCache
+from masonlib.internal.utils import digest_file
+
+
+class ApkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ApkCache(os.path.join(self.directory, 'cache'))
+        self.apk = self._copy('res/v1.apk', 'a.apk')
+        self.sha1 = self._sha1(self.apk)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _copy(self, source, name):
+        path = os.path.join(self.directory, name)
+        shutil.copy(source, path)
+        return path
+
+    @staticmethod
+    def _sha1(path):
+        return digest_file(path, ('sha1',)).hexdigest('sha1')
+
+    def test_get_empty(self):
+        self.assertIsNone(self.cache.get(self.apk))
+
+    def test_put(self):
+        self.cache.put(self.apk, self.sha1, {'package': 'com.this.is.a.test'})
+        self.assertEqual(ApkCache(self.cache.directory).get(self.apk), {'package': 'com.this.is.a.test'})
+
+    def test_hit_by_content(self):
+        self.cache.put(self.apk, self.sha1, {'package': 'com.this.is.a.test'})
+        copy = self._copy('res/v1.apk', 'b.apk')
+        self.assertIsNone(self.cache.get(copy))
+        self.assertEqual(self.cache.get(copy, self.sha1), {'package': 'com.this.is.a.test'})
+
+        # The copy is now known by its stat too
+        self.assertEqual(ApkCache(self.cache.directory).get(copy), {'package': 'com.this.is.a.test'})
+
+    def test_never_reads_the_file(self):
+        self.cache.put(self.apk, self.sha1, {'package': 'com.this.is.a.test'})
+        copy = self._copy('res/v1.apk', 'b.apk')
+        with patch('__builtin__.open', wraps=open) as mock_open:
+            self.assertEqual(self.cache.get(copy, self.sha1), {'package': 'com.this.is.a.test'})
+        self.assertNotIn(copy, [call[0][0] for call in mock_open.call_args_list])
+
+    def test_miss_on_changed_content(self):
+        self.cache.put(self.apk, self.sha1, {'package': 'com.this.is.a.test'})
+        with open(self.apk, 'ab') as apk_file:
+            apk_file.write('changed')
+        self.assertIsNone(ApkCache(self.cache.directory).get(self.apk, self._sha1(self.apk)))
+
+    def test_ignores_invalid_entries(self):
+        self.cache.put(self.apk, self.sha1, {'package': 'com.this.is.a.test'})
+        for name in os.listdir(self.cache.directory):
+            with open(os.path.join(self.cache.directory, name), 'w') as entry_file:
+                entry_file.write('{"version": 0, "da')
+        self.assertIsNone(ApkCache(self.cache.directory).get(self.apk, self.sha1))
+
+    def test_unwritable(self):
+        with open(self.cache.directory, 'w') as not_a_directory:
+            not_a_directory.write('')
+        self.cache.put(self.apk, self.sha1, {'package': 'com.this.is.a.test'})
+        self.assertIsNone(self.cache.get(self.apk, self.sha1))
+
+    def _age(self, seconds, exclude=()):
+        """ Sets back the last use of the cache entries by the given number of seconds. """
+        names = set(os.listdir(self.cache.directory)) - set(exclude)
+        for name in names:
+            last_use = time.time() - seconds
+            os.utime(os.path.join(self.cache.directory, name), (last_use, last_use))
+        return names
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put(self.apk, self.sha1, {'package': 'a'})
+        first = self._age(60)
+        self.cache.max_size = sum(os.path.getsize(os.path.join(self.cache.directory, name)) for name in first) * 2
+
+        other = self._copy('res/v2.apk', 'b.apk')
+        self.cache.put(other, self._sha1(other), {'package': 'b'})
+        self._age(30, exclude=first)
+        self.assertEqual(len(os.listdir(self.cache.directory)), 4)
+        # Using the first entry makes the second one the least recently used
+        self.assertEqual(self.cache.get(self.apk), {'package': 'a'})
+
+        third = self._copy('res/debug.apk', 'c.apk')
+        self.cache.put(third, self._sha1(third), {'package': 'c'})
+        self.assertEqual(len(os.listdir(self.cache.directory)), 4)
+        self.assertEqual(self.cache.get(self.apk), {'package': 'a'})
+        self.assertIsNone(ApkCache(self.cache.directory).get(other))
+        self.assertEqual(self.cache.get(third), {'package': 'c'})
+
+    def test_apk_parse_from_cache(self):
+        config = MagicMock()
+        config.verbose = True
+        first = Apk.parse(config, self.apk, cache=self.cache, sha1=self.sha1)
+        with patch('masonlib.internal.apk.APK') as mock_apk:
+            cached = Apk.parse(config, self.apk, cache=self.cache, sha1=self.sha1)
+        mock_apk.assert_not_called()
+
+        self.assertTrue(cached.is_valid())
+        self.assertEqual(cached.get_name(), first.get_name())
+        self.assertEqual(cached.get_version(), first.get_version())
+        self.assertEqual(cached.get_details(), first.get_details())
+        self.assertEqual(cached.get_registry_meta_data(), first.get_registry_meta_data())
+        self.assertEqual(cached.apkf.get_app_name(), 'Unit test app 1')
+        self.assertEqual(cached.apkf.signers[0]['subject'], 'C=US, ST=WA, L=test, O=test, OU=test, CN=Test')
+
+    def test_apk_parse_invalid_from_cache(self):
+        config = MagicMock()
+        config.verbose = False
+        for name in ('res/debug.apk', 'res/unsigned.apk'):
+            apk = self._copy(name, os.path.basename(name))
+            self.assertIsNone(Apk.parse(config, apk, cache=self.cache, sha1=self._sha1(apk)))
+            with patch('masonlib.internal.apk.APK') as mock_apk:
+                self.assertIsNone(Apk.parse(config, apk, cache=self.cache))
+            mock_apk.assert_not_called()
+
+    def test_apk_parse_without_digests(self):
+        config = MagicMock()
+        config.verbose = False
+        self.assertIsNotNone(Apk.parse(config, self.apk, cache=self.cache))
+        # Nothing to key the entry by
+        self.assertIsNone(self.cache.get(self.apk))
+
+
+if __name__ == '__main__':
+    unittest.main()
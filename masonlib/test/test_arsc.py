@@ -0,0 +1,67 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from masonlib.external.apk_parse import apk as apk_parse
+from masonlib.external.apk_parse.apk import APK, ARSCParser
+from masonlib.internal.apk import Apk
+
+APP_NAME = 0x7f0b0027
+
+
+class ARSCParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.apk = APK('res/v1.apk')
+        self.arsc = self.apk.get_file('resources.arsc')
+
+    def test_index_does_not_decode_entries(self):
+        with patch.object(apk_parse, 'ARSCResTableEntry', wraps=apk_parse.ARSCResTableEntry) as mock_entry:
+            resources = ARSCParser(self.arsc)
+            mock_entry.assert_not_called()
+            self.assertEqual(resources.get_resource_value(APP_NAME), 'Unit test app 1')
+            self.assertEqual(mock_entry.call_count, 1)
+        self.assertEqual(resources.get_packages_names(), ['com.example.unittestapp1'])
+
+    def test_locale_fallback(self):
+        resources = ARSCParser(self.arsc)
+        self.assertEqual(resources.get_resource_value(0x7f0b0000), 'Navigate home')
+        self.assertEqual(resources.get_resource_value(0x7f0b0000, 'ca'), u"Navega a la p\xe0gina d'inici")
+        self.assertEqual(resources.get_resource_value(0x7f0b0000, 'xx'), 'Navigate home')
+        self.assertIsNone(resources.get_resource(0x7f0bffff))
+        self.assertIsNone(resources.get_resource(0x01000000))
+
+    def test_same_as_full_parse(self):
+        resources = ARSCParser(self.arsc)
+        package = resources.get_packages_names()[0]
+        resources._analyse()
+        for locale in resources.get_locales(package):
+            values = resources.values[package][locale]
+            for public in values['public']:
+                self.assertEqual(resources.get_id(package, public[2], locale),
+                                 next(i for i in values['public'] if i[2] == public[2]))
+            for string in values.get('string', []):
+                self.assertEqual(resources.get_string(package, string[0], locale),
+                                 next(i for i in values['string'] if i[0] == string[0]))
+
+    def test_app_name(self):
+        self.assertEqual(self.apk.get_app_name(), 'Unit test app 1')
+
+    def test_apk_verbose_app_name(self):
+        config = MagicMock()
+        config.verbose = True
+        with patch('sys.stdout') as mock_stdout:
+            self.assertIsNotNone(Apk.parse(config, 'res/v1.apk'))
+        self.assertIn('App Name: Unit test app 1', ''.join(call[0][0] for call in mock_stdout.write.call_args_list))
+
+    def test_apk_verbose_unreadable_resources(self):
+        config = MagicMock()
+        config.verbose = True
+        with patch.object(APK, 'get_app_name', side_effect=ValueError('unsupported chunk')), \
+                patch('sys.stdout') as mock_stdout:
+            self.assertIsNotNone(Apk.parse(config, 'res/v1.apk'))
+        self.assertIn('App Name: \n', ''.join(call[0][0] for call in mock_stdout.write.call_args_list))
+
+
+if __name__ == '__main__':
+    unittest.main()
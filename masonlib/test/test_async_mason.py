@@ -0,0 +1,133 @@
+import threading
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from mock import MagicMock
+
+from masonlib.imason import IAsyncMason
+from masonlib.internal.async_mason import AsyncMason, Cancelled, LimitedSession, Operation
+from masonlib.platform import Platform
+from test_common import Common
+
+
+class AsyncMasonTest(unittest.TestCase):
+
+    def setUp(self):
+        config = MagicMock()
+        config.skip_verify = True
+        config.no_colorize = True
+        config.pool_connections = config.pool_maxsize = config.timeout = config.retries = config.deadline = None
+        config.max_bandwidth = None
+        self.mason = Platform(config).get(IAsyncMason)
+        self.mason._validate_credentials = MagicMock(return_value=True)
+        self.mason._get_customer = MagicMock(return_value='mason-test')
+
+    def tearDown(self):
+        self.mason.close()
+
+    def test_platform(self):
+        assert(isinstance(self.mason, AsyncMason))
+
+    def test_deploy_async(self):
+        self.mason._post_deploy = MagicMock(return_value=True)
+        operations = [self.mason.deploy_async('apk', 'com.test.app', '3', 'group-{}'.format(i), False)
+                      for i in range(50)]
+
+        results = [operation.result(5) for operation in operations]
+        assert(all(result.ok for result in results))
+        assert(self.mason._post_deploy.call_count == 50)
+        assert(self.mason._get_customer.call_count == 1)
+
+    def test_deploy_async_failure(self):
+        self.mason._post_deploy = MagicMock(return_value=False)
+        result = self.mason.deploy_async('config', 'mason-test', '5', 'development', False).result(5)
+        assert(not result.ok)
+        assert(result.error == 'deploy rejected')
+
+    def test_build_async(self):
+        self.mason._build_project = MagicMock(return_value=True)
+        result = self.mason.build_async('mason-test', '5').result(5)
+        assert(result.ok)
+        self.mason._build_project.assert_called_once_with('mason-test', '5')
+
+    def test_register_async(self):
+        self.mason._get_parser = MagicMock(
+            return_value=lambda config, binary, digests: Common.create_mock_media_file())
+        self.mason._check_registered = MagicMock(return_value=None)
+        self.mason._upload_artifact = MagicMock(return_value='https://download/artifact')
+        self.mason._register_to_mason = MagicMock(return_value=True)
+        self.mason.ledger = MagicMock()
+
+        result = self.mason.register_async('apk', 'res/v1.apk').result(5)
+        assert(result.ok)
+        assert(self.mason._register_to_mason.called)
+
+    def test_cancel(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def post(payload):
+            started.set()
+            release.wait(5)
+            return True
+
+        self.mason.close()
+        self.mason._pool = ThreadPool(1)
+        self.mason._post_deploy = MagicMock(side_effect=post)
+        first = self.mason.deploy_async('apk', 'com.test.app', '3', 'development', False)
+        second = self.mason.deploy_async('apk', 'com.test.app', '3', 'production', False)
+        started.wait(5)
+        second.cancel()
+        release.set()
+
+        assert(first.result(5).ok)
+        assert(second.result(5).error == 'cancelled')
+        assert(self.mason._post_deploy.call_count == 1)
+
+
+class LimitedSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = Common.create_mock_store()
+        self.store.builder_url = MagicMock(return_value='https://builder.security.sec')
+        self.store.deploy_url = MagicMock(return_value='https://deploy.security.sec')
+        self.session = MagicMock()
+
+    def test_endpoint(self):
+        limited = LimitedSession(self.session, self.store, {})
+        assert(limited._endpoint('https://user.security.sec') == 'user_info')
+        assert(limited._endpoint('https://sign.security.sec/mason/app/1?type=apk') == 'signed_url')
+        assert(limited._endpoint('https://deploy.security.sec') == 'deploy')
+        assert(limited._endpoint('https://storage.googleapis.com/bucket/object') == 'upload')
+
+    def test_limit(self):
+        in_flight = []
+        peak = []
+
+        def request(method, url, **kwargs):
+            in_flight.append(url)
+            peak.append(len(in_flight))
+            time.sleep(0.01)
+            in_flight.pop()
+
+        self.session.request.side_effect = request
+        limited = LimitedSession(self.session, self.store, {'deploy': 2})
+        threads = [threading.Thread(target=limited.post, args=('https://deploy.security.sec',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(max(peak) <= 2)
+
+    def test_cancelled(self):
+        limited = LimitedSession(self.session, self.store, {})
+        operation = Operation('test')
+        operation.cancel()
+        limited.bind(operation)
+        self.assertRaises(Cancelled, limited.get, 'https://deploy.security.sec')
+        assert(not self.session.request.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from masonlib.imason import IMason
+from masonlib.internal.batch import BatchItem
+from masonlib.internal.journal import Journal
+from masonlib.internal.mason import REGISTERED, CONFLICT
+from masonlib.platform import Platform
+from test_common import Common
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        config = MagicMock()
+        config.skip_verify = True
+        config.no_colorize = True
+        config.pool_connections = config.pool_maxsize = config.timeout = config.retries = config.deadline = None
+        config.max_bandwidth = None
+        self.mason = Platform(config).get(IMason)
+        self.mason._validate_credentials = MagicMock(return_value=True)
+        self.mason._get_customer = MagicMock(return_value='mason-test')
+        self.mason._get_parser = MagicMock(
+            return_value=lambda config, binary, digests: Common.create_mock_media_file())
+        self.mason._upload_artifact = MagicMock(side_effect=lambda customer, binary, *args, **kwargs:
+                                                None if binary == 'res/bad.apk' else 'https://download/' + binary)
+        self.mason._register_to_mason = MagicMock(return_value=True)
+        self.mason._check_registered = MagicMock(return_value=None)
+        self.mason.ledger = MagicMock()
+        self.mason.journal = Journal('./.test_mason_journal.jsonl')
+
+    def tearDown(self):
+        for path in (self.mason.journal.file, self.mason.journal.file + '.lock'):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def test_batch_item(self):
+        item = BatchItem('test')
+        assert(item.ok)
+        item.fail('broken')
+        assert(not item.ok)
+        assert(item.status == 'failed')
+
+    def test_register_batch(self):
+        binaries = ['res/v1.apk', 'res/v2.apk', 'res/v1and2.apk']
+        assert(self.mason.register_batch('apk', binaries, 2))
+        assert(self.mason._get_customer.call_count == 1)
+        assert(self.mason._register_to_mason.call_count == len(binaries))
+        # smallest first
+        registered = [call[0][1] for call in self.mason._register_to_mason.call_args_list]
+        assert(registered == ['https://download/' + binary for binary in sorted(binaries, key=os.path.getsize)])
+
+    def test_register_batch_parses_concurrently(self):
+        started = [threading.Event(), threading.Event()]
+
+        def parse(config, binary, digests):
+            index = 0 if binary == 'res/v1.apk' else 1
+            print 'Parsing {}'.format(binary)
+            started[index].set()
+            # Only returns if the other parse runs at the same time
+            if not started[1 - index].wait(5):
+                return None
+            print 'Parsed {}'.format(binary)
+            return Common.create_mock_media_file()
+
+        self.mason._get_parser = MagicMock(return_value=parse)
+        with patch('sys.stdout') as mock_stdout:
+            assert(self.mason.register_batch('apk', ['res/v1.apk', 'res/v2.apk'], 2))
+        output = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+        # The output of every parse is kept together
+        for binary in ('res/v1.apk', 'res/v2.apk'):
+            assert('Parsing {0}\nParsed {0}\n'.format(binary) in output)
+
+    def test_register_batch_upload_concurrency(self):
+        assert(self.mason.register_batch('apk', ['res/v1.apk', 'res/v2.apk'], 8))
+        assert(self.mason.uploads.limit == 8)
+
+    def test_register_batch_partial_failure(self):
+        assert(not self.mason.register_batch('apk', ['res/v1.apk', 'res/bad.apk'], 4))
+        assert(self.mason._register_to_mason.call_count == 1)
+
+    def test_register_batch_skips_registered(self):
+        self.mason._check_registered = MagicMock(side_effect=lambda customer, artifact, sha1:
+                                                 REGISTERED if self.mason._check_registered.call_count == 1 else None)
+        assert(self.mason.register_batch('apk', ['res/v1.apk', 'res/v2.apk'], 1))
+        assert(self.mason._upload_artifact.call_count == 1)
+        assert(self.mason._register_to_mason.call_count == 1)
+
+    def test_register_batch_checksum_conflict(self):
+        self.mason._check_registered = MagicMock(return_value=CONFLICT)
+        assert(not self.mason.register_batch('apk', ['res/v1.apk'], 1))
+        assert(not self.mason._upload_artifact.called)
+
+    def test_register_batch_resume(self):
+        self.mason._register_to_mason = MagicMock(side_effect=lambda customer, url, sha1, artifact:
+                                                  url != 'https://download/res/v2.apk')
+        assert(not self.mason.register_batch('apk', ['res/v1.apk', 'res/v2.apk'], 1, resume=True))
+        assert(self.mason._upload_artifact.call_count == 2)
+
+        # v1 is done, v2 only needs to be registered
+        self.mason._digest_file = MagicMock()
+        self.mason._register_to_mason = MagicMock(return_value=True)
+        assert(self.mason.register_batch('apk', ['res/v1.apk', 'res/v2.apk'], 1, resume=True))
+        assert(self.mason._upload_artifact.call_count == 2)
+        assert(not self.mason._digest_file.called)
+        self.mason._register_to_mason.assert_called_once()
+        assert(self.mason._register_to_mason.call_args[0][1] == 'https://download/res/v2.apk')
+
+        # the journal only keeps what may still need resuming
+        assert(self.mason.journal.load() == {})
+
+    def test_register_batch_without_resume(self):
+        self.mason._register_to_mason = MagicMock(return_value=False)
+        assert(not self.mason.register_batch('apk', ['res/v1.apk'], 1))
+        assert(not self.mason.register_batch('apk', ['res/v1.apk'], 1))
+        assert(self.mason._upload_artifact.call_count == 2)
+
+        # Journaled all along, so the interrupted run can still be resumed
+        self.mason._register_to_mason = MagicMock(return_value=True)
+        assert(self.mason.register_batch('apk', ['res/v1.apk'], 1, resume=True))
+        assert(self.mason._upload_artifact.call_count == 2)
+        self.mason._register_to_mason.assert_called_once()
+        assert(self.mason.journal.load() == {})
+
+    def test_register_batch_unsupported_type(self):
+        self.mason._get_parser = MagicMock(return_value=None)
+        assert(not self.mason.register_batch('unknown', ['res/v1.apk'], 1))
+
+    def test_deploy_batch(self):
+        self.mason._post_deploy = MagicMock(return_value=True)
+        groups = ['development', 'staging', 'production']
+        assert(self.mason.deploy_batch('apk', 'com.test.app', '3', groups, False, 2))
+        assert(self.mason._get_customer.call_count == 1)
+        deployed = sorted(call[0][0]['group'] for call in self.mason._post_deploy.call_args_list)
+        assert(deployed == sorted(groups))
+
+    def test_deploy_batch_single_confirmation(self):
+        self.mason.config.skip_verify = False
+        self.mason._confirm_deploy = MagicMock(return_value=False)
+        self.mason._post_deploy = MagicMock(return_value=True)
+        assert(not self.mason.deploy_batch('config', 'mason-test', '5', ['a', 'b', 'c'], False, 3))
+        assert(self.mason._confirm_deploy.call_count == 1)
+        assert(not self.mason._post_deploy.called)
+
+    def test_deploy_batch_continues_after_failure(self):
+        self.mason._post_deploy = MagicMock(side_effect=lambda payload: payload['group'] != 'staging')
+        assert(not self.mason.deploy_batch('ota', 'mason-os', '2.0.0', ['development', 'staging', 'production'],
+                                           True, 1))
+        assert(self.mason._post_deploy.call_count == 3)
+
+    def test_deploy_batch_resume(self):
+        self.mason._post_deploy = MagicMock(side_effect=lambda payload: payload['group'] != 'staging')
+        groups = ['development', 'staging', 'production']
+        assert(not self.mason.deploy_batch('config', 'mason-test', '5', groups, False, 3))
+
+        self.mason._post_deploy = MagicMock(return_value=True)
+        assert(self.mason.deploy_batch('config', 'mason-test', '5', groups, False, 3, resume=True))
+        self.mason._post_deploy.assert_called_once()
+        assert(self.mason._post_deploy.call_args[0][0]['group'] == 'staging')
+
+    def test_deploy_batch_unsupported_type(self):
+        assert(not self.mason.deploy_batch('unknown', 'name', '1', ['development'], False, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import threading
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from mock import MagicMock, patch
+
+from masonlib.imason import IMason
+from masonlib.internal.builds import BUILD_FAILED, BUILD_NOT_STARTED, BUILD_SUCCEEDED, BUILD_TIMED_OUT, BuildJob, \
+    BuildWaiter
+from masonlib.internal.session import Session
+from masonlib.platform import Platform
+
+
+class BuilderHandler(BaseHTTPRequestHandler):
+    """ Fake builder: jobs go through queued, running and then their final status, one step per poll. """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('Content-Length')))
+        job_id = 'job-{}'.format(len(self.server.jobs) + 1)
+        self.server.jobs[job_id] = ['queued', 'running', self.server.outcomes.pop(0)]
+        self._respond(200, json.dumps({'data': {'id': job_id}}))
+
+    def do_GET(self):
+        job_id = self.path.split('/')[-1]
+        self.server.polls += 1
+        if self.server.token and self.headers.getheader('Authorization') != 'Bearer {}'.format(self.server.token):
+            return self._respond(401)
+        if job_id not in self.server.jobs:
+            return self._respond(404)
+        statuses = self.server.jobs[job_id]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        etag = '"{}-{}"'.format(job_id, status)
+        if self.headers.getheader('If-None-Match') == etag:
+            self.server.not_modified += 1
+            return self._respond(304, headers={'ETag': etag})
+        self._respond(200, json.dumps({'status': status}), {'ETag': etag})
+
+    def _respond(self, status, body='', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BuilderServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), BuilderHandler)
+        self.jobs = {}
+        self.outcomes = []
+        self.polls = 0
+        self.not_modified = 0
+        self.token = None
+
+
+class BuildsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BuilderServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.builder_url = 'http://127.0.0.1:{}/builder'.format(self.server.server_address[1])
+
+        config = MagicMock()
+        config.no_colorize = True
+        config.pool_connections = config.pool_maxsize = config.timeout = config.retries = config.deadline = None
+        config.max_bandwidth = None
+        self.mason = Platform(config).get(IMason)
+        self.mason._validate_credentials = MagicMock(return_value=True)
+        self.mason._get_customer = MagicMock(return_value='mason-test')
+        self.mason.store = MagicMock()
+        self.mason.store.builder_url.return_value = self.builder_url
+        self.mason.store.deploy_url.return_value = 'https://platform.bymason.com/api/deploy'
+
+    def tearDown(self):
+        self.mason.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_job_id(self):
+        assert(BuildJob.get_job_id('{"data": {"id": "job-1"}}') == 'job-1')
+        assert(BuildJob.get_job_id('{"id": "job-2"}') == 'job-2')
+        assert(BuildJob.get_job_id('not json') is None)
+
+    @patch('masonlib.internal.builds.MAX_POLL_INTERVAL', 0.05)
+    @patch('masonlib.internal.builds.MIN_POLL_INTERVAL', 0.01)
+    def test_wait_success(self):
+        self.server.outcomes = ['success', 'completed']
+        assert(self.mason.build_and_wait([('mason-test', 5), ('mason-other', 2)], 5) == BUILD_SUCCEEDED)
+
+    @patch('masonlib.internal.builds.MAX_POLL_INTERVAL', 0.05)
+    @patch('masonlib.internal.builds.MIN_POLL_INTERVAL', 0.01)
+    def test_wait_failure(self):
+        self.server.outcomes = ['success', 'failed']
+        assert(self.mason.build_and_wait([('mason-test', 5), ('mason-other', 2)], 5) == BUILD_FAILED)
+
+    def test_wait_timeout(self):
+        job = BuildJob('mason-test', 5, self.builder_url + '/mason-test/jobs/job-1')
+        self.server.jobs['job-1'] = ['queued']
+        waiter = BuildWaiter(Session(), {}, timeout=0.2, min_interval=0.01, max_interval=0.05)
+        assert(waiter.wait([job]) == BUILD_TIMED_OUT)
+        assert(not job.ok)
+        # unchanged statuses are answered with 304 and back off
+        assert(self.server.not_modified > 0)
+        assert(self.server.polls < 20)
+
+    def test_wait_unknown_job(self):
+        job = BuildJob('mason-test', 5, self.builder_url + '/mason-test/jobs/job-1')
+        waiter = BuildWaiter(Session(), {}, timeout=5, min_interval=0.01, max_interval=0.05)
+        assert(waiter.wait([job]) == BUILD_FAILED)
+        assert(job.error == 'job not found')
+        assert(self.server.polls == 1)
+
+    @patch('masonlib.internal.builds.MAX_POLL_INTERVAL', 0.05)
+    @patch('masonlib.internal.builds.MIN_POLL_INTERVAL', 0.01)
+    def test_wait_renews_credentials(self):
+        def renew():
+            self.mason.id_token = 'renewed'
+            return True
+
+        self.server.outcomes = ['success']
+        self.server.token = 'renewed'
+        self.mason.id_token = 'expired'
+        self.mason._renew_credentials = MagicMock(side_effect=renew)
+        assert(self.mason.build_and_wait([('mason-test', 5)], 5) == BUILD_SUCCEEDED)
+        self.mason._renew_credentials.assert_called_once_with()
+
+    @patch('masonlib.internal.builds.MAX_POLL_INTERVAL', 0.05)
+    @patch('masonlib.internal.builds.MIN_POLL_INTERVAL', 0.01)
+    def test_wait_unauthorized(self):
+        self.server.outcomes = ['success', 'success']
+        self.server.token = 'renewed'
+        self.mason.id_token = 'expired'
+        for renewed, error in ((False, 'session expired'), (True, 'not authorized (401)')):
+            # Renewing the credentials either fails or doesn't change them
+            self.mason._renew_credentials = MagicMock(return_value=renewed)
+            jobs = []
+            assert(self.mason._build_and_wait('mason-test', [('mason-test', 5)], 5, jobs) == BUILD_FAILED)
+            assert(jobs[0].error == error)
+
+    def test_not_started(self):
+        self.mason.session = MagicMock()
+        self.mason.session.post.return_value = MagicMock(status_code=200, text='{}')
+        assert(self.mason.build_and_wait([('mason-test', 5)], 5) == BUILD_NOT_STARTED)
+
+    def test_not_started_reports_queued(self):
+        self.mason.session = MagicMock()
+        self.mason.session.post.side_effect = [MagicMock(status_code=200, text='{"data": {"id": "job-1"}}'),
+                                               MagicMock(status_code=500, text='')]
+        jobs = []
+        with patch('sys.stdout') as mock_stdout:
+            assert(self.mason._build_and_wait('mason-test', [('mason-test', 5), ('mason-other', 2)], 5, jobs) ==
+                   BUILD_NOT_STARTED)
+        output = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+        assert('mason-test:5: job job-1 ({}/mason-test/jobs/job-1)'.format(self.builder_url) in output)
+        assert([(job.label, job.status, job.error) for job in jobs] ==
+               [('mason-test:5', 'queued', None), ('mason-other:2', 'failed', 'not queued')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,6 +22,7 @@ class Common(object):
         mock_apk.get_androidversion_code = MagicMock(return_value=test_package_version_code)
         mock_apk.is_valid_APK = MagicMock(return_value=True)
         mock_apk.get_min_sdk_version = MagicMock(return_value=23)
+        mock_apk.get_certificate_error = MagicMock(return_value=None)
         return mock_apk
 
     @staticmethod
@@ -65,4 +66,6 @@ class Common(object):
         mock_store.user_info_url = MagicMock(return_value='https://user.security.sec')
         mock_store.registry_signer_url = MagicMock(return_value='https://sign.security.sec')
         mock_store.registry_artifact_url = MagicMock(return_value='https://register.security.sec')
+        mock_store.builder_url = MagicMock(return_value='https://build.security.sec')
+        mock_store.deploy_url = MagicMock(return_value='https://deploy.security.sec')
         return mock_store
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import MagicMock, patch
+
+from fake_platform import FakePlatform
+from masonlib.imason import IMason
+from masonlib.internal.builds import BUILD_SUCCEEDED
+from masonlib.internal.scheduler import UploadScheduler
+from masonlib.platform import Platform
+
+
+class FakePlatformTest(unittest.TestCase):
+
+    def setUp(self):
+        self.platform = FakePlatform().start()
+        self.tmp_dir = tempfile.mkdtemp()
+
+        config = MagicMock()
+        config.skip_verify = True
+        config.verbose = False
+        config.no_colorize = True
+        config.pool_connections = config.pool_maxsize = config.timeout = config.deadline = None
+        config.max_bandwidth = None
+        config.retries = 2
+        self.mason = self.platform.attach(Platform(config).get(IMason), self.tmp_dir)
+        self.mason.session.backoff = 0
+
+    def tearDown(self):
+        self.mason.session.close()
+        self.platform.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _config_file(self, name, version):
+        filename = os.path.join(self.tmp_dir, '{}-{}.yml'.format(name, version))
+        with open(filename, 'w') as config_file:
+            config_file.write('os:\n  name: {}\n  version: {}\n'.format(name, version))
+        return filename
+
+    def test_authenticate(self):
+        assert(self.mason.authenticate('user', 'password'))
+        assert(self.mason.persist.retrieve_id_token() == self.platform.tokens['id_token'])
+
+    def test_refresh_expiring_tokens(self):
+        self.platform.token_ttl = 60
+        self.platform.issue_tokens()
+        assert(self.mason.authenticate('user', 'password'))
+
+        self.platform.token_ttl = 60 * 60
+        assert(self.mason.deploy('config', 'mason-test', '3', 'development', False))
+        assert(self.platform.requests['token'] == 1)
+        assert(self.mason.id_token == self.platform.tokens['id_token'])
+        assert(self.mason.persist.retrieve_refresh_token() == self.platform.refresh_token)
+
+    def test_expired_tokens(self):
+        self.platform.token_ttl = -10
+        self.mason.persist.write_tokens(self.platform.issue_tokens())
+        assert(not self.mason.deploy('config', 'mason-test', '3', 'development', False))
+        assert('deploy' not in self.platform.requests)
+
+    def test_register(self):
+        assert(self.mason.register_batch('config', [self._config_file('mason-test', 1),
+                                                    self._config_file('mason-test', 2)], 2))
+        assert(sorted(self.platform.artifacts) == ['mason-test/config/mason-test/1', 'mason-test/config/mason-test/2'])
+        assert(self.platform.requests['user_info'] == 1)
+
+        # registering again skips the upload
+        assert(self.mason.register_batch('config', [self._config_file('mason-test', 1)], 1))
+        assert(self.platform.requests['upload'] == 2)
+
+    def test_stage(self):
+        config_file = self._config_file('mason-test', 3)
+        assert(self.mason.parse_os_config(config_file))
+        assert(self.mason.stage(config_file))
+        assert(self.platform.jobs['job-1']['payload'] ==
+               {'customer': 'mason-test', 'project': 'mason-test', 'version': '3'})
+
+    @patch('masonlib.internal.builds.MIN_POLL_INTERVAL', 0.01)
+    def test_build_and_wait(self):
+        self.platform.build_polls = 0
+        assert(self.mason.build_and_wait([('mason-test', 3)], 10) == BUILD_SUCCEEDED)
+
+    def test_deploy(self):
+        assert(self.mason.deploy_batch('config', 'mason-test', '3', ['development', 'staging'], False, 2))
+        assert(sorted(payload['group'] for payload in self.platform.deploys) == ['development', 'staging'])
+
+    def test_injected_errors(self):
+        self.platform.fail_next(2)
+        assert(self.mason.deploy('config', 'mason-test', '3', 'development', False))
+        assert(self.platform.requests['user_info'] == 3)
+
+        self.platform.error_rate = 1
+        assert(not self.mason.deploy('config', 'mason-test', '3', 'staging', False))
+
+    def test_latency(self):
+        self.platform.latency = 0.05
+        start = time.time()
+        assert(self.mason.deploy('config', 'mason-test', '3', 'development', False))
+        # userinfo and deploy
+        assert(time.time() - start >= 0.1)
+
+    def _upload(self, size):
+        filename = os.path.join(self.tmp_dir, 'upload.bin')
+        data = os.urandom(size)
+        with open(filename, 'wb') as upload:
+            upload.write(data)
+        artifact = MagicMock()
+        artifact.get_name.return_value = 'upload'
+        artifact.get_version.return_value = '1'
+        artifact.get_type.return_value = 'media'
+        artifact.get_content_type.return_value = 'application/zip'
+
+        assert(self.mason._validate_credentials())
+        return self.mason._upload_artifact('mason-test', filename, artifact, hashlib.md5(data).digest(),
+                                           progress=False)
+
+    def test_bandwidth(self):
+        self.platform.bandwidth = 100 * 1024
+        start = time.time()
+        assert(self._upload(20 * 1024))
+        assert(self.platform.uploads['mason-test/media/upload/1']['size'] == 20 * 1024)
+        assert(time.time() - start >= 0.2)
+
+    def test_max_bandwidth(self):
+        self.mason.uploads = UploadScheduler(max_bandwidth=200 * 1024)
+        self.mason.uploads.bucket.capacity = 20 * 1024
+        start = time.time()
+        assert(self._upload(60 * 1024))
+        assert(time.time() - start >= 0.18)
+
+
+if __name__ == '__main__':
+    unittest.main()
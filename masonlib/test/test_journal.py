@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from masonlib.internal.journal import Journal
+from masonlib.internal.utils import FileDigests, digest_file
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = Journal('./.test_mason_journal.jsonl')
+
+    def tearDown(self):
+        for path in (self.journal.file, self.journal.file + '.lock'):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def test_load_empty(self):
+        assert(self.journal.load() == {})
+
+    def test_record(self):
+        self.journal.record('register/a', 'hashed', size=10)
+        self.journal.record('register/b', 'hashed', size=20)
+        self.journal.record('register/a', 'uploaded', download_url='https://download/a')
+
+        state = self.journal.load()
+        assert(state['register/a']['phase'] == 'uploaded')
+        assert(state['register/a']['size'] == 10)
+        assert(state['register/a']['download_url'] == 'https://download/a')
+        assert(state['register/b']['phase'] == 'hashed')
+
+    def test_torn_entry(self):
+        self.journal.record('register/a', 'hashed', size=10)
+        with open(self.journal.file, 'a') as journal_file:
+            journal_file.write('{"key": "register/a", "phase": "uplo')
+        self.journal.record('register/b', 'hashed', size=20)
+
+        state = self.journal.load()
+        assert(state['register/a']['phase'] == 'hashed')
+        assert(state['register/b']['phase'] == 'hashed')
+
+    def test_complete(self):
+        self.journal.record('register/a', 'hashed', size=10)
+        self.journal.record('register/b', 'hashed', size=20)
+        self.journal.complete(['register/a'])
+        assert(self.journal.load().keys() == ['register/b'])
+
+    def test_complete_keeps_concurrent_records(self):
+        self.journal.record('register/a', 'hashed', size=10)
+        other = Journal(self.journal.file)
+
+        def record():
+            for i in range(50):
+                other.record('register/b{}'.format(i), 'hashed', size=i)
+        thread = threading.Thread(target=record)
+        thread.start()
+        for i in range(20):
+            self.journal.complete(['register/a'])
+        thread.join()
+
+        assert(sorted(self.journal.load().keys()) == sorted('register/b{}'.format(i) for i in range(50)))
+        assert(not [name for name in os.listdir('.') if name.startswith('.test_mason_journal.jsonl.')
+                    and not name.endswith('.lock')])
+
+    def test_prune(self):
+        with patch('time.time', return_value=time.time() - self.journal.stale_after - 1):
+            self.journal.record('register/a', 'hashed', size=10)
+            self.journal.record('register/b', 'hashed', size=20)
+        # Still being worked on
+        self.journal.record('register/b', 'uploaded')
+
+        self.journal.prune()
+        state = self.journal.load()
+        assert(state.keys() == ['register/b'])
+        assert(state['register/b']['size'] == 20)
+
+    def test_digests_round_trip(self):
+        digests = digest_file('res/v1.apk')
+        restored = FileDigests.from_dict(digests.size, digests.to_dict())
+        assert(restored.hexdigest('sha1') == digests.hexdigest('sha1'))
+        assert(restored.digest('md5') == digests.digest('md5'))
+
+
+if __name__ == '__main__':
+    unittest.main()
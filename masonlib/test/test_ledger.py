@@ -0,0 +1,71 @@
+import json
+import os
+import unittest
+from multiprocessing import Process
+
+from masonlib.internal.ledger import Ledger
+from test_common import Common
+
+
+class LedgerTest(unittest.TestCase):
+    SHA1 = 'da39a3ee5e6b4b0d3255bfef95601890afd80709'
+
+    def setUp(self):
+        self.ledger = Ledger('./.test_mason_ledger.json')
+        self.media = Common.create_mock_media_file()
+
+    def tearDown(self):
+        for path in (self.ledger.file, self.ledger.file + '.lock'):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def test_contains_empty(self):
+        assert(not self.ledger.contains('mason-test', self.media, self.SHA1))
+
+    def test_record(self):
+        self.ledger.record('mason-test', self.media, self.SHA1)
+
+        # reload
+        self.ledger.reload()
+        assert(self.ledger.contains('mason-test', self.media, self.SHA1))
+        assert(not self.ledger.contains('other-customer', self.media, self.SHA1))
+        assert(not self.ledger.contains('mason-test', self.media, '0' * 40))
+
+    def test_record_merges_other_writers(self):
+        other = Ledger(self.ledger.file)
+        other.record('other-customer', self.media, self.SHA1)
+        assert(self.ledger.record('mason-test', self.media, self.SHA1))
+
+        self.ledger.reload()
+        assert(self.ledger.contains('mason-test', self.media, self.SHA1))
+        assert(self.ledger.contains('other-customer', self.media, self.SHA1))
+
+    def test_record_concurrent_processes(self):
+        def record(customer):
+            ledger = Ledger(self.ledger.file)
+            for i in range(50):
+                assert(ledger.record(customer, self.media, str(i)))
+
+        processes = [Process(target=record, args=('customer-{}'.format(i),)) for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        with open(self.ledger.file) as ledger_file:
+            data = json.load(ledger_file)
+        self.assertEqual(sum(len(keys) for keys in data.values()), 150)
+        self.assertEqual([name for name in os.listdir('.') if name.startswith('.test_mason_ledger.json.')],
+                         ['.test_mason_ledger.json.lock'])
+
+    def test_record_unwritable(self):
+        ledger = Ledger(os.path.join(self.ledger.file, 'registered.json'))
+        with open(self.ledger.file, 'w') as not_a_directory:
+            not_a_directory.write('')
+        assert(not ledger.record('mason-test', self.media, self.SHA1))
+        assert(ledger.contains('mason-test', self.media, self.SHA1))
+
+
+if __name__ == '__main__':
+    unittest.main()
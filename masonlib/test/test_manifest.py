@@ -0,0 +1,155 @@
+import StringIO
+import struct
+import unittest
+import zipfile
+
+from mock import patch
+
+from masonlib.external.apk_parse.apk import APK, AndroidManifest, NS_ANDROID_URI, CHUNK_AXML_FILE, \
+    CHUNK_XML_START_NAMESPACE, CHUNK_XML_END_NAMESPACE, CHUNK_XML_START_TAG, CHUNK_XML_END_TAG, TYPE_STRING, \
+    TYPE_INT_DEC, TYPE_INT_BOOLEAN
+from test_stringblock import create_string_pool
+
+NO_INDEX = 0xFFFFFFFF
+
+
+def create_axml(root):
+    """ Binary XML of an element tree, every element being (tag, {name or (namespace, name): value}, children).
+        Names without a namespace get the android one, except 'package'. """
+    strings = [u'android', NS_ANDROID_URI]
+
+    def index(string):
+        if string not in strings:
+            strings.append(string)
+        return strings.index(string)
+
+    def chunk(chunk_type, *values):
+        return struct.pack('<LLLL', chunk_type, 16 + 4 * len(values), 1, NO_INDEX) + \
+            struct.pack('<%dL' % len(values), *values)
+
+    def element(tag, attributes, children):
+        values = []
+        for name, value in sorted(attributes.items()):
+            if not isinstance(name, tuple):
+                name = ('', name) if name == 'package' else (NS_ANDROID_URI, name)
+            namespace = index(name[0]) if name[0] else NO_INDEX
+            if isinstance(value, bool):
+                values.extend([namespace, index(name[1]), NO_INDEX, TYPE_INT_BOOLEAN << 24, int(value)])
+            elif isinstance(value, int):
+                values.extend([namespace, index(name[1]), NO_INDEX, TYPE_INT_DEC << 24, value])
+            else:
+                values.extend([namespace, index(name[1]), index(value), TYPE_STRING << 24, index(value)])
+        data = chunk(CHUNK_XML_START_TAG, NO_INDEX, index(tag), 0x00140014, len(attributes), 0, *values)
+        for child in children:
+            data += element(*child)
+        return data + chunk(CHUNK_XML_END_TAG, NO_INDEX, index(tag))
+
+    body = chunk(CHUNK_XML_START_NAMESPACE, 0, 1) + element(*root) + chunk(CHUNK_XML_END_NAMESPACE, 0, 1)
+    pool = create_string_pool(strings, utf8=True)
+    return struct.pack('<LL', CHUNK_AXML_FILE, 8 + len(pool) + len(body)) + pool + body
+
+
+def create_apk(manifest):
+    data = StringIO.StringIO()
+    with zipfile.ZipFile(data, 'w') as apk:
+        apk.writestr('AndroidManifest.xml', manifest)
+    return data.getvalue()
+
+
+def _intent_filter(action, *categories):
+    return ('intent-filter', {}, [('action', {'name': action}, [])] +
+            [('category', {'name': category}, []) for category in categories])
+
+
+MANIFEST = ('manifest', {'package': 'com.this.is.a.test', 'versionCode': 16, 'versionName': '1.6'}, [
+    ('uses-sdk', {'minSdkVersion': 21, 'targetSdkVersion': 28}, []),
+    ('uses-permission', {'name': 'android.permission.INTERNET'}, []),
+    ('uses-permission', {'name': 'android.permission.CAMERA'}, []),
+    ('application', {'label': 'Test & "app"', 'allowBackup': True}, [
+        ('activity', {'name': '.MainActivity'}, [
+            _intent_filter('android.intent.action.MAIN', 'android.intent.category.LAUNCHER')]),
+        ('activity', {'name': 'Settings'}, [
+            _intent_filter('android.intent.action.VIEW', 'android.intent.category.DEFAULT'),
+            _intent_filter('android.intent.action.EDIT', 'android.intent.category.DEFAULT')]),
+        ('service', {'name': 'com.this.is.a.test.Sync'}, []),
+        ('receiver', {'name': '.Boot'}, [_intent_filter('android.intent.action.BOOT_COMPLETED')]),
+        ('provider', {'name': '.Files'}, []),
+        ('uses-library', {'name': 'org.apache.http.legacy'}, []),
+    ]),
+])
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manifest = create_axml(MANIFEST)
+        self.apk = APK(create_apk(self.manifest), raw=True)
+
+    def test_model(self):
+        manifest = AndroidManifest(self.manifest)
+        self.assertTrue(manifest.is_valid())
+        self.assertEqual(manifest.get_package(), 'com.this.is.a.test')
+        self.assertEqual(manifest.get_version_code(), '16')
+        self.assertEqual(manifest.get_version_name(), '1.6')
+        self.assertEqual(manifest.get_min_sdk_version(), '21')
+        self.assertEqual(manifest.get_max_sdk_version(), None)
+        self.assertEqual(manifest.get_permissions(), ['android.permission.INTERNET', 'android.permission.CAMERA'])
+        self.assertEqual([item.get('name') for item in manifest.get_components('activity')],
+                         ['.MainActivity', 'Settings'])
+        self.assertEqual(manifest.get_intent_filters(manifest.get_components('activity')[1]),
+                         [{'action': ['android.intent.action.VIEW'], 'category': ['android.intent.category.DEFAULT']},
+                          {'action': ['android.intent.action.EDIT'], 'category': ['android.intent.category.DEFAULT']}])
+        application = manifest.get_elements('application')[0]
+        self.assertEqual(application.get('label'), 'Test & "app"')
+        self.assertEqual(application.get('allowBackup'), 'true')
+        self.assertEqual(application.parent, manifest.root)
+
+    def test_apk_getters(self):
+        apk = self.apk
+        self.assertTrue(apk.is_valid_APK())
+        self.assertEqual(apk.get_package(), 'com.this.is.a.test')
+        self.assertEqual(apk.get_androidversion_code(), '16')
+        self.assertEqual(apk.get_permissions(), ['android.permission.INTERNET', 'android.permission.CAMERA'])
+        self.assertEqual(apk.get_activities(), ['com.this.is.a.test.MainActivity', 'com.this.is.a.test.Settings'])
+        self.assertEqual(apk.get_services(), ['com.this.is.a.test.Sync'])
+        self.assertEqual(apk.get_receivers(), ['com.this.is.a.test.Boot'])
+        self.assertEqual(apk.get_providers(), ['com.this.is.a.test.Files'])
+        self.assertEqual(apk.get_libraries(), ['org.apache.http.legacy'])
+        self.assertEqual(apk.get_main_activity(), 'com.this.is.a.test.MainActivity')
+        self.assertEqual(apk.get_min_sdk_version(), '21')
+        self.assertEqual(apk.get_target_sdk_version(), '28')
+        self.assertEqual(apk.get_intent_filters('activity', 'com.this.is.a.test.Settings'),
+                         {'action': ['android.intent.action.VIEW', 'android.intent.action.EDIT'],
+                          'category': ['android.intent.category.DEFAULT']})
+        self.assertEqual(apk.get_intent_filters('provider', 'com.this.is.a.test.Files'), {})
+
+    def test_same_as_xml(self):
+        xml = self.apk.get_android_manifest_xml()
+        for tag in ('manifest', 'uses-sdk', 'uses-permission', 'application', 'activity', 'intent-filter', 'action',
+                    'category', 'service', 'receiver', 'provider'):
+            elements = self.apk.get_android_manifest().get_elements(tag)
+            xml_elements = xml.getElementsByTagName(tag)
+            self.assertEqual(len(elements), len(xml_elements))
+            for element, xml_element in zip(elements, xml_elements):
+                for (namespace, name), value in element.attributes.items():
+                    if '&' in value:
+                        # AXMLPrinter escapes attribute values twice
+                        continue
+                    self.assertEqual(value, xml_element.getAttributeNS(namespace or None, name))
+
+    def test_xml_only_on_demand(self):
+        with patch('masonlib.external.apk_parse.apk.minidom') as mock_minidom:
+            apk = APK(create_apk(self.manifest), raw=True)
+            mock_minidom.parseString.assert_not_called()
+            apk.get_android_manifest_xml()
+            mock_minidom.parseString.assert_called_once()
+
+    def test_invalid_manifest(self):
+        apk = APK(create_apk('not a binary xml file'), raw=True)
+        self.assertFalse(apk.is_valid_APK())
+        self.assertEqual(apk.get_activities(), [])
+        self.assertIsNone(apk.get_min_sdk_version())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,17 @@
 # COPYRIGHT MASONAMERICA
+import shutil
+import tempfile
 import unittest
 
+import requests
+from mock import MagicMock, patch
+
 from masonlib.imason import IMason
 from masonlib.internal.apk import Apk
+from masonlib.internal.apk_cache import ApkCache
+from masonlib.internal.mason import REGISTERED, CONFLICT
+from masonlib.internal.session import CircuitOpen, DeadlineExceeded
+from masonlib.internal.utils import digest_file
 from masonlib.platform import Platform
 from test_common import Common
 
@@ -29,8 +38,8 @@ class MasonTest(unittest.TestCase):
                    'id_token': '09ads09a8dsfa0re',
                    'connection': 'Username-Password-Authentication',
                    'grant_type': 'password',
-                   'scope': 'openid',
-                   'device': ''}
+                   'scope': 'openid offline_access',
+                   'device': 'mason-cli'}
 
         assert(expected_payload == self.mason._get_auth_payload(test_user, test_password))
 
@@ -58,6 +67,11 @@ class MasonTest(unittest.TestCase):
         actual_url = self.mason._get_signed_url_request_endpoint(test_customer, test_apk)
         assert(expected_url == actual_url)
 
+        # test requesting a multipart upload
+        actual_url = self.mason._get_signed_url_request_endpoint(test_customer, test_apk,
+                                                                 {'parts': 5, 'part_size': 1024})
+        assert(expected_url + '&part_size=1024&parts=5' == actual_url)
+
     def test__upload_to_signed_url(self):
         apkf = Common.create_mock_apk_file()
         store = Common.create_mock_store()
@@ -150,5 +164,112 @@ class MasonTest(unittest.TestCase):
                self.mason._get_deploy_payload(test_customer, test_group, test_item, test_version, test_item_type,
                                               test_push))
 
+    def test__get_customer_cached(self):
+        self.mason.set_access_token('oads098fa9830924qdf09asfd')
+        self.mason.persist = MagicMock()
+        self.mason.persist.retrieve_customer.return_value = 'mason-test'
+        self.mason.session = MagicMock()
+
+        assert('mason-test' == self.mason._get_customer())
+        assert(not self.mason.session.get.called)
+
+    def test__get_customer_resolves_once(self):
+        self.mason.set_access_token('oads098fa9830924qdf09asfd')
+        self.mason.store = Common.create_mock_store()
+        self.mason.persist = MagicMock()
+        self.mason.persist.retrieve_customer.return_value = None
+        self.mason.session = MagicMock()
+        self.mason.session.get.return_value = MagicMock(
+            status_code=200, text='{"user_metadata": {"clients": ["mason-test"]}}')
+
+        assert('mason-test' == self.mason._get_customer())
+        self.mason.persist.write_customer.assert_called_once_with('oads098fa9830924qdf09asfd', 'mason-test')
+
+    def test__request_user_info_metrics(self):
+        self.mason.config = MagicMock(no_colorize=True)
+        self.mason.store = Common.create_mock_store()
+        self.mason.session = MagicMock()
+        self.mason.session.get.return_value = MagicMock(status_code=401, text='')
+
+        assert(self.mason._request_user_info() is None)
+        assert([(span.phase, span.ok) for span in self.mason.metrics.spans] == [('user_info', False)])
+
+    def test__check_registered(self):
+        test_apk = Apk(Common.create_mock_apk_file())
+        test_sha1 = 'da39a3ee5e6b4b0d3255bfef95601890afd80709'
+
+        self.mason.config = MagicMock(no_colorize=True)
+        self.mason.store = Common.create_mock_store()
+        self.mason.ledger = MagicMock()
+        self.mason.ledger.contains.return_value = False
+        self.mason.session = MagicMock()
+
+        # unknown to the registry
+        self.mason.session.get.return_value = MagicMock(status_code=404, text='')
+        assert(self.mason._check_registered('mason-test', test_apk, test_sha1) is None)
+
+        # registered with the same checksum
+        self.mason.session.get.return_value = MagicMock(
+            status_code=200, text='{"checksum": {"sha1": "%s"}}' % test_sha1)
+        assert(self.mason._check_registered('mason-test', test_apk, test_sha1) == REGISTERED)
+        self.mason.ledger.record.assert_called_once_with('mason-test', test_apk, test_sha1)
+
+        # registered with a different checksum
+        self.mason.session.get.return_value = MagicMock(
+            status_code=200, text='{"checksum": {"sha1": "0000000000000000000000000000000000000000"}}')
+        assert(self.mason._check_registered('mason-test', test_apk, test_sha1) == CONFLICT)
+
+    def test__check_registered_ledger(self):
+        self.mason.ledger = MagicMock()
+        self.mason.ledger.contains.return_value = True
+        self.mason.session = MagicMock()
+
+        assert(self.mason._check_registered('mason-test', Apk(Common.create_mock_apk_file()), 'sha1') == REGISTERED)
+        assert(not self.mason.session.get.called)
+
+    def test_request_errors_are_reported(self):
+        test_apk = Apk(Common.create_mock_apk_file())
+        self.mason.config = MagicMock(no_colorize=True, debug=False)
+        self.mason.store = Common.create_mock_store()
+        self.mason.persist = MagicMock()
+        self.mason.persist.retrieve_refresh_token.return_value = 'refresh'
+        self.mason.ledger = MagicMock()
+        self.mason.ledger.contains.return_value = False
+        self.mason.session = MagicMock()
+        payload = self.mason._get_deploy_payload('mason-test', 'development', 'TestItemName', '1', 'apk', False)
+
+        for error in (requests.Timeout('read timed out'), requests.ConnectionError('connection refused'),
+                      DeadlineExceeded('Command deadline exceeded'), CircuitOpen('not retrying for now')):
+            self.mason.session.get.side_effect = error
+            self.mason.session.post.side_effect = error
+            self.mason.session.put.side_effect = error
+
+            assert(not self.mason._refresh_tokens())
+            assert(self.mason._request_user_info() is None)
+            assert(self.mason._check_registered('mason-test', test_apk, 'sha1') is None)
+            assert(self.mason._request_signed_url('mason-test', test_apk, 'md5') is None)
+            assert(not self.mason._register_to_mason('mason-test', 'https://download', 'sha1', test_apk))
+            assert(self.mason._queue_build('mason-test', 'TestProjectName', '1') is None)
+            assert(not self.mason._post_deploy(payload))
+            assert(not self.mason.authenticate('foo', 'bar'))
+
+    def test_register_apk_reads_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.mason.config = MagicMock(verbose=False)
+        self.mason.apk_cache = ApkCache(directory)
+        self.mason._validate_credentials = MagicMock(return_value=True)
+        self.mason._get_customer = MagicMock(return_value='mason-test')
+        self.mason._check_registered = MagicMock(return_value=REGISTERED)
+
+        with patch('masonlib.internal.mason.digest_file', wraps=digest_file) as mock_digest:
+            assert(self.mason.parse_apk('res/v1.apk'))
+            assert(self.mason._register_artifact('res/v1.apk'))
+        mock_digest.assert_called_once_with('res/v1.apk')
+        self.mason._check_registered.assert_called_once_with('mason-test', self.mason.artifact,
+                                                             digest_file('res/v1.apk').hexdigest('sha1'))
+        # The digests keyed the cache entry
+        assert(self.mason.apk_cache.get('res/v1.apk') is not None)
+
 if __name__ == '__main__':
     unittest.main()
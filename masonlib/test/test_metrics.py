@@ -0,0 +1,58 @@
+import json
+import os
+import unittest
+
+from masonlib.internal.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        with self.metrics.span('upload', artifact='app') as span:
+            span.bytes = 1024
+        with self.metrics.span('upload', artifact='other') as span:
+            span.bytes = 2048
+            span.ok = False
+
+    def tearDown(self):
+        for filename in ('./.test_mason_metrics.jsonl', './.test_mason_metrics.prom'):
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+    def test_span(self):
+        assert(len(self.metrics.spans) == 2)
+        span = self.metrics.spans[0]
+        assert(span.phase == 'upload')
+        assert(span.labels == {'artifact': 'app'})
+        assert(span.duration >= 0)
+        assert(span.ok)
+
+    def test_span_raises(self):
+        def fail():
+            with self.metrics.span('hash'):
+                raise IOError('disk on fire')
+
+        self.assertRaises(IOError, fail)
+        assert(self.metrics.spans[-1].phase == 'hash')
+        assert(not self.metrics.spans[-1].ok)
+
+    def test_json_lines(self):
+        self.metrics.write('./.test_mason_metrics.jsonl')
+        with open('./.test_mason_metrics.jsonl') as metrics_file:
+            lines = [json.loads(line) for line in metrics_file]
+        assert([(line['phase'], line['artifact'], line['bytes'], line['ok']) for line in lines] ==
+               [('upload', 'app', 1024, True), ('upload', 'other', 2048, False)])
+
+    def test_prometheus(self):
+        self.metrics.write('./.test_mason_metrics.prom')
+        with open('./.test_mason_metrics.prom') as metrics_file:
+            lines = metrics_file.read().splitlines()
+        assert('# TYPE mason_phase_duration_seconds summary' in lines)
+        assert('mason_phase_duration_seconds_count{phase="upload"} 2' in lines)
+        assert('mason_phase_bytes_total{phase="upload"} 3072' in lines)
+        assert('mason_phase_failures_total{phase="upload"} 1' in lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import parse_qs, urlparse
+
+from mock import patch
+
+from masonlib.internal.multipart import MultipartUpload, PartManifest
+from masonlib.internal.session import Session
+
+PART_SIZE = 1024
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    """ Bare bones S3 compatible multipart endpoint. """
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        query = parse_qs(urlparse(self.path).query)
+        number = int(query['partNumber'][0])
+        data = self.rfile.read(int(self.headers.getheader('Content-Length')))
+        self.server.requests.append(number)
+        if number in self.server.failing_parts:
+            self.server.failing_parts.remove(number)
+            return self._respond(500)
+        self.server.parts[number] = data
+        self._respond(200, headers={'ETag': '"{}"'.format(hashlib.md5(data).hexdigest())})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.getheader('Content-Length')))
+        numbers = [int(number) for number in re.findall('<PartNumber>(\\d+)</PartNumber>', body)]
+        self.server.completed = b''.join(self.server.parts[number] for number in numbers)
+        digests = b''.join(hashlib.md5(self.server.parts[number]).digest() for number in numbers)
+        etag = '{}-{}'.format(hashlib.md5(digests).hexdigest(), len(numbers))
+        if not self.server.report_etag:
+            return self._respond(200, '<CompleteMultipartUploadResult></CompleteMultipartUploadResult>')
+        self._respond(200, '<CompleteMultipartUploadResult><ETag>"{}"</ETag></CompleteMultipartUploadResult>'
+                      .format(etag))
+
+    def _respond(self, status, body='', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class S3Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), S3Handler)
+        self.parts = {}
+        self.requests = []
+        self.failing_parts = []
+        self.completed = None
+        self.report_etag = True
+
+
+class MultipartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = S3Server()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base_url = 'http://127.0.0.1:{}/bucket/artifact'.format(self.server.server_address[1])
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'artifact.zip')
+        self.content = os.urandom(PART_SIZE * 4 + 100)
+        with open(self.filename, 'wb') as artifact:
+            artifact.write(self.content)
+        self.manifest_file = os.path.join(self.tmp_dir, 'uploads', 'manifest.json')
+        self.session = Session(retries=0)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _multipart_data(self):
+        count = MultipartUpload.part_count(len(self.content), PART_SIZE)
+        return {'upload_id': 'upload-1',
+                'parts': [{'part_number': n, 'signed_request': '{}?partNumber={}&uploadId=upload-1'
+                           .format(self.base_url, n)} for n in range(1, count + 1)],
+                'complete_request': self.base_url + '?uploadId=upload-1'}
+
+    def _upload(self):
+        upload = MultipartUpload(self.session, self.filename, self._multipart_data(),
+                                 PartManifest(self.manifest_file), part_size=PART_SIZE, jobs=3, progress=False)
+        return upload.upload()
+
+    def test_part_count(self):
+        assert(MultipartUpload.part_count(0, PART_SIZE) == 1)
+        assert(MultipartUpload.part_count(PART_SIZE, PART_SIZE) == 1)
+        assert(MultipartUpload.part_count(PART_SIZE + 1, PART_SIZE) == 2)
+
+    def test_upload(self):
+        assert(self._upload())
+        assert(self.server.completed == self.content)
+        assert(sorted(self.server.requests) == [1, 2, 3, 4, 5])
+        assert(not os.path.isfile(self.manifest_file))
+
+    def test_upload_without_checksum(self):
+        self.server.report_etag = False
+        with patch('sys.stdout') as mock_stdout:
+            assert(self._upload())
+        output = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+        assert('relying on the checksums of its 5 parts' in output)
+        assert(self.server.completed == self.content)
+
+    def test_resume(self):
+        self.server.failing_parts = [3]
+        assert(not self._upload())
+        assert(PartManifest(self.manifest_file).parts().keys() == [1, 2, 4, 5])
+
+        self.server.requests = []
+        assert(self._upload())
+        assert(self.server.requests == [3])
+        assert(self.server.completed == self.content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
+import base64
+import json
 import os
+import time
 import unittest
 
 from masonlib.internal.persist import Persist
@@ -39,5 +42,46 @@ class PersistTest(unittest.TestCase):
         assert(secondary_id_token == self.persist.retrieve_id_token())
         assert(secondary_access_token == self.persist.retrieve_access_token())
 
+    def test_retrieve_customer_empty(self):
+        assert(self.persist.retrieve_customer(self.ACCESS_TOKEN) is None)
+
+    def test_write_customer(self):
+        assert(self.persist.write_customer(self.ACCESS_TOKEN, 'mason-test'))
+
+        # reload
+        self.persist.reload()
+        assert('mason-test' == self.persist.retrieve_customer(self.ACCESS_TOKEN))
+        assert(self.persist.retrieve_customer('SomeOtherAccessToken') is None)
+        assert(self.ACCESS_TOKEN == self.persist.retrieve_access_token())
+
+    def test_customer_expires_with_token(self):
+        expired = base64.urlsafe_b64encode(json.dumps({'exp': int(time.time()) - 10})).rstrip('=')
+        self.persist.write_tokens({'id_token': 'header.{}.signature'.format(expired),
+                                   'access_token': self.ACCESS_TOKEN})
+        self.persist.write_customer(self.ACCESS_TOKEN, 'mason-test')
+        assert(self.persist.retrieve_customer(self.ACCESS_TOKEN) is None)
+
+    def test_write_tokens_clears_customer(self):
+        self.persist.write_customer(self.ACCESS_TOKEN, 'mason-test')
+        self._write_test_tokens()
+        assert(self.persist.retrieve_customer(self.ACCESS_TOKEN) is None)
+
+    def test_update_tokens(self):
+        expiry = int(time.time()) + 60
+        claims = base64.urlsafe_b64encode(json.dumps({'exp': expiry})).rstrip('=')
+        self.persist.write_tokens({'id_token': self.ID_TOKEN, 'access_token': self.ACCESS_TOKEN,
+                                   'refresh_token': 'refresh'})
+        self.persist.write_customer(self.ACCESS_TOKEN, 'mason-test')
+
+        self.persist.update_tokens({'id_token': 'header.{}.signature'.format(claims), 'access_token': 'renewed'})
+        self.persist.reload()
+        assert(self.persist.retrieve_token_expiry() == expiry)
+        assert(self.persist.retrieve_access_token() == 'renewed')
+        assert(self.persist.retrieve_refresh_token() == 'refresh')
+        assert(self.persist.retrieve_customer('renewed') == 'mason-test')
+
+    def test_retrieve_token_expiry_opaque(self):
+        assert(self.persist.retrieve_token_expiry() is None)
+
 if __name__ == '__main__':
     unittest.main()
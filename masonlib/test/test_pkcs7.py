@@ -0,0 +1,79 @@
+import hashlib
+import unittest
+import zipfile
+from datetime import datetime
+
+from masonlib.external.apk_parse.pkcs7 import CONSTRUCTED, PKCS7Error, load_pkcs7, read_node
+
+
+def _signature(apk):
+    return zipfile.ZipFile(apk).read('META-INF/CERT.RSA')
+
+
+def to_indefinite_length(data, depth=3):
+    """ BER encoding of a DER value, using indefinite lengths for its constructed values down to the given depth,
+        as some signing tools do for the outer layers of a SignedData block. """
+    def encode(node, level):
+        if not node.tag & CONSTRUCTED or level > depth:
+            return node.der
+        return chr(node.tag) + '\x80' + ''.join(encode(child, level + 1) for child in node.children()) + '\x00\x00'
+    return encode(read_node(data, 0), 0)
+
+
+class PKCS7Test(unittest.TestCase):
+
+    def test_load_signer(self):
+        signed_data = load_pkcs7(_signature('res/v1.apk'))
+        self.assertEqual(len(signed_data.certificates), 1)
+        self.assertEqual(signed_data.signers, signed_data.certificates)
+
+        certificate = signed_data.signers[0]
+        self.assertEqual(certificate.version, 3)
+        self.assertEqual(certificate.serial_number, 1136169760)
+        self.assertEqual(certificate.signature_algorithm, 'sha256WithRSAEncryption')
+        self.assertEqual(str(certificate.subject), 'C=US, ST=WA, L=test, O=test, OU=test, CN=Test')
+        self.assertEqual(certificate.issuer, certificate.subject)
+        self.assertEqual(certificate.subject.common_name, 'Test')
+        self.assertEqual(certificate.not_before, datetime(2018, 10, 23, 22, 42, 50))
+        self.assertEqual(certificate.not_after, datetime(2043, 10, 17, 22, 42, 50))
+        self.assertEqual(certificate.fingerprint(), '4e3e0ae244205faa0fa2fe2a04794888352891810266af0f9486052571edb2e0')
+        self.assertEqual(certificate.fingerprint('sha1'), hashlib.sha1(certificate.der).hexdigest())
+
+    def test_load_debug_signer(self):
+        certificate = load_pkcs7(_signature('res/debug.apk')).signers[0]
+        self.assertEqual(certificate.version, 1)
+        self.assertEqual(certificate.subject.common_name, 'Android Debug')
+        self.assertEqual(certificate.subject.get('O'), 'Android')
+
+    def test_validity(self):
+        certificate = load_pkcs7(_signature('res/v1.apk')).signers[0]
+        self.assertTrue(certificate.is_valid_at(datetime(2020, 1, 1)))
+        self.assertFalse(certificate.is_valid_at(datetime(2018, 1, 1)))
+        self.assertFalse(certificate.is_valid_at(datetime(2044, 1, 1)))
+
+    def test_to_text(self):
+        text = load_pkcs7(_signature('res/v1.apk')).signers[0].to_text()
+        self.assertIn('    Subject: C=US, ST=WA, L=test, O=test, OU=test, CN=Test', text)
+        self.assertIn('        Not After : Oct 17 22:42:50 2043 GMT', text)
+
+    def test_load_indefinite_length(self):
+        data = _signature('res/v1.apk')
+        ber = to_indefinite_length(data)
+        self.assertNotEqual(ber, data)
+        self.assertEqual(read_node(ber, 0).end, len(ber))
+
+        certificate = load_pkcs7(ber).signers[0]
+        self.assertEqual(certificate.subject.common_name, 'Test')
+        self.assertEqual(certificate.fingerprint(), load_pkcs7(data).signers[0].fingerprint())
+
+        for invalid in (ber[:-2], ber[:len(ber) // 2], '\x04\x80\x00\x00'):
+            self.assertRaises(PKCS7Error, load_pkcs7, invalid)
+
+    def test_invalid(self):
+        data = _signature('res/v1.apk')
+        for invalid in ('', 'not a signature', data[:len(data) // 2], '\x30\x03\x06\x01\x00'):
+            self.assertRaises(PKCS7Error, load_pkcs7, invalid)
+
+
+if __name__ == '__main__':
+    unittest.main()
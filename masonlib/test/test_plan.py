@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import yaml
+from mock import MagicMock, patch
+
+from masonlib.imason import IMason
+from masonlib.internal.builds import BUILD_FAILED, BUILD_NOT_STARTED, BUILD_SUCCEEDED, BUILD_TIMED_OUT, \
+    DEFAULT_WAIT_TIMEOUT
+from masonlib.internal.plan import Plan, PlanNode, execute_graph
+from masonlib.platform import Platform
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as outfile:
+            yaml.dump(data, outfile)
+        return path
+
+    def test_validate(self):
+        plan = Plan({'artifacts': [{'type': 'exe', 'path': 'a.exe'}, {'type': 'media', 'path': 'boot.zip'}],
+                     'builds': [{'project': 'mason-test'}],
+                     'deploys': [{'type': 'apk', 'name': 'com.test.app', 'version': 1}]})
+        assert(len(plan.validate()) == 6)
+        assert(Plan({'builds': [{'project': 'mason-test', 'version': 5}]}).validate() == [])
+
+    def test_load_invalid(self):
+        assert(Plan.load(self._write('plan.yml', {'deploys': [{'type': 'unknown'}]})) is None)
+        assert(Plan.load(os.path.join(self.tmp_dir, 'missing.yml')) is None)
+
+    def test_load_malformed(self):
+        for data in (['a', 'b'], 'plan', {'artifacts': 'a.apk'}, {'builds': {'project': 'mason-test'}},
+                     {'deploys': ['mason-test']}, {'artifacts': [{'type': 'apk', 'path': 'a.apk'}, None]},
+                     {'deploys': [{'type': 'apk', 'name': 'com.test.app', 'version': 1, 'groups': 'development'}]}):
+            with patch('sys.stdout') as mock_stdout:
+                assert(Plan.load(self._write('plan.yml', data)) is None)
+            output = ''.join(call[0][0] for call in mock_stdout.write.call_args_list)
+            assert(output.startswith('Error in plan file: '))
+
+    def test_execute_graph_order(self):
+        order = []
+        lock = threading.Lock()
+
+        def work(name):
+            def run(item):
+                with lock:
+                    order.append(name)
+                return item.succeed('done')
+            return run
+
+        register = PlanNode('register', work('register'))
+        build = PlanNode('build', work('build'))
+        build.depends_on([register])
+        deploys = [PlanNode('deploy {}'.format(i), work('deploy')) for i in range(4)]
+        for deploy in deploys:
+            deploy.depends_on([build])
+
+        assert(execute_graph(deploys + [build, register], 3))
+        assert(order == ['register', 'build'] + ['deploy'] * 4)
+
+    def test_execute_graph_failure(self):
+        register = PlanNode('register', lambda item: item.fail('upload failed'))
+        build = PlanNode('build', MagicMock())
+        build.depends_on([register])
+        deploy = PlanNode('deploy', MagicMock())
+        deploy.depends_on([build])
+        other = PlanNode('other', lambda item: item.succeed('done'))
+        orphan = PlanNode('orphan', MagicMock())
+        orphan.deps.append('missing')
+
+        assert(not execute_graph([register, build, deploy, other, orphan], 2))
+        assert(not build.work.called and not deploy.work.called and not orphan.work.called)
+        assert(build.item.error == 'dependency failed')
+        assert(deploy.item.error == 'dependency failed')
+        assert(orphan.item.error == 'unresolved dependency')
+        assert(other.item.ok)
+
+    def _create_mason(self):
+        config = MagicMock()
+        config.skip_verify = True
+        config.no_colorize = True
+        config.verbose = False
+        config.pool_connections = config.pool_maxsize = config.timeout = config.retries = config.deadline = None
+        config.max_bandwidth = None
+        mason = Platform(config).get(IMason)
+        mason._validate_credentials = MagicMock(return_value=True)
+        mason._renew_credentials = MagicMock(return_value=True)
+        mason._get_customer = MagicMock(return_value='mason-test')
+        mason._upload_batch_item = MagicMock(side_effect=lambda customer, item: item.succeed('uploaded'))
+        mason._register_batch_item = MagicMock(side_effect=lambda customer, item: item.succeed('registered'))
+        mason._build_and_wait = MagicMock(return_value=BUILD_SUCCEEDED)
+        mason._post_deploy = MagicMock(return_value=True)
+        return mason
+
+    def _write_release_plan(self):
+        config_yaml = self._write('mason-test.yml', {'os': {'name': 'mason-test', 'version': 5}})
+        return self._write('plan.yml', {
+            'artifacts': [{'type': 'config', 'path': config_yaml}],
+            'builds': [{'project': 'mason-test', 'version': 5}],
+            'deploys': [{'type': 'config', 'name': 'mason-test', 'version': 5, 'groups': ['development', 'staging']}]
+        })
+
+    def test_apply(self):
+        mason = self._create_mason()
+        plan_yaml = self._write_release_plan()
+
+        assert(mason.apply(plan_yaml, 4))
+        assert(mason._get_customer.call_count == 1)
+        mason._build_and_wait.assert_called_once_with('mason-test', [('mason-test', '5')], DEFAULT_WAIT_TIMEOUT, [])
+        assert(sorted(call[0][0]['group'] for call in mason._post_deploy.call_args_list) ==
+               ['development', 'staging'])
+
+        nodes = mason._get_plan_nodes(Plan.load(plan_yaml), 'mason-test')
+        assert(nodes[1].deps == [nodes[0].id])
+        assert(nodes[2].deps == [nodes[0].id, nodes[1].id])
+
+    def test_apply_failed_build(self):
+        for result, error in ((BUILD_FAILED, 'build failed'), (BUILD_TIMED_OUT, 'build timed out'),
+                              (BUILD_NOT_STARTED, 'build rejected')):
+            mason = self._create_mason()
+            mason._build_and_wait.return_value = result
+            plan_yaml = self._write_release_plan()
+
+            assert(not mason.apply(plan_yaml, 4))
+            assert(not mason._post_deploy.called)
+            nodes = mason._get_plan_nodes(Plan.load(plan_yaml), 'mason-test')
+            assert(nodes[1].work(nodes[1].item).error == error)
+
+    def test_apply_expired_session_before_deploy(self):
+        def build_and_wait(*args):
+            # The session expires while waiting on the build
+            mason._renew_credentials.return_value = False
+            return BUILD_SUCCEEDED
+
+        mason = self._create_mason()
+        mason._build_and_wait.side_effect = build_and_wait
+        plan_yaml = self._write_release_plan()
+
+        assert(not mason.apply(plan_yaml, 4))
+        assert(not mason._post_deploy.called)
+        nodes = mason._get_plan_nodes(Plan.load(plan_yaml), 'mason-test')
+        assert(nodes[2].work(nodes[2].item).error == 'session expired')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import io
+import threading
+import time
+import unittest
+
+from masonlib.internal.scheduler import ThrottledStream, TokenBucket, UploadScheduler
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(200 * 1024, burst=20 * 1024)
+        start = time.time()
+        bucket.consume(60 * 1024)
+        # everything beyond the burst is sent at the rate
+        assert(time.time() - start >= 0.18)
+
+    def test_throttled_stream(self):
+        stream = ThrottledStream(io.BytesIO(b'x' * 30 * 1024), 30 * 1024, TokenBucket(100 * 1024, burst=10 * 1024))
+        start = time.time()
+        assert(len(stream) == 30 * 1024)
+        while stream.read(8192):
+            pass
+        assert(time.time() - start >= 0.18)
+        stream.seek(0)
+        assert(stream.tell() == 0)
+
+    def test_smallest_first(self):
+        scheduler = UploadScheduler(max_concurrency=1, initial_concurrency=1)
+        started = []
+
+        def upload(size):
+            with scheduler.slot(size):
+                started.append(size)
+
+        with scheduler.slot(1000):
+            threads = []
+            for size in (300, 100, 200):
+                thread = threading.Thread(target=upload, args=(size,))
+                thread.start()
+                threads.append(thread)
+                while len(scheduler._waiting) < len(threads):
+                    time.sleep(0.01)
+        for thread in threads:
+            thread.join(5)
+        assert(started == [100, 200, 300])
+
+    def test_concurrency_limit(self):
+        scheduler = UploadScheduler(max_concurrency=4, initial_concurrency=2)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def upload():
+            with scheduler.slot(100):
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.05)
+                with lock:
+                    running.pop()
+
+        threads = [threading.Thread(target=upload) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert(max(peak) <= 4)
+
+    def test_adapt(self):
+        scheduler = UploadScheduler(max_concurrency=4, initial_concurrency=2)
+        scheduler._adapt(100.0)
+        assert(scheduler.limit == 3)
+        scheduler._adapt(200.0)
+        assert(scheduler.limit == 4)
+        scheduler._adapt(400.0)
+        assert(scheduler.limit == 4)
+        # no gain: stay
+        scheduler._adapt(410.0)
+        assert(scheduler.limit == 4)
+        # loss: step back
+        scheduler._adapt(200.0)
+        assert(scheduler.limit == 3)
+
+    def test_set_concurrency(self):
+        scheduler = UploadScheduler(max_concurrency=8)
+        scheduler.set_concurrency(6)
+        assert(scheduler.limit == 6)
+        scheduler.set_concurrency(16)
+        assert(scheduler.limit == 8)
+        scheduler.set_concurrency(0)
+        assert(scheduler.limit == 1)
+
+    def test_backoff_on_error(self):
+        scheduler = UploadScheduler(max_concurrency=8, initial_concurrency=8)
+        with scheduler.slot(100) as slot:
+            slot.ok = False
+        assert(scheduler.limit == 4)
+
+        def fail():
+            with scheduler.slot(100):
+                raise IOError('connection reset')
+
+        self.assertRaises(IOError, fail)
+        assert(scheduler.limit == 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import threading
+import time
+import unittest
+
+import requests
+from mock import MagicMock, patch
+
+from masonlib.imason import IMason
+from masonlib.internal.session import CircuitBreaker, CircuitOpen, DeadlineExceeded, Session
+from masonlib.platform import Platform
+from test_common import Common
+
+
+class SessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = Session(pool_connections=2, pool_maxsize=7)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_session_is_reused(self):
+        assert(self.session._get_session() is self.session._get_session())
+
+    def test_session_is_shared_between_threads(self):
+        session_class = requests.Session
+
+        def slow_session():
+            time.sleep(0.05)
+            return session_class()
+
+        sessions = []
+        with patch('masonlib.internal.session.requests.Session', side_effect=slow_session) as mock_session:
+            threads = [threading.Thread(target=lambda: sessions.append(self.session._get_session()))
+                       for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(mock_session.call_count, 1)
+        self.assertEqual(len(set(id(session) for session in sessions)), 1)
+
+    def test_pool_sizes(self):
+        adapter = self.session._get_session().get_adapter('https://platform.bymason.com')
+        assert(adapter._pool_connections == 2)
+        assert(adapter._pool_maxsize == 7)
+
+    def test_default_pool_sizes(self):
+        session = Session(pool_connections=None, pool_maxsize=None)
+        assert(session.pool_connections > 0)
+        assert(session.pool_maxsize > 0)
+
+    def test_close(self):
+        self.session._get_session()
+        self.session.close()
+        assert(self.session._session is None)
+
+    def test_mason_uses_shared_session(self):
+        mason = Platform(Common.create_mock_config()).get(IMason)
+        mason.store = Common.create_mock_store()
+        mason.session = MagicMock()
+        mason.session.post.return_value = MagicMock(status_code=401, text='')
+
+        assert(not mason.authenticate('foo', 'bar'))
+        mason.session.post.assert_called_once_with(mason.store.auth_url(), json=mason._get_auth_payload('foo', 'bar'))
+
+    def _mock_transport(self, *results):
+        transport = MagicMock()
+        transport.request.side_effect = list(results)
+        self.session._session = transport
+        return transport
+
+    @patch('masonlib.internal.session.time.sleep')
+    def test_retry_idempotent(self, mock_sleep):
+        on_retry = MagicMock()
+        self.session.on_retry = on_retry
+        transport = self._mock_transport(MagicMock(status_code=503, headers={}),
+                                         requests.ConnectionError('reset'),
+                                         MagicMock(status_code=200, headers={}))
+
+        assert(self.session.get('https://platform.bymason.com/api').status_code == 200)
+        assert(transport.request.call_count == 3)
+        assert(on_retry.call_count == 2)
+        assert(mock_sleep.call_count == 2)
+
+    @patch('masonlib.internal.session.time.sleep')
+    def test_retry_gives_up(self, mock_sleep):
+        self.session.retries = 2
+        transport = self._mock_transport(*[MagicMock(status_code=500, headers={})] * 3)
+
+        assert(self.session.get('https://platform.bymason.com/api').status_code == 500)
+        assert(transport.request.call_count == 3)
+
+    @patch('masonlib.internal.session.time.sleep')
+    def test_no_retry_for_processed_post(self, mock_sleep):
+        transport = self._mock_transport(MagicMock(status_code=500, headers={}))
+
+        assert(self.session.post('https://platform.bymason.com/api', json={}).status_code == 500)
+        assert(transport.request.call_count == 1)
+
+    @patch('masonlib.internal.session.time.sleep')
+    def test_retry_unprocessed_post(self, mock_sleep):
+        transport = self._mock_transport(MagicMock(status_code=503, headers={'Retry-After': '2'}),
+                                         MagicMock(status_code=200, headers={}))
+
+        assert(self.session.post('https://platform.bymason.com/api', json={}).status_code == 200)
+        assert(transport.request.call_count == 2)
+        mock_sleep.assert_called_once_with(2.0)
+
+    def test_timeouts(self):
+        transport = self._mock_transport(MagicMock(status_code=200, headers={}))
+        self.session.get('https://platform.bymason.com/api')
+        assert(transport.request.call_args[1]['timeout'] ==
+               (self.session.connect_timeout, self.session.read_timeout))
+
+    def test_deadline(self):
+        self._mock_transport(MagicMock(status_code=200, headers={}))
+        self.session.set_deadline(-1)
+        self.assertRaises(DeadlineExceeded, self.session.get, 'https://platform.bymason.com/api')
+
+    def test_rewinds_body(self):
+        body = MagicMock()
+        body.tell.return_value = 0
+        self.session.backoff = 0
+        self._mock_transport(MagicMock(status_code=502, headers={}), MagicMock(status_code=200, headers={}))
+
+        assert(self.session.put('https://storage.googleapis.com/bucket', data=body).status_code == 200)
+        body.seek.assert_called_once_with(0)
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        assert(breaker.allow('host'))
+        breaker.record_failure('host')
+        assert(breaker.allow('host'))
+        breaker.record_failure('host')
+        assert(not breaker.allow('host'))
+        assert(breaker.allow('other'))
+
+    def test_circuit_open(self):
+        self.session.breaker = CircuitBreaker(threshold=1, cooldown=60)
+        self.session.retries = 0
+        self._mock_transport(MagicMock(status_code=500, headers={}))
+        self.session.get('https://platform.bymason.com/api')
+        self.assertRaises(CircuitOpen, self.session.get, 'https://platform.bymason.com/api')
+
+
+if __name__ == '__main__':
+    unittest.main()
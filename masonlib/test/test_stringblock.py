@@ -0,0 +1,73 @@
+import struct
+import unittest
+
+from masonlib.external.apk_parse import bytecode
+from masonlib.external.apk_parse.apk import APK, StringBlock, UTF8_FLAG
+
+
+def create_string_pool(strings, utf8):
+    """ Raw string pool chunk holding the given unicode strings. """
+    data = ''
+    offsets = []
+    for string in strings:
+        offsets.append(len(data))
+        if utf8:
+            encoded = string.encode('utf-8')
+            data += chr(len(string)) + chr(len(encoded)) + encoded + '\x00'
+        else:
+            data += struct.pack('<H', len(string)) + string.encode('utf-16-le') + '\x00\x00'
+    data += '\x00' * (-len(data) % 4)
+
+    header_size = 28
+    strings_offset = header_size + 4 * len(strings)
+    header = struct.pack('<hhiiiiii', 0x0001, header_size, strings_offset + len(data), len(strings), 0,
+                         UTF8_FLAG if utf8 else 0, strings_offset, 0)
+    return header + struct.pack('<%di' % len(offsets), *offsets) + data
+
+
+class StringBlockTest(unittest.TestCase):
+
+    STRINGS = [u'', u'app_name', u'Funci\xf3', u'\u65e5\u672c\u8a9e', u'com.this.is.a.test']
+
+    def test_utf8(self):
+        pool = StringBlock(bytecode.BuffHandle(create_string_pool(self.STRINGS, utf8=True)))
+        self.assertTrue(pool.m_isUTF8)
+        self.assertEqual([pool.getString(i) for i in range(len(self.STRINGS))], self.STRINGS)
+
+    def test_utf16(self):
+        pool = StringBlock(bytecode.BuffHandle(create_string_pool(self.STRINGS, utf8=False)))
+        self.assertFalse(pool.m_isUTF8)
+        self.assertEqual([pool.getString(i) for i in range(len(self.STRINGS))], self.STRINGS)
+
+    def test_out_of_range(self):
+        pool = StringBlock(bytecode.BuffHandle(create_string_pool(self.STRINGS, utf8=True)))
+        self.assertEqual(pool.getString(-1), '')
+        self.assertEqual(pool.getString(len(self.STRINGS)), '')
+
+    def test_bounded_cache(self):
+        strings = [u'string-{}'.format(i) for i in range(100)]
+        pool = StringBlock(bytecode.BuffHandle(create_string_pool(strings, utf8=True)), cache_size=10)
+        self.assertEqual([pool.getString(i) for i in range(100)], strings)
+        self.assertEqual(len(pool._cache), 10)
+        self.assertEqual(pool.getString(0), strings[0])
+
+    def test_cache_evicts_least_recently_used(self):
+        strings = [u'string-{}'.format(i) for i in range(100)]
+        pool = StringBlock(bytecode.BuffHandle(create_string_pool(strings, utf8=True)), cache_size=10)
+        for i in range(1, 100):
+            # String 0 is used all along, it must stay cached
+            self.assertEqual(pool.getString(0), strings[0])
+            self.assertEqual(pool.getString(i), strings[i])
+        self.assertEqual(list(pool._cache), list(range(91, 99)) + [0, 99])
+
+    def test_resources(self):
+        arsc = bytecode.BuffHandle(APK('res/v1.apk').get_file('resources.arsc'))
+        # Skip the table header
+        arsc.read(12)
+        pool = StringBlock(arsc)
+        self.assertEqual(len(pool.m_stringOffsets), pool.stringCount)
+        self.assertIn(u'Selecciona una aplicaci\xf3', [pool.getString(i) for i in range(pool.stringCount)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+import unittest
+
+import requests
+from mock import MagicMock, patch
+
+from masonlib.internal.update import UpdateCheck, DISABLE_ENV
+
+
+class UpdateCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_file = './.test_mason_version_check'
+        self.update_check = UpdateCheck('1.0', self.cache_file)
+
+    def tearDown(self):
+        if os.path.isfile(self.cache_file):
+            os.remove(self.cache_file)
+
+    def _write_cache(self, checked_at, remote_version):
+        with open(self.cache_file, 'w') as outfile:
+            json.dump({'checked_at': checked_at, 'remote_version': remote_version}, outfile)
+
+    @patch('masonlib.internal.update.requests.get')
+    def test_fresh_cache_skips_request(self, mock_get):
+        self._write_cache(time.time(), '2.0')
+        self.update_check.start()
+
+        assert(not mock_get.called)
+        assert(str(self.update_check.newer_version()) == '2.0')
+
+    @patch('masonlib.internal.update.requests.get')
+    def test_stale_cache_checks_remote(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=200, text='1.5\n')
+        self._write_cache(time.time() - 2 * self.update_check.ttl, '2.0')
+        self.update_check.start()
+
+        assert(str(self.update_check.newer_version()) == '1.5')
+        mock_get.assert_called_once_with(self.update_check.url, timeout=self.update_check.timeout)
+        with open(self.cache_file) as data_file:
+            assert(json.load(data_file)['remote_version'] == '1.5')
+
+    @patch('masonlib.internal.update.requests.get')
+    def test_older_remote_version(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=200, text='0.9')
+        self.update_check.start()
+
+        assert(self.update_check.newer_version() is None)
+
+    @patch('masonlib.internal.update.requests.get')
+    def test_failed_check_is_cached(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError()
+        self.update_check.start()
+
+        assert(self.update_check.newer_version() is None)
+        with open(self.cache_file) as data_file:
+            assert(json.load(data_file)['remote_version'] is None)
+
+    def test_disabled_by_env(self):
+        stream = MagicMock()
+        stream.isatty.return_value = True
+        with patch.dict(os.environ, {DISABLE_ENV: '1'}):
+            assert(UpdateCheck.is_disabled(stream))
+
+    def test_disabled_without_tty(self):
+        stream = MagicMock()
+        stream.isatty.return_value = False
+        with patch.dict(os.environ, {}, clear=True):
+            assert(UpdateCheck.is_disabled(stream))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from masonlib.internal.upload import UploadBody
+
+
+class UploadBodyTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        self.content = os.urandom(3 * 4096 + 17)
+        with os.fdopen(fd, 'wb') as test_file:
+            test_file.write(self.content)
+        self.body = UploadBody(self.filename, progress=False, buffer_size=4096)
+
+    def tearDown(self):
+        self.body.close()
+        os.remove(self.filename)
+
+    def test_len(self):
+        assert(len(self.body) == len(self.content))
+
+    def test_read_honours_size(self):
+        assert(self.body.read(10) == self.content[:10])
+        assert(self.body.read(8192) == self.content[10:8202])
+        assert(self.body.read() == self.content[8202:])
+        assert(self.body.read(10) == b'')
+
+    def test_iter(self):
+        chunks = list(self.body)
+        assert(max(len(chunk) for chunk in chunks) == 4096)
+        assert(b''.join(chunks) == self.content)
+
+    def test_seek_and_tell(self):
+        self.body.read(100)
+        assert(self.body.tell() == 100)
+        self.body.seek(0)
+        assert(self.body.read() == self.content)
+
+    def test_progress(self):
+        body = UploadBody(self.filename, progress=True)
+        try:
+            body.read()
+            body.read(10)
+            assert(body.pbar.n == len(self.content))
+        finally:
+            body.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+from mock import patch
+
+from masonlib.internal.utils import capture_output, digest_file, hash_file, DIGEST_BUFFER_SIZE
+
+
+class UtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        self.content = os.urandom(DIGEST_BUFFER_SIZE * 2 + 123)
+        with os.fdopen(fd, 'wb') as test_file:
+            test_file.write(self.content)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_digest_file(self):
+        digests = digest_file(self.filename, ('md5', 'sha1', 'sha256'))
+        assert(digests.size == len(self.content))
+        assert(digests.digest('md5') == hashlib.md5(self.content).digest())
+        assert(digests.hexdigest('md5') == hashlib.md5(self.content).hexdigest())
+        assert(digests.hexdigest('sha1') == hashlib.sha1(self.content).hexdigest())
+        assert(digests.hexdigest('sha256') == hashlib.sha256(self.content).hexdigest())
+
+    def test_digest_file_single(self):
+        digests = digest_file(self.filename, ('sha1',))
+        assert(digests.hexdigest('sha1') == hashlib.sha1(self.content).hexdigest())
+
+    def test_hash_file(self):
+        assert(hash_file(self.filename, 'sha1', True) == hashlib.sha1(self.content).hexdigest())
+        assert(hash_file(self.filename, 'md5', False) == hashlib.md5(self.content).digest())
+
+    def test_capture_output(self):
+        stdout = StringIO()
+        outputs = [StringIO() for _ in range(4)]
+        started = threading.Event()
+
+        def work(index):
+            with capture_output(outputs[index]):
+                started.wait(5)
+                print 'thread {}'.format(index)
+
+        with patch('sys.stdout', stdout):
+            threads = [threading.Thread(target=work, args=(index,)) for index in range(len(outputs))]
+            for thread in threads:
+                thread.start()
+            print 'main thread'
+            started.set()
+            for thread in threads:
+                thread.join()
+            assert(sys.stdout is stdout)
+
+        assert(stdout.getvalue() == 'main thread\n')
+        assert([output.getvalue() for output in outputs] == ['thread {}\n'.format(index) for index in range(4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,10 +6,10 @@ version_file = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'VE
 setup(
     name='mason-cli',
     version=version_file.read().strip(),
-    py_modules=['mason', 'masonlib.imason', 'masonlib.platform', 'masonlib.internal.mason', 'masonlib.internal.persist', 'masonlib.internal.store',
-                'masonlib.internal.utils', 'masonlib.internal.artifacts', 'masonlib.internal.apk', 'masonlib.internal.media', 'masonlib.internal.os_config',
+    py_modules=['mason', 'masonlib.imason', 'masonlib.platform', 'masonlib.internal.mason', 'masonlib.internal.async_mason', 'masonlib.internal.persist', 'masonlib.internal.plan', 'masonlib.internal.scheduler', 'masonlib.internal.session', 'masonlib.internal.store',
+                'masonlib.internal.utils', 'masonlib.internal.update', 'masonlib.internal.upload', 'masonlib.internal.artifacts', 'masonlib.internal.batch', 'masonlib.internal.builds', 'masonlib.internal.journal', 'masonlib.internal.apk', 'masonlib.internal.apk_cache', 'masonlib.internal.ledger', 'masonlib.internal.media', 'masonlib.internal.metrics', 'masonlib.internal.multipart', 'masonlib.internal.os_config',
                 'masonlib.external.apk_parse', 'masonlib.external.apk_parse.apk', 'masonlib.external.apk_parse.bytecode', 'masonlib.external.apk_parse.androconf',
-                'masonlib.external.apk_parse.dvm_permissions', 'masonlib.external.apk_parse.util'],
+                'masonlib.external.apk_parse.dvm_permissions', 'masonlib.external.apk_parse.pkcs7', 'masonlib.external.apk_parse.util'],
     include_package_data=True,
     install_requires=[
         'click',